@@ -13,9 +13,10 @@ class ShopPhotoInline(admin.TabularInline):
     fields = ('photo', 'image_preview')
 
     def image_preview(self, obj):
-        # Check if the object exists and has a photo
-        if obj.photo:
-            return mark_safe(f'<img src="{obj.photo.url}" width="150" height="150" style="object-fit: cover; border-radius: 5px;" />')
+        # Check if the object exists and has a photo (the small thumbnail when there is one)
+        image = obj.thumbnail or obj.photo if obj else None
+        if image:
+            return mark_safe(f'<img src="{image.url}" width="150" height="150" style="object-fit: cover; border-radius: 5px;" />')
         return "No Image"
 
     image_preview.short_description = 'Image Preview'
@@ -34,6 +35,7 @@ class ShopPhotoAdmin(admin.ModelAdmin):
     readonly_fields = ('image_preview',)
 
     def image_preview(self, obj):
-        if obj.photo:
-            return mark_safe(f'<img src="{obj.photo.url}" width="100" style="border-radius: 5px;" />')
+        image = obj.thumbnail or obj.photo
+        if image:
+            return mark_safe(f'<img src="{image.url}" width="100" style="border-radius: 5px;" />')
         return ""
\ No newline at end of file
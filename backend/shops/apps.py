@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def sync_sqlite_search_index(sender, using, **kwargs):
+    """SQLite drops triggers when a migration remakes shops_shop; put the FTS5 triggers back."""
+    connection = connections[using]
+    if connection.vendor != "sqlite" or "shops_shop" not in connection.introspection.table_names():
+        return
+    from .search import install_sqlite_fts
+
+    with connection.cursor() as cursor:
+        install_sqlite_fts(cursor)
 
 
 class ShopsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shops'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
+
+        post_migrate.connect(sync_sqlite_search_index, sender=self)
@@ -0,0 +1,143 @@
+# shops/assets.py
+"""
+Garbage collection for stored photo files.
+
+Deleting a ShopPhoto (photos_to_delete_ids, or a shop delete cascading) only
+removes the row. A post_delete signal records the photo's stored names in
+PendingAssetDeletion inside the same transaction. The collect_photo_assets command
+then deletes them from SHOP_PHOTO_STORAGE in batches:
+
+- On Cloudinary, each batch is one Admin API call to read the sizes and one to
+  delete (up to 100 public ids each).
+- On any other backend, such as the local filesystem in tests, the files are
+  deleted one by one.
+"""
+import logging
+
+import cloudinary.api
+from django.conf import settings
+
+from .models import PendingAssetDeletion
+from .ratelimit import RateLimiter
+from .storage import DEFAULT_PHOTO_STORAGE, get_photo_storage
+
+logger = logging.getLogger(__name__)
+
+CLOUDINARY_BATCH_LIMIT = 100  # public ids per Admin API call
+MAX_ATTEMPTS = 5
+
+
+def record_deleted_photo(photo):
+    names = [field.name for field in (photo.photo, photo.thumbnail) if field.name]
+    if names:
+        PendingAssetDeletion.objects.bulk_create(
+            [PendingAssetDeletion(name=name) for name in names], ignore_conflicts=True
+        )
+
+
+class StorageAssetDeleter:
+    """Works with any Django storage: one size and delete call per file."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def sizes(self, names):
+        sizes = {}
+        for name in names:
+            try:
+                sizes[name] = self.storage.size(name) or 0
+            except OSError:
+                sizes[name] = 0  # already gone
+        return sizes
+
+    def delete(self, names):
+        """Deletes `names`; returns {name: error} for the ones that failed."""
+        errors = {}
+        for name in names:
+            try:
+                self.storage.delete(name)
+            except Exception as e:
+                errors[name] = e
+        return errors
+
+
+class CloudinaryAssetDeleter:
+    """Bulk Admin API calls: resources_by_ids for sizes, delete_resources to delete."""
+
+    resource_type = "image"
+
+    def sizes(self, names):
+        try:
+            response = cloudinary.api.resources_by_ids(list(names), resource_type=self.resource_type)
+        except Exception as e:
+            # Sizes only feed the reclaimed-bytes total; go ahead with the delete
+            logger.warning("Could not read photo asset sizes: %s", e)
+            return dict.fromkeys(names, 0)
+        sizes = {resource["public_id"]: resource.get("bytes", 0) for resource in response.get("resources", [])}
+        return {name: sizes.get(name, 0) for name in names}
+
+    def delete(self, names):
+        try:
+            response = cloudinary.api.delete_resources(list(names), resource_type=self.resource_type, invalidate=True)
+        except Exception as e:
+            return {name: e for name in names}
+        results = response.get("deleted", {})
+        # "not_found" is as good as deleted
+        return {
+            name: RuntimeError(results.get(name, "no result"))
+            for name in names
+            if results.get(name) not in ("deleted", "not_found")
+        }
+
+
+def get_asset_deleter():
+    backend = getattr(settings, "SHOP_PHOTO_STORAGE", DEFAULT_PHOTO_STORAGE)["BACKEND"]
+    if backend == DEFAULT_PHOTO_STORAGE["BACKEND"]:
+        return CloudinaryAssetDeleter()
+    return StorageAssetDeleter(get_photo_storage())
+
+
+def collect(batch_size=CLOUDINARY_BATCH_LIMIT, rate=1.0, dry_run=False, deleter=None):
+    """
+    Delete the recorded assets, at most `rate` batches per second.
+    Returns totals: assets deleted, bytes reclaimed, failures and batches.
+    Failed names stay queued until they have failed MAX_ATTEMPTS times.
+    """
+    deleter = deleter or get_asset_deleter()
+    batch_size = min(batch_size, CLOUDINARY_BATCH_LIMIT)
+    limiter = RateLimiter(rate)
+    totals = {"deleted": 0, "bytes": 0, "failed": 0, "batches": 0}
+    pending = PendingAssetDeletion.objects.filter(attempts__lt=MAX_ATTEMPTS).order_by("id")
+    last_id = 0
+
+    while True:
+        batch = list(pending.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        names = [entry.name for entry in batch]
+
+        limiter.acquire()
+        sizes = deleter.sizes(names)
+        totals["batches"] += 1
+        if dry_run:
+            totals["deleted"] += len(names)
+            totals["bytes"] += sum(sizes.values())
+            continue
+
+        limiter.acquire()
+        errors = deleter.delete(names)
+        done = [entry.id for entry in batch if entry.name not in errors]
+        PendingAssetDeletion.objects.filter(id__in=done).delete()
+        totals["deleted"] += len(done)
+        totals["bytes"] += sum(size for name, size in sizes.items() if name not in errors)
+
+        failed = [entry for entry in batch if entry.name in errors]
+        for entry in failed:
+            entry.attempts += 1
+            entry.last_error = str(errors[entry.name])
+            logger.warning("Could not delete photo asset %s: %s", entry.name, entry.last_error)
+        PendingAssetDeletion.objects.bulk_update(failed, ["attempts", "last_error"])
+        totals["failed"] += len(failed)
+
+    return totals
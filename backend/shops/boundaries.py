@@ -0,0 +1,142 @@
+# shops/boundaries.py
+"""
+Offline reverse geocoding against administrative boundary polygons.
+
+Boundaries come from a GeoJSON FeatureCollection of LGA features (Polygon or
+MultiPolygon, [lon, lat] coordinates) whose properties carry the state and LGA
+names. The file is loaded once per process into a uniform lat/lon grid: each
+cell lists the polygons whose bounding box touches it, so a lookup runs the
+point-in-polygon test on a handful of candidates instead of every LGA.
+"""
+import json
+import logging
+import math
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+GRID_CELL_DEG = 0.1  # ~11km cells; Nigeria's 774 LGAs average ~2-3 candidates per cell
+
+# Property names used by the common boundary datasets (our own export, OCHA COD-AB, GADM)
+STATE_PROPERTIES = ("state", "admin1Name_en", "admin1Name", "NAME_1")
+LGA_PROPERTIES = ("lga", "local_government_area", "admin2Name_en", "admin2Name", "NAME_2")
+
+
+def _first_property(properties, names):
+    for name in names:
+        value = properties.get(name)
+        if value:
+            return str(value).strip()
+    return None
+
+
+def _ring_contains(ring, x, y):
+    """Even-odd ray cast; `ring` is a sequence of (x, y) vertices."""
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+class _Polygon:
+    __slots__ = ("state", "lga", "rings", "bounds")
+
+    def __init__(self, state, lga, rings):
+        self.state = state
+        self.lga = lga
+        self.rings = rings  # outer ring first, then holes
+        xs = [x for x, _ in rings[0]]
+        ys = [y for _, y in rings[0]]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    def contains(self, x, y):
+        min_x, min_y, max_x, max_y = self.bounds
+        if not (min_x <= x <= max_x and min_y <= y <= max_y):
+            return False
+        if not _ring_contains(self.rings[0], x, y):
+            return False
+        return not any(_ring_contains(hole, x, y) for hole in self.rings[1:])
+
+
+class BoundaryIndex:
+    """In-memory grid index over state/LGA polygons."""
+
+    def __init__(self, polygons=(), cell_deg=GRID_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.polygons = list(polygons)
+        self._grid = {}
+        for polygon in self.polygons:
+            min_x, min_y, max_x, max_y = polygon.bounds
+            for cx in range(self._cell(min_x), self._cell(max_x) + 1):
+                for cy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self._grid.setdefault((cx, cy), []).append(polygon)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def _cell(self, value):
+        return math.floor(value / self.cell_deg)
+
+    @classmethod
+    def from_geojson(cls, data, cell_deg=GRID_CELL_DEG):
+        polygons = []
+        for feature in data.get("features", []):
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            state = _first_property(properties, STATE_PROPERTIES)
+            lga = _first_property(properties, LGA_PROPERTIES)
+            if geometry.get("type") == "Polygon":
+                parts = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                parts = geometry["coordinates"]
+            else:
+                continue
+            for part in parts:
+                rings = [tuple((float(x), float(y)) for x, y, *_ in ring) for ring in part if len(ring) >= 3]
+                if rings:
+                    polygons.append(_Polygon(state, lga, rings))
+        return cls(polygons, cell_deg=cell_deg)
+
+    @classmethod
+    def from_file(cls, path, cell_deg=GRID_CELL_DEG):
+        with open(path, encoding="utf-8") as fh:
+            return cls.from_geojson(json.load(fh), cell_deg=cell_deg)
+
+    def lookup(self, latitude, longitude):
+        """Return (state, lga) for the polygon containing the point, or None outside coverage."""
+        x, y = float(longitude), float(latitude)
+        for polygon in self._grid.get((self._cell(x), self._cell(y)), ()):
+            if polygon.contains(x, y):
+                return polygon.state, polygon.lga
+        return None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide index for settings.SHOPS_BOUNDARIES_PATH (empty if the file is unavailable)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = getattr(settings, "SHOPS_BOUNDARIES_PATH", None)
+                try:
+                    _index = BoundaryIndex.from_file(path) if path else BoundaryIndex()
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning("Boundary data at %s could not be loaded (%s); offline geocoding disabled", path, e)
+                    _index = BoundaryIndex()
+    return _index
+
+
+def reset_index():
+    """Drop the cached index so the next lookup reloads the boundary file."""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,133 @@
+# shops/bulk.py
+"""Set-based write paths used by the bulk endpoints."""
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, rollups
+from .clusters import invalidate_geohashes
+from .models import ActivityLog, Shop
+from .serializers import ShopSerializer
+from .tasks import enqueue_geocoding, prepare_geocoding
+
+MAX_BATCH_SIZE = 500
+
+
+def bulk_capture(items, user, context):
+    """
+    Validate each item with ShopSerializer and insert the valid ones in one transaction;
+    geocoding is queued for the background worker.
+    Returns a list of per-item results in input order:
+      {"index": i, "status": "created", "id": ...} or {"index": i, "status": "error", "errors": {...}}
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {"index": index, "status": "error", "errors": {"non_field_errors": ["Expected an object."]}}
+            continue
+        serializer = ShopSerializer(data=item, context=context)
+        if serializer.is_valid():
+            data = dict(serializer.validated_data)
+            # Photos cannot travel in a JSON batch; attach them with a PATCH afterwards
+            data.pop("uploaded_photos", None)
+            data.pop("photos_to_delete_ids", None)
+            valid.append((index, data))
+        else:
+            results[index] = {"index": index, "status": "error", "errors": serializer.errors}
+
+    shops = []
+    for _, data in valid:
+        shop = Shop(created_by=user, **data)
+        shop.sync_geohash()  # bulk_create bypasses save()
+        prepare_geocoding(shop)
+        shops.append(shop)
+
+    with transaction.atomic():
+        Shop.objects.bulk_create(shops, batch_size=MAX_BATCH_SIZE)
+        ActivityLog.objects.bulk_create([
+            ActivityLog(
+                actor=user,
+                action_type='CREATE',
+                shop=shop,
+                shop_name_snapshot=shop.name,
+                shop_id_snapshot=shop.id,
+                changes={"msg": "Shop created", "bulk": True},
+            )
+            for shop in shops
+        ], batch_size=MAX_BATCH_SIZE)
+        enqueue_geocoding(shops)
+        # bulk_create sends no post_save; update the dashboard counters and daily stats here
+        counters.record_changes([(None, counters.shop_key(shop)) for shop in shops])
+        rollups.record_changes([(None, rollups.snapshot(shop)) for shop in shops])
+        geohashes = {shop.geohash for shop in shops}
+        transaction.on_commit(lambda: invalidate_geohashes(geohashes))
+
+    for (index, _), shop in zip(valid, shops):
+        results[index] = {"index": index, "status": "created", "id": shop.id}
+    return results
+
+
+def review_updates(verification_status, rejection_reason=None):
+    """The field values a review sets; mirrors the admin rules in ShopViewSet.perform_update."""
+    updates = {"verification_status": verification_status}
+    if rejection_reason is not None:
+        updates["rejection_reason"] = rejection_reason
+    if verification_status == Shop.VerificationStatus.REJECTED:
+        updates["is_active"] = False
+    elif verification_status == Shop.VerificationStatus.VERIFIED:
+        updates["is_active"] = True
+        updates["rejection_reason"] = ""
+    return updates
+
+
+def bulk_review(ids, user, verification_status, rejection_reason=None):
+    """
+    Apply one review decision to many shops with a single UPDATE and a single log insert.
+    Returns (updated_ids, unchanged_ids, missing_ids).
+    """
+    updates = review_updates(verification_status, rejection_reason)
+    ids = list(dict.fromkeys(ids))
+
+    with transaction.atomic():
+        rows = list(
+            Shop.objects.select_for_update()
+            .filter(id__in=ids)
+            .values("id", "name", "geohash", *{*updates, *counters.COUNTED_FIELDS, *rollups.ROLLUP_FIELDS})
+        )
+
+        logs, changed = [], []
+        for row in rows:
+            changes = {
+                field: {"old": str(row[field]), "new": str(value)}
+                for field, value in updates.items()
+                if str(row[field]) != str(value)
+            }
+            if changes:
+                changed.append(row)
+                logs.append(ActivityLog(
+                    actor=user,
+                    action_type="UPDATE",
+                    shop_id=row["id"],
+                    shop_name_snapshot=row["name"],
+                    shop_id_snapshot=row["id"],
+                    changes=changes,
+                ))
+
+        if changed:
+            # update() skips auto_now; set date_updated so sync and ETags see the change
+            Shop.objects.filter(id__in=[row["id"] for row in changed]).update(
+                date_updated=timezone.now(), **updates
+            )
+            ActivityLog.objects.bulk_create(logs)
+            counters.record_changes([
+                (counters.shop_key(row), counters.shop_key({**row, **updates})) for row in changed
+            ])
+            rollups.record_changes([(rollups.snapshot(row), rollups.snapshot({**row, **updates})) for row in changed])
+            geohashes = {row["geohash"] for row in changed}
+            transaction.on_commit(lambda: invalidate_geohashes(geohashes))
+
+    found = {row["id"] for row in rows}
+    updated_ids = [row["id"] for row in changed]
+    unchanged_ids = sorted(found - set(updated_ids))
+    missing_ids = [shop_id for shop_id in ids if shop_id not in found]
+    return updated_ids, unchanged_ids, missing_ids
@@ -0,0 +1,116 @@
+# shops/clusters.py
+"""
+Server-side map clustering.
+
+Shops are grouped into geohash cells whose size follows the map zoom. Cells are computed
+per tile (a coarser geohash cell, two levels up), cached per (zoom, tile), and a tile's
+entries are dropped whenever a shop inside it is created, moved, updated or deleted.
+
+Invalidation only reaches other worker processes through a shared cache (Redis, see
+REDIS_URL). With a process-local cache, entries expire after LOCAL_CACHE_TTL instead.
+"""
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Avg, Count, FloatField, Q
+from django.db.models.functions import Cast, Substr
+
+from .geo import cover_count, covering_cells, decode_geohash_bounds, geohash_prefix_q
+from .models import Shop
+
+MIN_ZOOM, MAX_ZOOM = 0, 20
+# Geohash precision of a cluster cell at each zoom (~1/4 of a 256px map tile wide)
+ZOOM_PRECISION = (1, 1, 2, 2, 3, 3, 3, 4, 4, 5, 5, 5, 6, 6, 7, 7, 7, 8, 8, 8, 8)
+TILE_LEVELS_UP = 2
+MAX_TILES = 64
+CACHE_TTL = 60 * 60 * 24  # entries are invalidated on writes; the TTL is only a backstop
+LOCAL_CACHE_TTL = 30  # other processes' writes cannot invalidate a process-local cache
+CACHE_PREFIX = "shop-clusters"
+
+
+class BBoxTooLarge(ValueError):
+    pass
+
+
+def cluster_precision(zoom):
+    return ZOOM_PRECISION[zoom]
+
+
+def tile_precision(zoom):
+    return max(cluster_precision(zoom) - TILE_LEVELS_UP, 1)
+
+
+def cache_key(zoom, tile):
+    return f"{CACHE_PREFIX}:{zoom}:{tile}"
+
+
+def cache_ttl():
+    return LOCAL_CACHE_TTL if isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache) else CACHE_TTL
+
+
+def _compute_tile(zoom, tile):
+    precision = cluster_precision(zoom)
+    rows = (
+        Shop.objects.filter(geohash_prefix_q([tile]))
+        .annotate(cell=Substr("geohash", 1, precision))
+        .values("cell")
+        .annotate(
+            count=Count("id"),
+            latitude=Avg(Cast("latitude", FloatField())),
+            longitude=Avg(Cast("longitude", FloatField())),
+            **{
+                status.lower(): Count("id", filter=Q(verification_status=status))
+                for status in Shop.VerificationStatus.values
+            },
+        )
+        .order_by("cell")
+    )
+    return [
+        {
+            "cell": row["cell"],
+            "count": row["count"],
+            "latitude": round(row["latitude"], 6),
+            "longitude": round(row["longitude"], 6),
+            "status": {status: row[status.lower()] for status in Shop.VerificationStatus.values},
+        }
+        for row in rows
+    ]
+
+
+def clusters_for_bbox(south, west, north, east, zoom):
+    """Cluster cells intersecting the box at `zoom`, served from the per-tile cache."""
+    precision = tile_precision(zoom)
+    if cover_count(south, west, north, east, precision) > MAX_TILES:
+        raise BBoxTooLarge("bbox is too large for this zoom level.")
+    tiles = covering_cells(south, west, north, east, precision=precision)
+
+    keys = {cache_key(zoom, tile): tile for tile in tiles}
+    cached = cache.get_many(keys.keys())
+    missing = {}
+    for key, tile in keys.items():
+        if key not in cached:
+            missing[key] = _compute_tile(zoom, tile)
+    if missing:
+        cache.set_many(missing, timeout=cache_ttl())
+    cached.update(missing)
+
+    clusters = []
+    for tile_clusters in cached.values():
+        for cluster in tile_clusters:
+            cell_south, cell_west, cell_north, cell_east = decode_geohash_bounds(cluster["cell"])
+            if cell_north < south or cell_south > north:
+                continue
+            if west <= east and (cell_east < west or cell_west > east):
+                continue
+            clusters.append(cluster)
+    return clusters
+
+
+def invalidate_geohashes(geohashes):
+    """Drop every cached tile, at every zoom, that contains one of `geohashes`."""
+    keys = {
+        cache_key(zoom, geohash[:tile_precision(zoom)])
+        for geohash in geohashes if geohash
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 1)
+    }
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,47 @@
+# shops/conditional.py
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def queryset_version(queryset):
+    """
+    A cheap fingerprint of a set of shops: (row count, latest date_updated).
+    Creates and edits move the max, deletes change the count.
+    """
+    stats = queryset.order_by().aggregate(count=Count('id'), last_modified=Max('date_updated'))
+    return stats['count'], stats['last_modified']
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for read endpoints.
+    The validators come from a cheap version fingerprint rather than from the rendered
+    payload, so an unchanged resource is answered with 304 before the main query or
+    the serializer ever runs.
+    """
+
+    def respond_conditionally(self, request, build_response, version, last_modified=None):
+        seed = f"{request.user.pk}:{request.get_full_path()}:{version}"
+        etag = quote_etag(hashlib.md5(seed.encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = build_response()
+
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        # Responses are per user; make clients revalidate instead of reusing blindly
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def respond_for_queryset(self, request, queryset, build_response):
+        # ETag only: Max(date_updated) stays put when a shop is deleted, so as
+        # Last-Modified it would answer If-Modified-Since with a false 304
+        return self.respond_conditionally(request, build_response, queryset_version(queryset))
+
@@ -0,0 +1,186 @@
+# shops/counters.py
+"""
+Rollup counters for the admin dashboard.
+
+Every shop contributes +1 to a handful of named counters, based on its status,
+active flag, creating agent and capture day (see `counter_names`). The write paths
+apply the difference between a shop's old and new contribution in the same
+transaction as the write itself:
+
+- Shop post_save and post_delete signals cover single-shop writes.
+- bulk_capture and bulk_review call `record_changes` themselves.
+- User signals keep the agent count (AGENTS) current, and move a deleted
+  user's shops out of the per-agent counters.
+
+Each counter is split into up to SHARDS rows and every thread writes to its own
+shard, so concurrent shop writes do not all queue on the lock of the "shops" row.
+The dashboard then reads a fixed set of counters by name (summing their shards over
+the unique index) instead of aggregating over shops_shop. The reconcile_shop_counters
+command rebuilds the counters from the shops table and repairs any drift, for
+example from raw SQL or from writes that bypass these paths.
+"""
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from accounts.models import User
+
+from .models import Shop, ShopCounter
+
+# Shop fields that decide which counters a shop contributes to
+COUNTED_FIELDS = ("created_by_id", "verification_status", "is_active", "date_created")
+COUNTED_MODEL_FIELDS = {"created_by", "verification_status", "is_active", "date_created"}  # as in update_fields
+
+AGENTS = "users:agents"
+SHARDS = 16
+
+
+def agent_delta(old_role, new_role):
+    """Change to the AGENTS counter when a user's role goes from old_role to new_role (None: no user)."""
+    return (new_role == User.Role.AGENT) - (old_role == User.Role.AGENT)
+
+
+def counter_names(created_by_id, verification_status, is_active, day):
+    names = ["shops", f"shops:{verification_status}", f"shops:day:{day}"]
+    if is_active:
+        names.append("shops:active")
+    if created_by_id is not None:
+        agent = f"agent:{created_by_id}"
+        names += ["shops:by_agents", f"{agent}:shops", f"{agent}:{verification_status}", f"{agent}:day:{day}"]
+    return names
+
+
+def _day(value):
+    return timezone.localdate(value).isoformat() if timezone.is_aware(value) else value.date().isoformat()
+
+
+def shop_key(values):
+    """The counted state of a shop, from an instance or a values() row; None when a field is missing."""
+    if not isinstance(values, dict):
+        values = values.__dict__
+    if any(field not in values for field in COUNTED_FIELDS):
+        return None
+    created_by_id, verification_status, is_active, date_created = (values[field] for field in COUNTED_FIELDS)
+    return created_by_id, verification_status, is_active, _day(date_created)
+
+
+def loaded_shop_key(shop):
+    """The counted state `shop` had when it was loaded from the database."""
+    return shop_key(getattr(shop, "_loaded_values", {}))
+
+
+def record_changes(changes):
+    """
+    Apply [(old_key, new_key), ...] where either side may be None (created / deleted).
+    One statement, in the caller's transaction.
+    """
+    deltas = Counter()
+    for old, new in changes:
+        if old == new:
+            continue
+        if old is not None:
+            deltas.subtract(counter_names(*old))
+        if new is not None:
+            deltas.update(counter_names(*new))
+    add(deltas)
+
+
+def _shard():
+    # Fixed per thread, so a transaction never holds rows of two shards of a counter
+    return hash((os.getpid(), threading.get_ident())) % SHARDS
+
+
+def add(deltas):
+    """Increment counters by name (creating them as needed) in this thread's shard with a single upsert."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = connection.ops.quote_name(ShopCounter._meta.db_table)
+    now, shard = timezone.now(), _shard()
+    rows = ", ".join(["(%s, %s, %s, %s)"] * len(deltas))
+    params = [value for name in sorted(deltas) for value in (name, shard, deltas[name], now)]
+    with connection.cursor() as cursor:
+        # Plain ON CONFLICT upsert (PostgreSQL and SQLite): concurrent writers never race on insert
+        cursor.execute(
+            f"INSERT INTO {table} (name, shard, value, date_updated) VALUES {rows} "
+            f"ON CONFLICT (name, shard) DO UPDATE SET value = {table}.value + excluded.value, "
+            f"date_updated = excluded.date_updated",
+            params,
+        )
+
+
+def read(names):
+    """({name: value} for `names`, latest date_updated among them); missing counters read as 0."""
+    rows = (
+        ShopCounter.objects.filter(name__in=names).order_by()
+        .values("name").annotate(total=Sum("value"), last_modified=Max("date_updated"))
+        .values_list("name", "total", "last_modified")
+    )
+    values = dict.fromkeys(names, 0)
+    last_modified = None
+    for name, value, date_updated in rows:
+        values[name] = value
+        last_modified = max(last_modified, date_updated) if last_modified else date_updated
+    return values, last_modified
+
+
+def _grouped(shops):
+    """(key, count) per distinct counted state in `shops`, from one grouped query."""
+    groups = (
+        shops.order_by()
+        .values("created_by_id", "verification_status", "is_active", day=TruncDate("date_created"))
+        .annotate(count=Count("id"))
+    )
+    for group in groups:
+        key = (group["created_by_id"], group["verification_status"], group["is_active"], group["day"].isoformat())
+        yield key, group["count"]
+
+
+def compute():
+    """The true counter values, from one grouped scan of the shops table."""
+    totals = Counter()
+    for key, count in _grouped(Shop.objects.all()):
+        for name in counter_names(*key):
+            totals[name] += count
+    totals[AGENTS] = User.objects.filter(role=User.Role.AGENT).count()
+    return totals
+
+
+def record_creator_removed(user_id):
+    """
+    Call before deleting a user: Shop.created_by is SET_NULL, which the delete
+    collector does with a plain UPDATE (no Shop signals), so move the counts here.
+    """
+    deltas = Counter()
+    for key, count in _grouped(Shop.objects.filter(created_by_id=user_id)):
+        for name in counter_names(*key):
+            deltas[name] -= count
+        for name in counter_names(None, *key[1:]):
+            deltas[name] += count
+    add(deltas)
+
+
+@transaction.atomic
+def reconcile(dry_run=False):
+    """
+    Compare the stored counters with `compute()` and fix them (unless dry_run).
+    Returns {name: (stored, actual)} for every counter that had drifted.
+    """
+    stored = defaultdict(int)
+    for name, value in ShopCounter.objects.select_for_update().values_list("name", "value"):
+        stored[name] += value
+    actual = compute()
+    drift = {
+        name: (stored.get(name, 0), actual.get(name, 0))
+        for name in stored.keys() | actual.keys()
+        if stored.get(name, 0) != actual.get(name, 0)
+    }
+    if drift and not dry_run:
+        add({name: new - old for name, (old, new) in drift.items()})
+        ShopCounter.objects.filter(value=0).delete()
+    return drift
@@ -0,0 +1,124 @@
+# shops/duplicates.py
+"""
+Near-duplicate shop photos, found by Hamming distance between 64-bit dHashes.
+
+Multi-index search: every hash is stored as four indexed 16-bit chunks
+(ShopPhoto.phash_0..phash_3). If two hashes differ in at most `d` bits, then by
+pigeonhole at least one chunk differs in at most `d // 4` bits. So candidates are
+the photos whose chunk equals one of the few values within that radius of ours,
+which is an index lookup per chunk however many photos exist. Each probed value
+returns at most MAX_CANDIDATES_PER_PROBE rows, and the candidates are then
+checked against the full hash of the photos that probed for them.
+"""
+from itertools import combinations
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import ShopPhoto
+
+DEFAULT_MAX_DISTANCE = 6
+MAX_MATCHES_PER_PHOTO = 10
+MAX_CANDIDATES_PER_PROBE = 50
+CHUNK_BITS = 16
+
+
+def max_distance():
+    return getattr(settings, "SHOP_PHOTO_DUPLICATE_DISTANCE", DEFAULT_MAX_DISTANCE)
+
+
+def hamming(a, b):
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+
+def _neighbours(value, radius):
+    """All 16-bit values within `radius` bits of `value`."""
+    values = {value}
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), flips):
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            values.add(value ^ mask)
+    return values
+
+
+def _candidates(field, values):
+    """
+    Photos whose `field` chunk is one of `values`, at most MAX_CANDIDATES_PER_PROBE
+    (newest first) per value: common chunks, such as those of low-detail images
+    that hash near 0, cannot flood a lookup.
+    """
+    rank = Window(RowNumber(), partition_by=[F(field)], order_by=F("id").desc())
+    return (
+        ShopPhoto.objects.filter(**{f"{field}__in": sorted(values)})
+        .annotate(rank=rank)
+        .filter(rank__lte=MAX_CANDIDATES_PER_PROBE)
+        .values("id", "shop_id", "shop__name", "phash", field)
+    )
+
+
+def find_duplicates(photos, distance=None):
+    """
+    {photo.id: [match, ...]} for the hashed `photos`, where a match is a photo of
+    another shop within `distance` bits (SHOP_PHOTO_DUPLICATE_DISTANCE by default),
+    closest first. One query per chunk for the whole batch.
+    """
+    distance = max_distance() if distance is None else distance
+    hashed = [photo for photo in photos if photo.phash is not None]
+    if not hashed:
+        return {}
+
+    radius = distance // len(ShopPhoto.PHASH_CHUNK_FIELDS)
+    probes = {photo.id: {} for photo in hashed}
+    for photo in hashed:
+        for field in ShopPhoto.PHASH_CHUNK_FIELDS:
+            probes[photo.id][field] = _neighbours(getattr(photo, field), radius)
+
+    # Candidates indexed by the probe that found them, so each photo is only
+    # compared with rows that matched one of its own probes
+    by_probe = {}
+    for field in ShopPhoto.PHASH_CHUNK_FIELDS:
+        values = set().union(*(photo_probes[field] for photo_probes in probes.values()))
+        for candidate in _candidates(field, values):
+            by_probe.setdefault((field, candidate[field]), []).append(candidate)
+
+    duplicates = {}
+    for photo in hashed:
+        seen, matches = set(), []
+        for field, values in probes[photo.id].items():
+            for value in values:
+                for candidate in by_probe.get((field, value), ()):
+                    if candidate["id"] in seen or candidate["shop_id"] == photo.shop_id:
+                        continue
+                    seen.add(candidate["id"])
+                    bits = hamming(photo.phash, candidate["phash"])
+                    if bits <= distance:
+                        matches.append({
+                            "photo_id": candidate["id"],
+                            "shop_id": candidate["shop_id"],
+                            "shop_name": candidate["shop__name"],
+                            "distance": bits,
+                        })
+        if matches:
+            matches.sort(key=lambda match: (match["distance"], match["photo_id"]))
+            duplicates[photo.id] = matches[:MAX_MATCHES_PER_PHOTO]
+    return duplicates
+
+
+def duplicates_for_shops(shops, distance=None):
+    """{shop.id: [{"photo_id", "duplicate_photo_id", "shop_id", "shop_name", "distance"}, ...]}."""
+    photos = [photo for shop in shops for photo in shop.photos.all()]
+    matches = find_duplicates(photos, distance)
+    result = {}
+    for photo in photos:
+        for match in matches.get(photo.id, ()):
+            result.setdefault(photo.shop_id, []).append({
+                "photo_id": photo.id,
+                "duplicate_photo_id": match["photo_id"],
+                "shop_id": match["shop_id"],
+                "shop_name": match["shop_name"],
+                "distance": match["distance"],
+            })
+    return result
@@ -0,0 +1,185 @@
+# shops/geo.py
+"""
+Geohash helpers for spatial lookups on plain lat/lon columns.
+
+Shops store a geohash (see Shop.save), indexed as an ordinary B-tree column. A viewport
+or radius query is answered by:
+  1. covering the area with a handful of geohash cells,
+  2. turning each cell into an index range scan (`geohash >= cell AND geohash < cell + "{"`),
+  3. filtering the survivors exactly (lat/lon bounds, or haversine distance).
+"""
+import math
+
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells
+EARTH_RADIUS_M = 6371008.8
+MAX_COVER_CELLS = 24
+MAX_RADIUS_M = 50000
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string of `precision` characters."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    latitude, longitude = float(latitude), float(longitude)
+    chars = []
+    bits, value, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if longitude >= mid:
+                value = (value << 1) | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def decode_geohash_bounds(geohash):
+    """Return (south, west, north, east) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell at `precision`."""
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def cover_count(south, west, north, east, precision):
+    """How many cells of `precision` it takes to cover the box."""
+    height, width = cell_size(precision)
+    if west > east:
+        east += 360.0
+    rows = math.floor(north / height) - math.floor(south / height) + 1
+    cols = math.floor(east / width) - math.floor(west / width) + 1
+    return rows * cols
+
+
+def covering_cells(south, west, north, east, max_cells=MAX_COVER_CELLS, precision=None):
+    """
+    The smallest set of equal-precision geohash cells that covers the box, using the
+    finest precision that needs at most `max_cells` cells (or exactly `precision`).
+    """
+    if west > east:  # crosses the antimeridian
+        return covering_cells(south, west, north, 180.0, max_cells, precision) + covering_cells(
+            south, -180.0, north, east, max_cells, precision
+        )
+    if precision is None:
+        precision = GEOHASH_PRECISION
+        while precision > 1 and cover_count(south, west, north, east, precision) > max_cells:
+            precision -= 1
+
+    height, width = cell_size(precision)
+    cells = set()
+    lat = south
+    while True:
+        lon = west
+        while True:
+            cells.add(encode_geohash(min(lat, 89.999999), min(lon, 179.999999), precision))
+            if lon >= east:
+                break
+            lon = min(lon + width, east)
+        if lat >= north:
+            break
+        lat = min(lat + height, north)
+    return sorted(cells)
+
+
+def geohash_prefix_q(cells, field="geohash"):
+    """OR of index range scans, one per cell (prefix match without LIKE)."""
+    condition = Q()
+    for cell in cells:
+        condition |= Q(**{f"{field}__gte": cell, f"{field}__lt": cell + "{"})  # "{" sorts after "z"
+    return condition
+
+
+def bbox_around(latitude, longitude, radius_m):
+    """(south, west, north, east) of a box enclosing the circle."""
+    lat_delta = math.degrees(radius_m / EARTH_RADIUS_M)
+    lon_delta = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(latitude)), 1e-6)))
+    return (
+        max(latitude - lat_delta, -90.0),
+        ((longitude - lon_delta + 180.0) % 360.0) - 180.0,
+        min(latitude + lat_delta, 90.0),
+        ((longitude + lon_delta + 180.0) % 360.0) - 180.0,
+    )
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def haversine_expression(latitude, longitude, lat_field="latitude", lon_field="longitude"):
+    """The haversine distance (metres) from a point to each row, as an ORM expression."""
+    lat1 = Radians(Value(float(latitude)))
+    lon1 = Radians(Value(float(longitude)))
+    lat2 = Radians(Cast(lat_field, FloatField()))
+    lon2 = Radians(Cast(lon_field, FloatField()))
+    a = (
+        Power(Sin((lat2 - lat1) / 2), 2)
+        + Cos(lat1) * Cos(lat2) * Power(Sin((lon2 - lon1) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_M) * ASin(Sqrt(a))
+
+
+# --- Query param parsing (raise ValueError on bad input) ---
+
+def parse_bbox(value):
+    """Parse "west,south,east,north" (Leaflet's toBBoxString order)."""
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be 'west,south,east,north'.")
+    west, south, east, north = parts
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox is out of range.")
+    return south, west, north, east
+
+
+def parse_point(value):
+    """Parse "lat,lon"."""
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 2:
+        raise ValueError("near must be 'lat,lon'.")
+    latitude, longitude = parts
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("near is out of range.")
+    return latitude, longitude
@@ -0,0 +1,183 @@
+# shops/geocache.py
+"""
+Two-level store for reverse-geocoding results.
+
+- An in-process LRU answers repeat lookups without touching the database.
+- The GeocodeCacheEntry table is shared by every worker and survives deploys,
+  so a paid API call is made once per location for the whole fleet.
+
+Coordinates are bucketed into grid cells (SHOPS_GEOCODE_CELL_PRECISION decimal
+places), so neighbouring shops share an entry. Negative results (no match,
+upstream errors) are stored with a short TTL so failures are not retried on
+every request. `SingleFlight` lets concurrent misses for one cell share a
+single upstream call. Hit/miss counters are per process; read them with `stats()`.
+"""
+import threading
+from collections import Counter, OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .models import GeocodeCacheEntry
+
+DEFAULT_LRU_SIZE = 10000
+DEFAULT_CELL_PRECISION = 4  # decimal places; ~11m at the equator
+DEFAULT_NEGATIVE_TTL = 300  # seconds
+
+
+def cell_key(latitude, longitude, precision=None):
+    """Cache key of the grid cell holding a coordinate, e.g. "6.6012,3.3510" at precision 4."""
+    if precision is None:
+        precision = getattr(settings, "SHOPS_GEOCODE_CELL_PRECISION", DEFAULT_CELL_PRECISION)
+    quantum = Decimal(1).scaleb(-precision)
+    lat = Decimal(str(latitude)).quantize(quantum)
+    lon = Decimal(str(longitude)).quantize(quantum)
+    return f"{lat},{lon}"
+
+
+class LRUCache:
+    """A small thread-safe LRU mapping."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_lru = LRUCache(getattr(settings, "SHOPS_GEOCODE_LRU_SIZE", DEFAULT_LRU_SIZE))
+_counters = Counter()
+
+
+def _is_live(expires_at):
+    return expires_at is None or expires_at > timezone.now()
+
+
+def get(latitude, longitude, negative=True):
+    """
+    Cached result for the coordinate's cell, or None on a miss (or an expired negative entry).
+    With negative=False, negative entries count as misses too (for retries that must ask upstream).
+    """
+    key = cell_key(latitude, longitude)
+    cached = _lru.get(key)
+    if cached is not None and _is_live(cached[1]) and (negative or cached[1] is None):
+        _counters["lru_hits"] += 1
+        return cached[0]
+
+    entry = (
+        GeocodeCacheEntry.objects.filter(cell=key)
+        .only("state", "local_government_area", "expires_at")
+        .first()
+    )
+    if entry is None or not _is_live(entry.expires_at) or not (negative or entry.expires_at is None):
+        _counters["misses"] += 1
+        return None
+
+    _counters["db_hits"] += 1
+    result = {"state": entry.state, "local_government_area": entry.local_government_area}
+    _lru.set(key, (result, entry.expires_at))
+    return result
+
+
+def put(latitude, longitude, result, ttl=None):
+    """
+    Store a lookup in both levels. Pass `ttl` (seconds) for negative results;
+    without it the entry is permanent.
+    """
+    key = cell_key(latitude, longitude)
+    values = {
+        "state": result.get("state"),
+        "local_government_area": result.get("local_government_area"),
+        "expires_at": timezone.now() + timedelta(seconds=ttl) if ttl is not None else None,
+    }
+    try:
+        GeocodeCacheEntry.objects.update_or_create(cell=key, defaults=values)
+    except IntegrityError:
+        # Another worker inserted the same cell between our SELECT and INSERT
+        GeocodeCacheEntry.objects.filter(cell=key).update(**values)
+    cached = {"state": values["state"], "local_government_area": values["local_government_area"]}
+    _lru.set(key, (cached, values["expires_at"]))
+    _counters["negative_writes" if ttl is not None else "writes"] += 1
+
+
+def negative_ttl():
+    return getattr(settings, "SHOPS_GEOCODE_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a process: the first
+    caller runs the function, later callers block until it finishes and share
+    its result (or its exception).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            _counters["coalesced"] += 1
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def stats():
+    """Process-local counters: lru_hits, db_hits, misses, writes, negative_writes, coalesced (and lru_size)."""
+    names = ("lru_hits", "db_hits", "misses", "writes", "negative_writes", "coalesced")
+    return {**{name: _counters[name] for name in names}, "lru_size": len(_lru)}
+
+
+def clear_local():
+    """Drop the in-process LRU and counters (the shared table is untouched)."""
+    _lru.clear()
+    _counters.clear()
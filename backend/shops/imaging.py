@@ -0,0 +1,83 @@
+# shops/imaging.py
+"""
+Pillow helpers for shop photos: downscale, re-encode without metadata, thumbnail.
+
+Phone photos arrive at full sensor resolution with EXIF (GPS, device) attached.
+Before upload they are rotated upright, shrunk to SHOP_PHOTO_MAX_DIMENSION on the
+long side and re-encoded, which drops all metadata; a SHOP_PHOTO_THUMB_DIMENSION
+variant is produced for lists and previews, along with a perceptual hash used to
+spot the same storefront photo reused across shops (shops.duplicates).
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+DEFAULT_MAX_DIMENSION = 1600
+DEFAULT_THUMB_DIMENSION = 320
+JPEG_QUALITY = 82
+THUMB_JPEG_QUALITY = 75
+
+
+def _fit(image, max_dimension):
+    """Downscale in place so the long side is at most `max_dimension` (never upscales)."""
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    return image
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def dhash(image, size=8):
+    """
+    64-bit difference hash: each bit says whether a pixel of the (size+1) x size
+    grayscale thumbnail is darker than its right neighbour. Robust to resizing and
+    re-encoding; similar images differ in only a few bits.
+    """
+    pixels = image.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS).tobytes()
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return bits
+
+
+def process_photo(fh, name):
+    """
+    Returns (full, thumb, dhash) for an uploaded JPEG/PNG: two ContentFiles without
+    EXIF or other metadata (named after the original stem, with the output
+    extension) and the photo's 64-bit difference hash.
+    """
+    max_dimension = getattr(settings, "SHOP_PHOTO_MAX_DIMENSION", DEFAULT_MAX_DIMENSION)
+    thumb_dimension = getattr(settings, "SHOP_PHOTO_THUMB_DIMENSION", DEFAULT_THUMB_DIMENSION)
+
+    with Image.open(fh) as source:
+        fmt = "PNG" if source.format == "PNG" else "JPEG"
+        # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding: much less memory and CPU
+        source.draft("RGB", (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(source)  # apply the orientation tag before dropping it
+        image.load()
+
+    full = _fit(image, max_dimension)
+    full_bytes = _encode(full, fmt, JPEG_QUALITY)
+    thumb_bytes = _encode(_fit(full.copy(), thumb_dimension), fmt, THUMB_JPEG_QUALITY)
+
+    stem = os.path.splitext(os.path.basename(name))[0] or "photo"
+    extension = ".png" if fmt == "PNG" else ".jpg"
+    return (
+        ContentFile(full_bytes, name=f"{stem}{extension}"),
+        ContentFile(thumb_bytes, name=f"{stem}_thumb{extension}"),
+        dhash(full),
+    )
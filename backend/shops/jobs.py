@@ -0,0 +1,170 @@
+# shops/jobs.py
+"""
+A small DB-backed job queue (no external broker).
+
+- `enqueue()` / `enqueue_many()` insert BackgroundJob rows inside the caller's transaction.
+- Handlers are registered per job kind and receive a *batch* of claimed jobs.
+- Jobs run either in-process (a daemon thread started with the server and woken
+  after commit, when settings.SHOPS_INLINE_JOB_WORKER is on) or via
+  `python manage.py run_jobs`. The thread also wakes by itself when the next
+  retry is due, and at least every INLINE_POLL_INTERVAL.
+- Failures are retried with exponential backoff up to MAX_ATTEMPTS.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = timedelta(seconds=30)
+LOCK_TIMEOUT = timedelta(minutes=10)  # a RUNNING job older than this is assumed orphaned
+INLINE_POLL_INTERVAL = 60  # seconds; also picks up orphaned jobs and other processes' enqueues
+
+# kind -> (handler, batch_size); handler(jobs) returns {job_id: error message} for failures
+_handlers = {}
+
+
+def register(kind, batch_size=50):
+    def decorator(handler):
+        _handlers[kind] = (handler, batch_size)
+        return handler
+    return decorator
+
+
+def enqueue(kind, payload):
+    return enqueue_many(kind, [payload])[0]
+
+
+def enqueue_many(kind, payloads):
+    jobs = BackgroundJob.objects.bulk_create([BackgroundJob(kind=kind, payload=payload) for payload in payloads])
+    if getattr(settings, "SHOPS_INLINE_JOB_WORKER", False):
+        transaction.on_commit(_inline_worker.wake)
+    return jobs
+
+
+def claim(kind, limit):
+    """Lock and mark up to `limit` runnable jobs of `kind` as RUNNING."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            BackgroundJob.objects.select_for_update(skip_locked=True)
+            .filter(kind=kind)
+            .filter(
+                Q(status=BackgroundJob.Status.PENDING, run_after__lte=now)
+                | Q(status=BackgroundJob.Status.RUNNING, locked_at__lt=now - LOCK_TIMEOUT)
+            )
+            .order_by("id")[:limit]
+        )
+        for job in jobs:
+            job.status = BackgroundJob.Status.RUNNING
+            job.locked_at = now
+            job.attempts += 1
+        BackgroundJob.objects.bulk_update(jobs, ["status", "locked_at", "attempts"])
+    return jobs
+
+
+def run_batch(kind):
+    """Claim and run one batch of `kind`. Returns the number of jobs processed."""
+    handler, batch_size = _handlers[kind]
+    jobs = claim(kind, batch_size)
+    if not jobs:
+        return 0
+
+    try:
+        errors = handler(jobs) or {}
+    except Exception as e:
+        logger.exception("Job batch %s failed", kind)
+        errors = {job.id: repr(e) for job in jobs}
+
+    now = timezone.now()
+    for job in jobs:
+        error = errors.get(job.id)
+        job.locked_at = None
+        if error is None:
+            job.status = BackgroundJob.Status.DONE
+            job.last_error = ""
+        elif job.attempts >= MAX_ATTEMPTS:
+            job.status = BackgroundJob.Status.FAILED
+            job.last_error = error
+        else:
+            job.status = BackgroundJob.Status.PENDING
+            job.last_error = error
+            job.run_after = now + RETRY_BASE_DELAY * (2 ** (job.attempts - 1))
+    BackgroundJob.objects.bulk_update(jobs, ["status", "locked_at", "last_error", "run_after"])
+    return len(jobs)
+
+
+def run_pending(kinds=None):
+    """Drain every runnable job (of `kinds`, default all). Returns the number processed."""
+    total = 0
+    for kind in kinds or list(_handlers):
+        while True:
+            processed = run_batch(kind)
+            total += processed
+            if not processed:
+                break
+    return total
+
+
+def seconds_until_next_job():
+    """Seconds until the earliest PENDING job may run (0 if one is due), capped at INLINE_POLL_INTERVAL."""
+    run_after = (
+        BackgroundJob.objects.filter(status=BackgroundJob.Status.PENDING)
+        .order_by("run_after").values_list("run_after", flat=True).first()
+    )
+    if run_after is None:
+        return INLINE_POLL_INTERVAL
+    return min(max((run_after - timezone.now()).total_seconds(), 0), INLINE_POLL_INTERVAL)
+
+
+class _InlineWorker:
+    """
+    One daemon thread per process that drains the queue whenever it is woken, and
+    otherwise sleeps only until the next job is due (retries, jobs left by a restart).
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="shops-job-worker", daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            close_old_connections()
+            try:
+                run_pending()
+                timeout = seconds_until_next_job()
+            except Exception:
+                logger.exception("Inline job worker crashed; jobs stay queued for the next wake-up")
+                timeout = INLINE_POLL_INTERVAL
+            finally:
+                close_old_connections()
+            self._event.wait(timeout)
+            self._event.clear()
+
+
+_inline_worker = _InlineWorker()
+
+
+def start_inline_worker():
+    """Start the in-process worker (if enabled); call once when the server process starts."""
+    if getattr(settings, "SHOPS_INLINE_JOB_WORKER", False):
+        _inline_worker.start()
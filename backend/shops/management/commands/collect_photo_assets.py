@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from shops import assets
+
+
+class Command(BaseCommand):
+    help = "Deletes stored photo files whose ShopPhoto rows were deleted, in rate-limited batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=assets.CLOUDINARY_BATCH_LIMIT,
+            help=f"Assets per API call (at most {assets.CLOUDINARY_BATCH_LIMIT}).",
+        )
+        parser.add_argument("--rate", type=float, default=1.0, help="Max storage API calls per second.")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be reclaimed; delete nothing.")
+
+    def handle(self, *args, **options):
+        totals = assets.collect(batch_size=options["batch_size"], rate=options["rate"], dry_run=options["dry_run"])
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {totals['deleted']} asset(s) in {totals['batches']} batch(es), "
+            f"reclaiming {filesizeformat(totals['bytes'])} ({totals['bytes']} bytes); {totals['failed']} failed."
+        ))
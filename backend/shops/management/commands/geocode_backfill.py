@@ -0,0 +1,171 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from shops import geocache, rollups
+from shops.models import Shop
+from shops.ratelimit import RateLimiter
+from shops.services import (
+    GEOCODE_ERROR_VALUES,
+    NOT_CACHEABLE,
+    fetch_location_details,
+    get_local_location_details,
+)
+
+
+# Shops whose state/LGA is missing or holds an API error placeholder
+NEEDS_GEOCODING = (
+    Q(state__isnull=True)
+    | Q(state__in=GEOCODE_ERROR_VALUES)
+    | Q(local_government_area__isnull=True)
+    | Q(local_government_area__in=GEOCODE_ERROR_VALUES)
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-geocodes shops whose state/LGA is missing or holds an API error placeholder. "
+        "Upstream lookups run concurrently under a rate limit; progress is checkpointed so "
+        "an interrupted run resumes where it stopped (the checkpoint is removed once a run completes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Concurrent upstream lookups.")
+        parser.add_argument("--rate", type=float, default=1.0, help="Max upstream requests per second.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Shops per read/bulk_update chunk.")
+        parser.add_argument(
+            "--checkpoint", default=".geocode_backfill.checkpoint", help="File recording the last shop id done."
+        )
+        parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over.")
+
+    def handle(self, *args, **options):
+        checkpoint = Path(options["checkpoint"])
+        last_id = 0
+        if checkpoint.exists() and not options["restart"]:
+            last_id = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f"Resuming after shop #{last_id}")
+
+        pending = (
+            Shop.objects.filter(latitude__isnull=False, longitude__isnull=False)
+            .filter(NEEDS_GEOCODING)
+            .only("id", "latitude", "longitude")
+            .order_by("id")
+        )
+
+        self.upstream_enabled = bool(settings.OPENCAGE_API_KEY)
+        if not self.upstream_enabled:
+            self.stdout.write(self.style.WARNING(
+                "OPENCAGE_API_KEY is not configured: only the offline index and the geocode cache are used."
+            ))
+
+        limiter = RateLimiter(options["rate"])
+        totals = {"shops": 0, "resolved": 0, "failed": 0, "skipped": 0, "lookups": 0, "upstream": 0}
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                # Keyset chunks stream the table without holding a cursor open across writes
+                shops = list(pending.filter(id__gt=last_id)[: options["chunk_size"]])
+                if not shops:
+                    break
+                self._process_chunk(shops, pool, limiter, totals)
+                last_id = shops[-1].id
+                checkpoint.write_text(str(last_id))
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"  ...{totals['shops']} shops ({totals['shops'] / elapsed:.1f}/s), "
+                    f"{totals['upstream']} upstream lookups ({totals['upstream'] / elapsed:.2f}/s), "
+                    f"up to #{last_id}"
+                )
+
+        # Only an interrupted run resumes; the next full run starts over, failures included
+        checkpoint.unlink(missing_ok=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfill done: {totals['shops']} shop(s) scanned, {totals['resolved']} resolved, "
+            f"{totals['failed']} failed, {totals['skipped']} skipped; {totals['lookups']} distinct cell(s), "
+            f"{totals['upstream']} upstream lookup(s) in {time.monotonic() - started:.1f}s."
+        ))
+
+    def _process_chunk(self, shops, pool, limiter, totals):
+        # One lookup per coordinate cell: neighbouring shops share a result
+        by_cell = {}
+        for shop in shops:
+            by_cell.setdefault(geocache.cell_key(shop.latitude, shop.longitude), []).append(shop)
+        totals["shops"] += len(shops)
+        totals["lookups"] += len(by_cell)
+
+        # Offline index and shared cache first (main thread; they touch the DB)
+        locations, misses = {}, []
+        for cell, cell_shops in by_cell.items():
+            shop = cell_shops[0]
+            location = get_local_location_details(shop.latitude, shop.longitude) or geocache.get(
+                shop.latitude, shop.longitude
+            )
+            if location is not None:
+                locations[cell] = location
+            elif self.upstream_enabled:
+                misses.append((cell, shop.latitude, shop.longitude))
+
+        # Only upstream calls run on the pool
+        def fetch(miss):
+            limiter.acquire()
+            return fetch_location_details(miss[1], miss[2])
+
+        for (cell, latitude, longitude), (location, ttl) in zip(misses, pool.map(fetch, misses)):
+            totals["upstream"] += 1
+            if ttl != NOT_CACHEABLE:
+                geocache.put(latitude, longitude, location, ttl=ttl)
+            locations[cell] = location
+
+        # shop id -> (coordinates looked up, location or None when the lookup failed)
+        outcomes = {}
+        for cell, cell_shops in by_cell.items():
+            location = locations.get(cell)
+            if location is None:
+                totals["skipped"] += len(cell_shops)
+                continue
+            failed = location.get("state") in GEOCODE_ERROR_VALUES
+            for shop in cell_shops:
+                outcomes[shop.id] = (shop.latitude, shop.longitude), None if failed else location
+
+        now = timezone.now()
+        with transaction.atomic():
+            # Lookups can take minutes at a low --rate: re-read the rows under lock and only
+            # write those that still need geocoding at the coordinates that were looked up,
+            # so edits made meanwhile survive and rollup deltas start from current values
+            locked = (
+                Shop.objects.select_for_update()
+                .filter(NEEDS_GEOCODING, id__in=outcomes)
+                .only("id", "latitude", "longitude", "local_government_area", "geocode_status", *rollups.ROLLUP_MODEL_FIELDS)
+            )
+            updated = []
+            for shop in locked:
+                coordinates, location = outcomes[shop.id]
+                if (shop.latitude, shop.longitude) != coordinates:
+                    continue
+                if location is None:
+                    # Clear the placeholder strings; the shop stays eligible for the next run
+                    shop.state = shop.local_government_area = None
+                    shop.geocode_status = Shop.GeocodeStatus.FAILED
+                else:
+                    shop.state = location.get("state")
+                    shop.local_government_area = location.get("local_government_area")
+                    shop.geocode_status = Shop.GeocodeStatus.RESOLVED
+                shop.date_updated = now  # bulk_update skips auto_now
+                updated.append(shop)
+                totals["failed" if location is None else "resolved"] += 1
+
+            totals["skipped"] += len(outcomes) - len(updated)  # edited meanwhile
+
+            Shop.objects.bulk_update(
+                updated, ["state", "local_government_area", "geocode_status", "date_updated"], batch_size=500
+            )
+            rollups.record_changes([(rollups.loaded_snapshot(shop), rollups.snapshot(shop)) for shop in updated])
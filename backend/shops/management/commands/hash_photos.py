@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from shops.imaging import dhash
+from shops.models import ShopPhoto
+
+
+class Command(BaseCommand):
+    help = "Computes perceptual hashes for uploaded photos that predate duplicate detection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=200, help="Photos per read/bulk_update chunk.")
+
+    def handle(self, *args, **options):
+        pending = (
+            ShopPhoto.objects.filter(status=ShopPhoto.Status.READY, phash__isnull=True)
+            .exclude(photo="")
+            .only("id", "photo", "thumbnail")
+            .order_by("id")
+        )
+        workers = getattr(settings, "SHOP_PHOTO_UPLOAD_WORKERS", 4)
+        last_id, hashed, failed = 0, 0, 0
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                photos = list(pending.filter(id__gt=last_id)[: options["chunk_size"]])
+                if not photos:
+                    break
+                last_id = photos[-1].id
+                # Downloads run on the pool; the DB stays on this thread
+                done = [photo for photo, ok in zip(photos, pool.map(self._hash, photos)) if ok]
+                ShopPhoto.objects.bulk_update(done, ShopPhoto.PHASH_FIELDS)
+                hashed += len(done)
+                failed += len(photos) - len(done)
+
+        self.stdout.write(self.style.SUCCESS(f"Hashed {hashed} photo(s); {failed} could not be read."))
+
+    def _hash(self, photo):
+        # The thumbnail is smaller to fetch and hashes within a bit or two of the full photo
+        field = photo.thumbnail or photo.photo
+        try:
+            with field.open("rb") as fh, Image.open(fh) as image:
+                photo.set_phash(dhash(image))
+        except Exception as e:
+            self.stderr.write(f"Photo #{photo.id}: {e}")
+            return False
+        return True
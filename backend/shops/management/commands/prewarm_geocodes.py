@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from shops.geocache import cell_key
+from shops.models import GeocodeCacheEntry, Shop
+from shops.services import GEOCODE_ERROR_VALUES
+
+
+class Command(BaseCommand):
+    help = "Seeds the shared geocode store from shops that already have a resolved state/LGA."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        rows = (
+            Shop.objects.filter(latitude__isnull=False, longitude__isnull=False, state__isnull=False)
+            .exclude(state__in=GEOCODE_ERROR_VALUES)
+            .values_list("latitude", "longitude", "state", "local_government_area")
+            .order_by("id")
+        )
+
+        seen, batch, scanned, written = set(), [], 0, 0
+        for latitude, longitude, state, lga in rows.iterator(chunk_size=batch_size):
+            scanned += 1
+            cell = cell_key(latitude, longitude)
+            if cell in seen:
+                continue
+            seen.add(cell)
+            batch.append(GeocodeCacheEntry(cell=cell, state=state, local_government_area=lga))
+            if len(batch) >= batch_size:
+                written += self._flush(batch)
+                batch = []
+        written += self._flush(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {scanned} shop(s), {len(seen)} distinct location(s); {written} new cache entr(ies)."
+        ))
+
+    def _flush(self, batch):
+        if not batch:
+            return 0
+        # Existing entries win: they may come from a fresher API response
+        existing = set(
+            GeocodeCacheEntry.objects.filter(cell__in=[entry.cell for entry in batch]).values_list("cell", flat=True)
+        )
+        new = [entry for entry in batch if entry.cell not in existing]
+        GeocodeCacheEntry.objects.bulk_create(new, ignore_conflicts=True)
+        return len(new)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shops import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the daily capture/review rollup from shops and the activity log. "
+        "Best run while no shops are being written."
+    )
+
+    def handle(self, *args, **options):
+        rows = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt daily shop stats: {rows} row(s)."))
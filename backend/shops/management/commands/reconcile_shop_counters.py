@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shops import counters
+
+
+class Command(BaseCommand):
+    help = "Recomputes the dashboard counters from the shops table and repairs any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        drift = counters.reconcile(dry_run=options["dry_run"])
+        for name, (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f"  {name}: {stored} -> {actual}")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Counters are in sync."))
+        elif options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} counter(s) have drifted (dry run, nothing changed)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drift)} counter(s)."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shops import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs (geocoding, photo uploads, ...). Loops forever unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+        parser.add_argument("--sleep", type=float, default=5.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--kind", action="append", help="Only run jobs of this kind (repeatable).")
+
+    def handle(self, *args, **options):
+        self.stdout.write("--- Job worker started ---")
+        while True:
+            processed = jobs.run_pending(options["kind"])
+            if processed:
+                self.stdout.write(f"Processed {processed} job(s).")
+            if options["once"]:
+                break
+            if not processed:
+                time.sleep(options["sleep"])
+        self.stdout.write(self.style.SUCCESS("--- Job worker finished ---"))
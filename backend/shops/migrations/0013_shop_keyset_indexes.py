@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_agentprofile_assigned_region_and_more'),
+        ('shops', '0012_shop_rejection_reason_shop_verification_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['-date_created', '-id'], name='shop_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['created_by', '-date_created', '-id'], name='shop_agent_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['verification_status', '-date_created', '-id'], name='shop_status_created_idx'),
+        ),
+    ]
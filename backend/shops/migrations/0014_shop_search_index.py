@@ -0,0 +1,77 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# Search indexes are backend-specific, so they are managed here rather than in Shop.Meta.
+# Everything below is frozen as of this migration; shops.search must keep matching it.
+SEARCH_VECTOR_INDEX = "shop_search_vector_idx"
+NAME_TRIGRAM_INDEX = "shop_name_trgm_idx"
+
+SQLITE_FTS_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shops_shop_fts USING fts5("
+    "name, address, description, state, local_government_area, content='shops_shop', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS shops_shop_fts_ai AFTER INSERT ON shops_shop BEGIN "
+    "INSERT INTO shops_shop_fts(rowid, name, address, description, state, local_government_area) "
+    "VALUES (new.id, new.name, new.address, new.description, new.state, new.local_government_area); END",
+    "CREATE TRIGGER IF NOT EXISTS shops_shop_fts_ad AFTER DELETE ON shops_shop BEGIN "
+    "INSERT INTO shops_shop_fts(shops_shop_fts, rowid, name, address, description, state, local_government_area) "
+    "VALUES ('delete', old.id, old.name, old.address, old.description, old.state, old.local_government_area); END",
+    "CREATE TRIGGER IF NOT EXISTS shops_shop_fts_au AFTER UPDATE ON shops_shop BEGIN "
+    "INSERT INTO shops_shop_fts(shops_shop_fts, rowid, name, address, description, state, local_government_area) "
+    "VALUES ('delete', old.id, old.name, old.address, old.description, old.state, old.local_government_area); "
+    "INSERT INTO shops_shop_fts(rowid, name, address, description, state, local_government_area) "
+    "VALUES (new.id, new.name, new.address, new.description, new.state, new.local_government_area); END",
+    "INSERT INTO shops_shop_fts(shops_shop_fts) VALUES ('rebuild')",
+]
+SQLITE_FTS_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS shops_shop_fts_ai",
+    "DROP TRIGGER IF EXISTS shops_shop_fts_ad",
+    "DROP TRIGGER IF EXISTS shops_shop_fts_au",
+    "DROP TABLE IF EXISTS shops_shop_fts",
+]
+
+
+def _postgres_indexes():
+    search_vector = SearchVector("name", "address", "description", "state", "local_government_area", config="simple")
+    return [
+        GinIndex(search_vector, name=SEARCH_VECTOR_INDEX),
+        GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name=NAME_TRIGRAM_INDEX),
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        Shop = apps.get_model("shops", "Shop")
+        for index in _postgres_indexes():
+            schema_editor.add_index(Shop, index)
+    elif vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            for statement in SQLITE_FTS_INSTALL:
+                cursor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        Shop = apps.get_model("shops", "Shop")
+        for index in _postgres_indexes():
+            schema_editor.remove_index(Shop, index)
+    elif vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            for statement in SQLITE_FTS_UNINSTALL:
+                cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0013_shop_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+from shops.geo import encode_geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    Shop = apps.get_model("shops", "Shop")
+    batch = []
+    shops = Shop.objects.filter(latitude__isnull=False, longitude__isnull=False).only("id", "latitude", "longitude")
+    for shop in shops.iterator(chunk_size=2000):
+        shop.geohash = encode_geohash(shop.latitude, shop.longitude)
+        batch.append(shop)
+        if len(batch) >= 2000:
+            Shop.objects.bulk_update(batch, ["geohash"])
+            batch = []
+    if batch:
+        Shop.objects.bulk_update(batch, ["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0014_shop_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
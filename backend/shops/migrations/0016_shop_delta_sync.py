@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_shop_id_snapshot(apps, schema_editor):
+    ActivityLog = apps.get_model("shops", "ActivityLog")
+    ActivityLog.objects.filter(shop__isnull=False).update(shop_id_snapshot=F("shop_id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_agentprofile_assigned_region_and_more'),
+        ('shops', '0015_shop_geohash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitylog',
+            name='shop_id_snapshot',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_shop_id_snapshot, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['action_type', 'id'], name='activitylog_action_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['date_updated', 'id'], name='shop_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['created_by', 'date_updated', 'id'], name='shop_agent_updated_idx'),
+        ),
+    ]
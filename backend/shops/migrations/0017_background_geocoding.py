@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Strings the old synchronous geocoder wrote into state/LGA when the lookup failed
+GEOCODE_ERROR_VALUES = ["API Error", "API Key Missing"]
+
+
+def set_geocode_status(apps, schema_editor):
+    Shop = apps.get_model("shops", "Shop")
+    located = Shop.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    located.filter(state__in=GEOCODE_ERROR_VALUES).update(geocode_status="FAILED")
+    located.exclude(state__in=GEOCODE_ERROR_VALUES).update(geocode_status="RESOLVED")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0016_shop_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='geocode_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('RESOLVED', 'Resolved'), ('FAILED', 'Failed'), ('SKIPPED', 'No coordinates')], default='SKIPPED', max_length=10),
+        ),
+        migrations.RunPython(set_geocode_status, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'status', 'run_after'], name='job_claim_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0017_background_geocoding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.CharField(max_length=40, unique=True)),
+                ('state', models.CharField(blank=True, max_length=100, null=True)),
+                ('local_government_area', models.CharField(blank=True, max_length=100, null=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
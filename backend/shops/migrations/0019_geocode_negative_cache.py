@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0018_geocode_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodecacheentry',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:49
+
+import shops.storage
+import shops.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0019_geocode_negative_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopphoto',
+            name='staged_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='shopphoto',
+            name='status',
+            field=models.CharField(choices=[('PROCESSING', 'Processing'), ('READY', 'Ready'), ('FAILED', 'Failed')], default='READY', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='shopphoto',
+            name='photo',
+            field=models.ImageField(blank=True, storage=shops.storage.PhotoStorage(), upload_to='shop_photos', validators=[shops.validators.validate_image]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:51
+
+import shops.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0020_photo_upload_pipeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopphoto',
+            name='thumbnail',
+            field=models.ImageField(blank=True, storage=shops.storage.PhotoStorage(), upload_to='shop_photos/thumbs'),
+        ),
+    ]
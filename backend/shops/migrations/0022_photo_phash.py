@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0021_photo_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopphoto',
+            name='phash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='shopphoto',
+            name='phash_0',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='shopphoto',
+            name='phash_1',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='shopphoto',
+            name='phash_2',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='shopphoto',
+            name='phash_3',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
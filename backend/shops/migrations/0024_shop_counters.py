@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:06
+
+from collections import Counter
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+# Frozen copy of shops.counters.counter_names, so later changes there cannot alter this migration
+def counter_names(created_by_id, verification_status, is_active, day):
+    names = ["shops", f"shops:{verification_status}", f"shops:day:{day}"]
+    if is_active:
+        names.append("shops:active")
+    if created_by_id is not None:
+        agent = f"agent:{created_by_id}"
+        names += ["shops:by_agents", f"{agent}:shops", f"{agent}:{verification_status}", f"{agent}:day:{day}"]
+    return names
+
+
+def build_counters(apps, schema_editor):
+    Shop = apps.get_model("shops", "Shop")
+    ShopCounter = apps.get_model("shops", "ShopCounter")
+    User = apps.get_model("accounts", "User")
+
+    totals = Counter()
+    groups = (
+        Shop.objects.order_by()
+        .values("created_by_id", "verification_status", "is_active", day=TruncDate("date_created"))
+        .annotate(count=Count("id"))
+    )
+    for group in groups:
+        key = (group["created_by_id"], group["verification_status"], group["is_active"], group["day"].isoformat())
+        for name in counter_names(*key):
+            totals[name] += group["count"]
+    totals["users:agents"] = User.objects.filter(role="agent").count()
+    ShopCounter.objects.bulk_create(
+        [ShopCounter(name=name, value=value) for name, value in totals.items() if value], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_agentprofile_assigned_region_and_more'),
+        ('shops', '0023_pending_asset_deletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('date_updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:12
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+
+
+def build_rollup(apps, schema_editor):
+    # A frozen copy of shops.rollups.compute, on the historical models
+    Shop = apps.get_model("shops", "Shop")
+    ActivityLog = apps.get_model("shops", "ActivityLog")
+    DailyShopStats = apps.get_model("shops", "DailyShopStats")
+
+    rows = defaultdict(lambda: {"captured": 0, "verified": 0, "rejected": 0})
+
+    def bucket(day, group):
+        return day, group["state"] or "", group["local_government_area"] or "", group["created_by_id"] or 0
+
+    captures = (
+        Shop.objects.order_by()
+        .values("state", "local_government_area", "created_by_id", day=TruncDate("date_created"))
+        .annotate(count=Count("id"))
+    )
+    for group in captures:
+        rows[bucket(group["day"], group)]["captured"] += group["count"]
+
+    for status, field in (("VERIFIED", "verified"), ("REJECTED", "rejected")):
+        reviews = (
+            ActivityLog.objects.order_by()
+            .filter(action_type="UPDATE", changes__verification_status__new=status)
+            .values(
+                day=TruncDate("timestamp"),
+                state=F("shop__state"),
+                local_government_area=F("shop__local_government_area"),
+                created_by_id=F("shop__created_by_id"),
+            )
+            .annotate(count=Count("id"))
+        )
+        for group in reviews:
+            rows[bucket(group["day"], group)][field] += group["count"]
+
+    DailyShopStats.objects.bulk_create(
+        [
+            DailyShopStats(day=day, state=state, local_government_area=lga, created_by_id=agent_id, **counts)
+            for (day, state, lga, agent_id), counts in rows.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0024_shop_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyShopStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('state', models.CharField(blank=True, default='', max_length=100)),
+                ('local_government_area', models.CharField(blank=True, default='', max_length=100)),
+                ('created_by_id', models.BigIntegerField(default=0)),
+                ('captured', models.IntegerField(default=0)),
+                ('verified', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'state', 'local_government_area', 'created_by_id'), name='daily_shop_stats_bucket')],
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0025_daily_shop_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopcounter',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='shopcounter',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='shopcounter',
+            constraint=models.UniqueConstraint(fields=('name', 'shard'), name='shop_counter_shard'),
+        ),
+    ]
@@ -3,8 +3,51 @@ from django.db import models
 from accounts.models import StoreOwner, Agent
 from PIL import Image
 from .validators import validate_image 
-from cloudinary_storage.storage import MediaCloudinaryStorage
 from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .storage import PhotoStorage
+from .geo import bbox_around, covering_cells, encode_geohash, geohash_prefix_q, haversine_expression
+
+
+class ShopQuerySet(models.QuerySet):
+    def with_related(self, fields=None, expand=()):
+        """
+        Load everything ShopSerializer reads, so a list costs a fixed number of queries.
+        With a sparse fieldset, only the requested columns and relations are loaded.
+        """
+        if fields is None:
+            return self.select_related("owner", "created_by").prefetch_related("photos")
+
+        concrete = {field.name for field in self.model._meta.concrete_fields}
+        related = [name for name in ("owner", "created_by") if name in fields]
+        # id and date_created are always needed for the cursor position
+        columns = {"id", "date_created", *related} | (set(fields) & concrete)
+        if "created_by_id" in fields:
+            columns.add("created_by")
+
+        queryset = self.select_related(*related) if related else self
+        if "photos" in fields or "photos" in expand or "duplicate_photos" in fields:
+            queryset = queryset.prefetch_related("photos")
+        return queryset.only(*columns)
+
+    def in_bbox(self, south, west, north, east):
+        """Shops inside the box: geohash cell range scans, then exact lat/lon bounds."""
+        if west <= east:
+            longitude_q = Q(longitude__gte=west, longitude__lte=east)
+        else:  # crosses the antimeridian
+            longitude_q = Q(longitude__gte=west) | Q(longitude__lte=east)
+        return self.filter(geohash_prefix_q(covering_cells(south, west, north, east))).filter(
+            longitude_q, latitude__gte=south, latitude__lte=north
+        )
+
+    def near(self, latitude, longitude, radius_m):
+        """Shops within `radius_m` metres, annotated with `distance_m`."""
+        return (
+            self.filter(geohash_prefix_q(covering_cells(*bbox_around(latitude, longitude, radius_m))))
+            .annotate(distance_m=haversine_expression(latitude, longitude))
+            .filter(distance_m__lte=radius_m)
+        )
 
 
 class Shop(models.Model):
@@ -33,8 +76,23 @@ class Shop(models.Model):
 
     state = models.CharField(max_length=100, blank=True, null=True)
     local_government_area = models.CharField(max_length=100, blank=True, null=True)
+    # Maintained from latitude/longitude in save(); indexed for bbox/radius lookups
+    geohash = models.CharField(max_length=12, blank=True, null=True, db_index=True, editable=False)
     description = models.TextField(blank=True, null=True)
 
+    class GeocodeStatus(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RESOLVED = 'RESOLVED', 'Resolved'
+        FAILED = 'FAILED', 'Failed'
+        SKIPPED = 'SKIPPED', 'No coordinates'
+
+    # state/local_government_area are filled in by the background geocoder (shops.tasks)
+    geocode_status = models.CharField(
+        max_length=10,
+        choices=GeocodeStatus.choices,
+        default=GeocodeStatus.SKIPPED,
+    )
+
 
     class VerificationStatus(models.TextChoices):
         PENDING = 'PENDING', 'Pending Review'
@@ -54,11 +112,58 @@ class Shop(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
+    objects = ShopQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            # Keyset pagination: (-date_created, -id), optionally scoped by agent or status
+            models.Index(fields=["-date_created", "-id"], name="shop_created_idx"),
+            models.Index(fields=["created_by", "-date_created", "-id"], name="shop_agent_created_idx"),
+            models.Index(fields=["verification_status", "-date_created", "-id"], name="shop_status_created_idx"),
+            # Delta sync: changes since a (date_updated, id) position
+            models.Index(fields=["date_updated", "id"], name="shop_updated_idx"),
+            models.Index(fields=["created_by", "date_updated", "id"], name="shop_agent_updated_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.owner.username if self.owner else 'Unassigned'})"
 
+    # Values as loaded from the database, so write paths can see what changed
+    TRACKED_FIELDS = (
+        "geohash", "created_by_id", "verification_status", "is_active", "date_created",
+        "state", "local_government_area",
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            field: getattr(instance, field)
+            for field in cls.TRACKED_FIELDS if field in instance.__dict__
+        }
+        return instance
+
+    def get_loaded_value(self, field):
+        """The value `field` had when this instance was loaded (None for new instances)."""
+        return getattr(self, "_loaded_values", {}).get(field)
+
+    def sync_geohash(self):
+        """Recompute the geohash; call before bulk_create/bulk_update, which bypass save()."""
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+
+    def save(self, *args, **kwargs):
+        self.sync_geohash()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "geohash"}
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field: getattr(self, field) for field in self.TRACKED_FIELDS if field in self.__dict__
+        }
+
 
 class ShopPhoto(models.Model):
     shop = models.ForeignKey(
@@ -66,11 +171,43 @@ class ShopPhoto(models.Model):
         on_delete=models.CASCADE,
         related_name="photos"
     )
+    class Status(models.TextChoices):
+        PROCESSING = 'PROCESSING', 'Processing'
+        READY = 'READY', 'Ready'
+        FAILED = 'FAILED', 'Failed'
+
     photo = models.ImageField(
         upload_to="shop_photos", 
         validators=[validate_image],
-        storage=MediaCloudinaryStorage() # Forces Cloudinary upload
+        blank=True,  # empty while the upload is still processing
+        storage=PhotoStorage() # settings.SHOP_PHOTO_STORAGE (Cloudinary by default)
     )
+    # Small variant for lists and previews (shops.imaging); empty for photos uploaded before thumbnails existed
+    thumbnail = models.ImageField(upload_to="shop_photos/thumbs", blank=True, storage=PhotoStorage())
+    # Captured photos are staged on local disk and uploaded by a background job (shops.photos)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.READY)
+    staged_path = models.CharField(max_length=255, blank=True)
+
+    # 64-bit dHash of the uploaded image (stored signed) and its four 16-bit chunks;
+    # the indexed chunks drive the multi-index Hamming search in shops.duplicates
+    phash = models.BigIntegerField(null=True, blank=True, editable=False)
+    phash_0 = models.IntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_1 = models.IntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_2 = models.IntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_3 = models.IntegerField(null=True, blank=True, editable=False, db_index=True)
+
+    PHASH_FIELDS = ("phash", "phash_0", "phash_1", "phash_2", "phash_3")
+    PHASH_CHUNK_FIELDS = PHASH_FIELDS[1:]
+
+    def set_phash(self, value):
+        """Store an unsigned 64-bit hash and its chunks (most significant first)."""
+        self.phash = value - (1 << 64) if value >= 1 << 63 else value
+        for i, field in enumerate(self.PHASH_CHUNK_FIELDS):
+            setattr(self, field, (value >> (48 - 16 * i)) & 0xFFFF)
+
+    @property
+    def phash_unsigned(self):
+        return None if self.phash is None else self.phash & 0xFFFFFFFFFFFFFFFF
 
 
     def __str__(self):
@@ -93,6 +230,7 @@ class ActivityLog(models.Model):
     
     # Snapshot of the name (so we know what it was even if shop is deleted)
     shop_name_snapshot = models.CharField(max_length=200)
+    shop_id_snapshot = models.BigIntegerField(null=True, blank=True)
     
     # Stores details like: {"phone_number": {"old": "111", "new": "222"}}
     changes = models.JSONField(default=dict, blank=True) 
@@ -101,6 +239,111 @@ class ActivityLog(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Delta sync tombstones: deletes after a log id
+            models.Index(fields=["action_type", "id"], name="activitylog_action_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.actor} {self.action_type} {self.shop_name_snapshot}"
+
+
+class BackgroundJob(models.Model):
+    """
+    A unit of deferred work in the DB-backed job queue (see shops.jobs).
+    Workers claim PENDING rows in batches; failed jobs are retried with backoff.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kind", "status", "run_after"], name="job_claim_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+class GeocodeCacheEntry(models.Model):
+    """
+    A reverse-geocoding result shared by every process (see shops.geocache).
+    Keyed by a normalised coordinate cell so repeated lookups never reach the paid API.
+    """
+    cell = models.CharField(max_length=40, unique=True)
+    state = models.CharField(max_length=100, null=True, blank=True)
+    local_government_area = models.CharField(max_length=100, null=True, blank=True)
+    # Set for negative entries (no result / upstream error); positive entries never expire
+    expires_at = models.DateTimeField(null=True, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.cell}: {self.state} / {self.local_government_area}"
+
+
+class PendingAssetDeletion(models.Model):
+    """
+    A stored photo file whose ShopPhoto row is gone. Written in the same transaction
+    as the delete; the collect_photo_assets command removes the remote asset later.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ShopCounter(models.Model):
+    """
+    One shard of a dashboard rollup counter (see shops.counters), e.g. "shops:PENDING" or
+    "agent:7:day:2025-01-31". A counter's value is the sum of its shards.
+    """
+    name = models.CharField(max_length=100)
+    shard = models.PositiveSmallIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+    date_updated = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["name", "shard"], name="shop_counter_shard"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class DailyShopStats(models.Model):
+    """Captures and review decisions per day, state, LGA and agent (see shops.rollups)."""
+    day = models.DateField()
+    # Blank / 0 when unknown, so the unique key also holds for them
+    state = models.CharField(max_length=100, blank=True, default="")
+    local_government_area = models.CharField(max_length=100, blank=True, default="")
+    created_by_id = models.BigIntegerField(default=0)
+    captured = models.IntegerField(default=0)
+    verified = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "state", "local_government_area", "created_by_id"], name="daily_shop_stats_bucket"
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.actor} {self.action_type} {self.shop_name_snapshot}"
\ No newline at end of file
+        return f"{self.day} {self.state}/{self.local_government_area} agent #{self.created_by_id}"
@@ -0,0 +1,229 @@
+# shops/opencage.py
+"""
+HTTP client for the OpenCage reverse-geocoding API.
+
+- One pooled keep-alive `requests.Session` per process.
+- Transient failures (timeouts, connection errors, 429/5xx) are retried with
+  full-jitter exponential backoff. A retry budget caps retries at a fraction
+  of recent calls, so they cannot multiply load on a struggling upstream.
+- A circuit breaker opens after repeated failures and fails calls fast until
+  a cool-down passes. A single trial call then decides whether it closes again.
+- `metrics()` returns upstream latency and outcome counters for this process.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.opencagedata.com/geocode/v1/json"
+CONNECT_TIMEOUT = 2.0
+READ_TIMEOUT = 3.0
+POOL_SIZE = 10
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.2  # seconds; attempt n sleeps uniform(0, min(cap, base * 2**n))
+BACKOFF_CAP = 2.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SLOW_CALL_SECONDS = 1.0
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class OpenCageError(Exception):
+    """The lookup failed (after any retries)."""
+
+
+class CircuitOpenError(OpenCageError):
+    """The circuit breaker is open; the call was not attempted."""
+
+
+class _TransientError(OpenCageError):
+    """A failure worth retrying."""
+
+
+class RetryBudget:
+    """Every call earns `ratio` of a retry token (up to `max_tokens`); every retry spends one."""
+
+    def __init__(self, ratio=0.2, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def allow(self):
+        """Whether a call may go out now. After the cool-down, exactly one trial call is let through."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("OpenCage circuit opened after %s failure(s)", self._failures)
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = Counter()
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def incr(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counters["requests"] += 1
+            self.latency_total += seconds
+            self.latency_max = max(self.latency_max, seconds)
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            self.latency_buckets[bucket] += 1
+
+    def snapshot(self):
+        with self._lock:
+            requests_made = self.counters["requests"]
+            labels = [f"le_{bound}" for bound in LATENCY_BUCKETS] + ["le_inf"]
+            return {
+                **{name: self.counters[name] for name in ("calls", "requests", "retries", "failures", "short_circuited")},
+                "latency_avg": self.latency_total / requests_made if requests_made else 0.0,
+                "latency_max": self.latency_max,
+                "latency_buckets": dict(zip(labels, self.latency_buckets)),
+            }
+
+
+_session = None
+_session_lock = threading.Lock()
+_budget = RetryBudget()
+_breaker = CircuitBreaker()
+_metrics = _Metrics()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _request(params):
+    url = getattr(settings, "OPENCAGE_BASE_URL", DEFAULT_BASE_URL)
+    start = time.monotonic()
+    try:
+        response = get_session().get(url, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    except (requests.Timeout, requests.ConnectionError) as e:
+        raise _TransientError(str(e)) from e
+    except requests.RequestException as e:
+        raise OpenCageError(str(e)) from e
+    finally:
+        elapsed = time.monotonic() - start
+        _metrics.observe(elapsed)
+        if elapsed > SLOW_CALL_SECONDS:
+            logger.warning("Slow OpenCage call: %.2fs", elapsed)
+
+    if response.status_code in RETRY_STATUSES:
+        raise _TransientError(f"HTTP {response.status_code}")
+    if response.status_code >= 400:
+        raise OpenCageError(f"HTTP {response.status_code}")
+    try:
+        return response.json()
+    except ValueError as e:
+        raise OpenCageError("Invalid JSON from OpenCage") from e
+
+
+def reverse_geocode(latitude, longitude, api_key):
+    """Raw OpenCage response for a coordinate. Raises OpenCageError (or CircuitOpenError)."""
+    _metrics.incr("calls")
+    if not _breaker.allow():
+        _metrics.incr("short_circuited")
+        raise CircuitOpenError("OpenCage circuit is open")
+    _budget.deposit()
+
+    params = {"q": f"{latitude},{longitude}", "key": api_key, "limit": 1, "no_annotations": 1}
+    attempt = 0
+    while True:
+        try:
+            data = _request(params)
+        except _TransientError:
+            if attempt < MAX_RETRIES and _budget.withdraw():
+                attempt += 1
+                _metrics.incr("retries")
+                time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+                continue
+            _breaker.record_failure()
+            _metrics.incr("failures")
+            raise
+        except Exception:
+            # Anything else too (a malformed body, a bug): a half-open trial must
+            # always settle the breaker, or it would stay half-open for good
+            _breaker.record_failure()
+            _metrics.incr("failures")
+            raise
+        _breaker.record_success()
+        return data
+
+
+def metrics():
+    """Process-local counters (calls, requests, retries, failures, short_circuited) and latency stats."""
+    return {**_metrics.snapshot(), "circuit": _breaker.state}
+
+
+def reset():
+    """Forget breaker, budget and metrics state (tests, or after a configuration change)."""
+    global _budget, _breaker
+    _budget = RetryBudget()
+    _breaker = CircuitBreaker()
+    _metrics.reset()
@@ -0,0 +1,22 @@
+# shops/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class ShopCursorPagination(CursorPagination):
+    """
+    Opaque-cursor (keyset) pagination for shop listings.
+    - Orders by newest first, with `id` as a tie-breaker for shops created at the same instant.
+    - Never runs a COUNT(*), so deep pages cost the same as the first one.
+    - Backed by the (date_created, id) composite indexes on Shop.
+    - Search results (`?q=`) are ordered by relevance instead.
+    """
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("-date_created", "-id")
+    search_ordering = ("-search_rank", "-id")
+
+    def get_ordering(self, request, queryset, view):
+        if "search_rank" in queryset.query.annotations:
+            return self.search_ordering
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,93 @@
+# shops/photos.py
+"""
+Photo capture pipeline.
+
+Requests only stage uploaded files on local disk (SHOP_PHOTO_STAGING_DIR) and
+create PROCESSING ShopPhoto rows. The `upload_photo` background job (shops.tasks)
+downscales each file and renders its thumbnail (shops.imaging), then uploads
+both to SHOP_PHOTO_STORAGE, several files at a time.
+"""
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.utils.text import get_valid_filename
+
+from .imaging import process_photo
+from .models import ShopPhoto
+
+logger = logging.getLogger(__name__)
+
+
+def staging_dir():
+    path = settings.SHOP_PHOTO_STAGING_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def staged_file_path(photo):
+    return os.path.join(settings.SHOP_PHOTO_STAGING_DIR, photo.staged_path)
+
+
+def _original_name(staged_path):
+    # Staged files are named "<uuid>_<original name>"
+    return staged_path.split("_", 1)[1]
+
+
+def stage_photos(shop, files):
+    """Write uploaded files to the staging area and create PROCESSING rows for them."""
+    directory = staging_dir()
+    photos = []
+    for uploaded in files:
+        staged_name = f"{uuid.uuid4().hex}_{get_valid_filename(os.path.basename(uploaded.name)) or 'photo'}"
+        destination = os.path.join(directory, staged_name)
+        if hasattr(uploaded, "temporary_file_path"):
+            # Large uploads are already on disk; move instead of copying
+            file_move_safe(uploaded.temporary_file_path(), destination)
+        else:
+            with open(destination, "wb") as fh:
+                for chunk in uploaded.chunks():
+                    fh.write(chunk)
+        photos.append(ShopPhoto(shop=shop, status=ShopPhoto.Status.PROCESSING, staged_path=staged_name))
+    return ShopPhoto.objects.bulk_create(photos)
+
+
+def _upload(photo):
+    with open(staged_file_path(photo), "rb") as fh:
+        full, thumb, image_hash = process_photo(fh, _original_name(photo.staged_path))
+    photo.set_phash(image_hash)
+    # Only talks to the storage backend; the row is saved by the caller
+    photo.photo.save(full.name, full, save=False)
+    photo.thumbnail.save(thumb.name, thumb, save=False)
+
+
+def upload_staged(photos):
+    """
+    Upload staged files in parallel (SHOP_PHOTO_UPLOAD_WORKERS threads).
+    Sets `photo`, `thumbnail` and the perceptual hash on each instance; returns {photo.id: exception} for the failures.
+    """
+    errors = {}
+    if not photos:
+        return errors
+    workers = min(len(photos), getattr(settings, "SHOP_PHOTO_UPLOAD_WORKERS", 4))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {photo.id: pool.submit(_upload, photo) for photo in photos}
+    for photo_id, future in futures.items():
+        error = future.exception()
+        if error is not None:
+            errors[photo_id] = error
+    return errors
+
+
+def discard_staged_file(staged_path):
+    if not staged_path:
+        return
+    try:
+        os.remove(os.path.join(settings.SHOP_PHOTO_STAGING_DIR, staged_path))
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.warning("Could not remove staged photo %s", staged_path, exc_info=True)
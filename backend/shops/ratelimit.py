@@ -0,0 +1,20 @@
+# shops/ratelimit.py
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads: at most `rate` acquisitions per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
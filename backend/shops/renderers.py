@@ -0,0 +1,45 @@
+# shops/renderers.py
+import json
+import struct
+import sys
+from array import array
+
+from rest_framework.renderers import BaseRenderer
+
+POINTS_MAGIC = b"TPTS"
+POINTS_VERSION = 1
+
+
+class PackedPointsRenderer(BaseRenderer):
+    """
+    Binary variant of the map points feed (?format=bin). Little-endian layout:
+
+        header   magic "TPTS" | uint8 version | uint32 count
+        id       int64[count]
+        lat      float64[count]
+        lon      float64[count]
+        status   uint8[count]   (index into the feed's `status_codes`, in VerificationStatus order)
+
+    Error responses (no columns) are rendered as JSON.
+    """
+    media_type = "application/x-taja-points"
+    format = "bin"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict) or "id" not in data:
+            return json.dumps(data, default=str).encode()
+
+        columns = [
+            array("q", data["id"]),
+            array("d", data["lat"]),
+            array("d", data["lon"]),
+            array("B", data["status"]),
+        ]
+        if sys.byteorder != "little":
+            for column in columns:
+                column.byteswap()
+
+        header = struct.pack("<4sBI", POINTS_MAGIC, POINTS_VERSION, data["count"])
+        return header + b"".join(column.tobytes() for column in columns)
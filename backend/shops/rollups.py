@@ -0,0 +1,206 @@
+# shops/rollups.py
+"""
+Daily capture/review rollup behind /api/shops/stats/timeseries/.
+
+DailyShopStats holds one row per (day, state, LGA, agent) with three counts:
+- captured: shops captured that day. A shop counts on its capture day under its
+  current state/LGA/agent, and moves buckets when those change (for example
+  when background geocoding resolves the location, or when its agent is deleted).
+  Deleting it removes it.
+- verified / rejected: review decisions made that day, under the shop's location
+  at review time. These are events, so later edits or deletes leave them alone.
+
+The shop write paths apply the changes in their own transaction, as they do for
+shops.counters. The rebuild_shop_stats command recomputes the table from shops
+and the activity log. The log does not record where a shop was when it was
+reviewed, so a rebuild files each review under the shop's current state/LGA/agent
+(and under no location once the shop is deleted): per-location review counts can
+shift, the totals per day do not.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+from django.utils import timezone
+
+from accounts.models import User
+
+from .models import ActivityLog, DailyShopStats, Shop
+
+# Shop fields the rollup depends on
+ROLLUP_FIELDS = ("created_by_id", "state", "local_government_area", "verification_status", "date_created")
+ROLLUP_MODEL_FIELDS = {"created_by", "state", "local_government_area", "verification_status", "date_created"}
+
+GROUP_BY = ("day", "week")
+DIMENSIONS = {"state": "state", "lga": "local_government_area", "agent": "created_by_id"}
+MAX_RANGE_DAYS = 731
+
+# Position of each count in a delta
+CAPTURED, VERIFIED, REJECTED = range(3)
+REVIEW_EVENTS = {Shop.VerificationStatus.VERIFIED: VERIFIED, Shop.VerificationStatus.REJECTED: REJECTED}
+
+
+def snapshot(values):
+    """The rollup-relevant state of a shop (instance or values() row); None when a field is missing."""
+    if not isinstance(values, dict):
+        values = values.__dict__
+    if any(field not in values for field in ROLLUP_FIELDS):
+        return None
+    return {field: values[field] for field in ROLLUP_FIELDS}
+
+
+def loaded_snapshot(shop):
+    return snapshot(getattr(shop, "_loaded_values", {}))
+
+
+def _bucket(day, shop):
+    # Rollup columns are NOT NULL so the unique key (and ON CONFLICT) also covers unknown values
+    return day, shop["state"] or "", shop["local_government_area"] or "", shop["created_by_id"] or 0
+
+
+def _capture_bucket(shop):
+    created = shop["date_created"]
+    return _bucket(timezone.localdate(created) if timezone.is_aware(created) else created.date(), shop)
+
+
+def record_changes(changes):
+    """Apply [(old, new), ...] snapshots; old is None for new shops, new is None for deleted ones."""
+    today = timezone.localdate()
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for old, new in changes:
+        old_bucket = old and _capture_bucket(old)
+        new_bucket = new and _capture_bucket(new)
+        if old_bucket != new_bucket:
+            if old_bucket:
+                deltas[old_bucket][CAPTURED] -= 1
+            if new_bucket:
+                deltas[new_bucket][CAPTURED] += 1
+        if new is not None:
+            previous_status = old["verification_status"] if old else Shop.VerificationStatus.PENDING
+            event = REVIEW_EVENTS.get(new["verification_status"])
+            if event is not None and new["verification_status"] != previous_status:
+                deltas[_bucket(today, new)][event] += 1
+    add(deltas)
+
+
+def add(deltas):
+    """{(day, state, lga, agent_id): [captured, verified, rejected]} increments, as one upsert."""
+    deltas = {bucket: counts for bucket, counts in deltas.items() if any(counts)}
+    if not deltas:
+        return
+    table = connection.ops.quote_name(DailyShopStats._meta.db_table)
+    rows = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(deltas))
+    params = [value for bucket in sorted(deltas) for value in (*bucket, *deltas[bucket])]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (day, state, local_government_area, created_by_id, captured, verified, rejected) "
+            f"VALUES {rows} ON CONFLICT (day, state, local_government_area, created_by_id) DO UPDATE SET "
+            f"captured = {table}.captured + excluded.captured, "
+            f"verified = {table}.verified + excluded.verified, "
+            f"rejected = {table}.rejected + excluded.rejected",
+            params,
+        )
+
+
+def compute():
+    """
+    The full rollup, from a grouped scan of shops (captures) and of the activity log
+    (reviews). Reviews are bucketed by the shop's current location; reviews of shops
+    that were deleted since are kept, without a location.
+    """
+    rows = defaultdict(lambda: [0, 0, 0])
+    captures = (
+        Shop.objects.order_by()
+        .values("state", "local_government_area", "created_by_id", day=TruncDate("date_created"))
+        .annotate(count=Count("id"))
+    )
+    for group in captures:
+        rows[_bucket(group["day"], group)][CAPTURED] += group["count"]
+
+    for status, event in REVIEW_EVENTS.items():
+        reviews = (
+            ActivityLog.objects.order_by()
+            .filter(action_type="UPDATE", changes__verification_status__new=status)
+            .values(
+                day=TruncDate("timestamp"),
+                state=F("shop__state"),
+                local_government_area=F("shop__local_government_area"),
+                created_by_id=F("shop__created_by_id"),
+            )
+            .annotate(count=Count("id"))
+        )
+        for group in reviews:
+            rows[_bucket(group["day"], group)][event] += group["count"]
+    return rows
+
+
+def record_creator_removed(user_id):
+    """
+    Call before deleting a user: their shops' created_by is set to NULL without Shop
+    signals, so move the captures to the no-agent bucket here. Reviews are events
+    and keep the agent they were made under.
+    """
+    groups = (
+        Shop.objects.filter(created_by_id=user_id).order_by()
+        .values("state", "local_government_area", day=TruncDate("date_created"))
+        .annotate(count=Count("id"))
+    )
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for group in groups:
+        deltas[_bucket(group["day"], {**group, "created_by_id": user_id})][CAPTURED] -= group["count"]
+        deltas[_bucket(group["day"], {**group, "created_by_id": None})][CAPTURED] += group["count"]
+    add(deltas)
+
+
+@transaction.atomic
+def rebuild():
+    """Replace the rollup with `compute()`; returns the number of rows written."""
+    rows = compute()
+    DailyShopStats.objects.all().delete()
+    DailyShopStats.objects.bulk_create(
+        [
+            DailyShopStats(
+                day=day, state=state, local_government_area=lga, created_by_id=agent_id,
+                captured=counts[CAPTURED], verified=counts[VERIFIED], rejected=counts[REJECTED],
+            )
+            for (day, state, lga, agent_id), counts in rows.items()
+        ],
+        batch_size=1000,
+    )
+    return len(rows)
+
+
+def timeseries(start, end, group_by="day", dimension=None):
+    """
+    Counts per bucket (day, or ISO week starting Monday) between `start` and `end`
+    inclusive, optionally split by a DIMENSIONS key. One grouped query over the rollup.
+    Weeks are labelled by their Monday but only count days in the range, so a
+    mid-week `start` gives a partial first week labelled before `start`.
+    """
+    column = DIMENSIONS.get(dimension)
+    bucket = TruncWeek("day") if group_by == "week" else F("day")
+    rows = (
+        DailyShopStats.objects.filter(day__gte=start, day__lte=end)
+        .values(bucket=bucket, **({"value": F(column)} if column else {}))
+        .annotate(captured=Sum("captured"), verified=Sum("verified"), rejected=Sum("rejected"))
+        .filter(Q(captured__gt=0) | Q(verified__gt=0) | Q(rejected__gt=0))
+        .order_by("bucket", *(["value"] if column else []))
+    )
+
+    results = []
+    for row in rows:
+        result = {"bucket": row["bucket"].isoformat()}
+        if column:
+            result[dimension] = row["value"] or None
+        result.update(captured=row["captured"], verified=row["verified"], rejected=row["rejected"])
+        results.append(result)
+
+    if dimension == "agent":
+        names = dict(
+            User.objects.filter(id__in={result["agent"] for result in results if result["agent"]})
+            .values_list("id", "email")
+        )
+        for result in results:
+            result["agent_email"] = names.get(result["agent"])
+    return results
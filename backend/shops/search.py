@@ -0,0 +1,124 @@
+# shops/search.py
+"""
+Server-side shop search.
+
+- PostgreSQL: full-text search (GIN expression index over a `simple` tsvector) ranked with
+  ts_rank, OR'ed with trigram word-similarity on the name for typo tolerance.
+- SQLite (local development): an external-content FTS5 table kept in sync by triggers,
+  matched with prefix queries and ranked with bm25.
+
+Both backends annotate `search_rank` (higher is better) so callers can order and paginate.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_FIELDS = ("name", "address", "description", "state", "local_government_area")
+SEARCH_CONFIG = "simple"  # names and addresses are mostly proper nouns; no stemming
+
+# SQLite FTS5 mirror of shops_shop
+FTS_TABLE = "shops_shop_fts"
+FTS_WEIGHTS = "10.0, 4.0, 1.0, 2.0, 2.0"  # bm25 column weights, same order as SEARCH_FIELDS
+
+
+def search_vector():
+    """The tsvector expression; must match the expression frozen in migration 0014."""
+    return SearchVector(*SEARCH_FIELDS, config=SEARCH_CONFIG)
+
+
+def search_shops(queryset, query):
+    """Filter `queryset` to shops matching `query` and annotate a `search_rank`."""
+    query = (query or "").strip()
+    if not query:
+        return queryset
+    if connection.vendor == "postgresql":
+        return _search_postgres(queryset, query)
+    if connection.vendor == "sqlite":
+        return _search_sqlite(queryset, query)
+    return _search_fallback(queryset, query)
+
+
+def _search_postgres(queryset, query):
+    ts_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+    return (
+        queryset
+        .annotate(search_document=search_vector())
+        .filter(Q(search_document=ts_query) | Q(name__trigram_word_similar=query))
+        .annotate(search_rank=SearchRank(search_vector(), ts_query) + TrigramWordSimilarity(query, "name"))
+    )
+
+
+def _fts_match_expression(query):
+    # Quote every term (FTS5 syntax characters in user input are then inert) and prefix-match it
+    terms = re.findall(r"\w+", query.lower())
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _search_sqlite(queryset, query):
+    match = _fts_match_expression(query)
+    if not match:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+    table = queryset.model._meta.db_table
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id",
+            [match],
+            output_field=FloatField(),
+        )
+    )
+
+
+def _search_fallback(queryset, query):
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f"{field}__icontains": query})
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+# --- SQLite FTS5 maintenance ---
+
+def _fts_statements():
+    columns = ", ".join(SEARCH_FIELDS)
+    new_values = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+    old_values = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+    delete_old = (
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{columns}, content='shops_shop', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON shops_shop BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON shops_shop BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON shops_shop BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def install_sqlite_fts(cursor):
+    """
+    Create the FTS5 table and its sync triggers if any are missing, rebuilding the index
+    when they were. Safe to call repeatedly; SQLite drops triggers whenever Django remakes
+    shops_shop during a migration, so this also runs after every migrate.
+    """
+    cursor.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+        [f"{FTS_TABLE}_a_"],
+    )
+    if cursor.fetchone()[0] == 3:
+        return
+    for statement in _fts_statements():
+        cursor.execute(statement)
+    cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_sqlite_fts(cursor):
+    for suffix in ("ai", "ad", "au"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+    cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
@@ -2,36 +2,45 @@ import json
 from rest_framework import serializers
 from .models import Shop, ShopPhoto, ActivityLog
 from accounts.models import StoreOwner # Import needed for Role check
-from .services import get_location_details
+from .storage import photo_url, thumbnail_transformation
+from .tasks import capture_photos, enqueue_geocoding, prepare_geocoding
 
 
 class ShopPhotoSerializer(serializers.ModelSerializer):
     # CRITICAL FIX: Use SerializerMethodField to return the absolute URL
-    photo = serializers.SerializerMethodField()
+    photo = serializers.SerializerMethodField()  # same as `full`, kept for existing clients
+    full = serializers.SerializerMethodField()
+    thumb = serializers.SerializerMethodField()
 
     class Meta:
         model = ShopPhoto
-        fields = ["id", "photo"]
-        read_only_fields = ["id"]
+        fields = ["id", "photo", "full", "thumb", "status"]
+        read_only_fields = ["id", "status"]
         
+    def _absolute_url(self, url):
+        # Cloudinary URLs are already absolute; local development URLs need the request domain
+        if url is None or url.startswith("http"):
+            return url
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
     def get_photo(self, obj):
-        if not obj.photo:
-            return None
-            
-        try:
-            url = obj.photo.url
-            # FIX: If it's already a full URL (Cloudinary), return it directly
-            if url.startswith("http"):
-                return url
-            
-            # Otherwise (Local development), append the request domain
-            request = self.context.get('request')
-            return request.build_absolute_uri(url) if request else url
-        except Exception:
-            return None
+        return self._absolute_url(photo_url(obj.photo.name))
+
+    def get_full(self, obj):
+        return self._absolute_url(photo_url(obj.photo.name))
+
+    def get_thumb(self, obj):
+        if obj.thumbnail:
+            return self._absolute_url(photo_url(obj.thumbnail.name))
+        # Photos uploaded before thumbnails existed: a CDN-side resize of the full image
+        return self._absolute_url(photo_url(obj.photo.name, thumbnail_transformation()))
 
 
 class ShopSerializer(serializers.ModelSerializer):
+    # Relations that are only sent with a sparse fieldset when asked for via ?expand=
+    EXPANDABLE_FIELDS = {"photos"}
+
     photos = ShopPhotoSerializer(many=True, required=False)  # nested
     
     # Field for new photo uploads
@@ -51,7 +60,11 @@ class ShopSerializer(serializers.ModelSerializer):
     owner = serializers.StringRelatedField(read_only=True)   # show owner username
     created_by = serializers.StringRelatedField(read_only=True)  # show agent username
 
-    created_by_id = serializers.ReadOnlyField(source='created_by.id')
+    created_by_id = serializers.ReadOnlyField()  # read the FK column, not the joined user row
+
+    # Photos that look like photos of other shops; only sent when the view computed
+    # them (admin detail and review queue, see shops.duplicates)
+    duplicate_photos = serializers.SerializerMethodField()
     
     class Meta:
         model = Shop
@@ -70,14 +83,16 @@ class ShopSerializer(serializers.ModelSerializer):
             "state",
             "local_government_area",
             "description", # Added description here from models.py
+            "geocode_status",
             "owner",
             "created_by",
             "created_by_id",
             "photos",
+            "duplicate_photos",
             "uploaded_photos",
             "photos_to_delete_ids", # Include new field for write operations
         ]
-        read_only_fields = ["id", "date_created", "date_updated", "owner", "created_by", "created_by_id"]
+        read_only_fields = ["id", "date_created", "date_updated", "owner", "created_by", "created_by_id", "geocode_status"]
         
 
     def __init__(self, *args, **kwargs):
@@ -96,31 +111,58 @@ class ShopSerializer(serializers.ModelSerializer):
             else:
                  # Admins can edit these
                  pass
-            
-    def _geocode_and_update(self, validated_data):
-            """Helper to geocode and add location details to validated_data."""
-            latitude = validated_data.get("latitude")
-            longitude = validated_data.get("longitude")
-            
-            if latitude and longitude:
-                location_details = get_location_details(latitude, longitude)
-                # Update the validated data with geocoded results
-                validated_data['state'] = location_details.get('state')
-                validated_data['local_government_area'] = location_details.get('local_government_area')
 
+        if "photo_duplicates" not in self.context:
+            self.fields.pop("duplicate_photos")
+
+        # Sparse fieldset (?fields=...&expand=...), resolved by the view
+        sparse_fields = self.context.get('fields')
+        if sparse_fields is not None:
+            keep = set(sparse_fields) | (set(self.context.get('expand', ())) & self.EXPANDABLE_FIELDS)
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+
+    def get_duplicate_photos(self, obj):
+        return self.context["photo_duplicates"].get(obj.id, [])
+
+    @classmethod
+    def parse_sparse_fieldset(cls, params):
+        """
+        Read ?fields=a,b,c and ?expand=photos from query params.
+        Returns (fields, expand); fields is None when no sparse fieldset was requested.
+        """
+        readable = {name for name in cls.Meta.fields if name not in ("uploaded_photos", "photos_to_delete_ids")}
+        fields, expand = None, set()
+
+        if params.get('fields'):
+            fields = {name.strip() for name in params['fields'].split(',') if name.strip()}
+            unknown = fields - readable
+            if unknown:
+                raise serializers.ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+            fields.add("id")
+
+        if params.get('expand'):
+            expand = {name.strip() for name in params['expand'].split(',') if name.strip()}
+            unknown = expand - cls.EXPANDABLE_FIELDS
+            if unknown:
+                raise serializers.ValidationError({'expand': f"Cannot expand: {', '.join(sorted(unknown))}"})
+
+        return fields, expand
+            
     def create(self, validated_data):
         # Pop the uploaded photos data, it's not a direct Shop model field
         uploaded_photos_data = validated_data.pop("uploaded_photos", [])
-        
-        self._geocode_and_update(validated_data)
 
+        # State/LGA come from the offline boundary index when possible, otherwise
+        # they are resolved in the background; either way the shop is saved right away
+        shop = Shop(**validated_data)
+        prepare_geocoding(shop)
+        shop.save(force_insert=True)
+        enqueue_geocoding([shop])
 
-        # Create the shop instance first
-        shop = Shop.objects.create(**validated_data)
-
-        # Create ShopPhoto objects for each uploaded file
-        for photo_file in uploaded_photos_data:
-            ShopPhoto.objects.create(shop=shop, photo=photo_file)
+        # Photos are staged and uploaded in the background; they read as PROCESSING until then
+        capture_photos(shop, uploaded_photos_data)
 
         return shop
 
@@ -156,10 +198,9 @@ class ShopSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
 
-        # 4. Create new photos
+        # 4. Stage new photos (uploaded in the background)
         if uploaded_photos_data:
-            for photo_file in uploaded_photos_data:
-                ShopPhoto.objects.create(shop=instance, photo=photo_file)
+            capture_photos(instance, uploaded_photos_data)
 
         # 5. Refresh instance
         instance.refresh_from_db()
@@ -167,6 +208,12 @@ class ShopSerializer(serializers.ModelSerializer):
         return instance
     
 
+class BulkReviewSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    verification_status = serializers.ChoiceField(choices=Shop.VerificationStatus.choices)
+    rejection_reason = serializers.CharField(required=False, allow_blank=True)
+
+
 class ActivityLogSerializer(serializers.ModelSerializer):
     actor_name = serializers.SerializerMethodField()
     
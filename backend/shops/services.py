@@ -1,57 +1,99 @@
 # shops/services.py
-import requests
-import json
+import logging
 from django.conf import settings
-from django.core.cache import cache
 from decimal import Decimal
 
-# Redis cache time-to-live (e.g., 30 days)
-CACHE_TTL = 60 * 60 * 24 * 30
-OPENCAGE_BASE_URL = "https://api.opencagedata.com/geocode/v1/json"
+from . import geocache, opencage
+from .boundaries import get_index
 
-def get_location_details(latitude, longitude):
+logger = logging.getLogger(__name__)
+
+# Placeholder values returned (instead of a location) when a lookup could not be made
+GEOCODE_ERROR_VALUES = {'API Error', 'API Key Missing'}
+
+def get_local_location_details(latitude, longitude):
+    """
+    Resolves state/LGA offline from the bundled boundary polygons (see shops.boundaries).
+    Returns the same dictionary as get_location_details, or None when the point is outside coverage.
+    """
+    if latitude is None or longitude is None:
+        return None
+    match = get_index().lookup(latitude, longitude)
+    if match is None:
+        return None
+    state, lga = match
+    return {'state': state, 'local_government_area': lga}
+
+
+def get_location_details(latitude, longitude, use_negative_cache=True):
     """
-    Performs reverse geocoding using OpenCage API with Redis caching.
+    Performs reverse geocoding: the local boundary index first, then the OpenCage API
+    (behind the shared geocode store, see shops.geocache) for points outside its coverage.
+    Pass use_negative_cache=False to skip cached failures and ask OpenCage again.
     Returns a dictionary: {'state': '...', 'local_government_area': '...'}
     """
     if not latitude or not longitude:
         return {'state': None, 'local_government_area': None}
 
-    # Format coords to 6 decimal places for consistent cache key
+    local = get_local_location_details(latitude, longitude)
+    if local is not None:
+        return local
+
+    # Format coords to 6 decimal places for the upstream query
     lat = Decimal(latitude).quantize(Decimal("0.000001"))
     lon = Decimal(longitude).quantize(Decimal("0.000001"))
     
-    # 1. Check Redis Cache
-    cache_key = f"geocode:{lat}:{lon}"
-    cached_data = cache.get(cache_key)
-    
-    if cached_data:
-        print(f"CACHE HIT for {cache_key}")
-        # Return the cached data (already a dict)
+    # 1. Check the geocode store (in-process LRU, then the shared table)
+    cached_data = geocache.get(lat, lon, negative=use_negative_cache)
+    if cached_data is not None:
+        return cached_data
+
+    # 2. Cache Miss: one upstream call per cell; concurrent callers wait for it
+    return _inflight.do(
+        geocache.cell_key(lat, lon), lambda: _fetch_and_store(lat, lon, use_negative_cache)
+    )
+
+
+# Concurrent misses for the same cache cell share a single OpenCage call
+_inflight = geocache.SingleFlight()
+
+
+def _fetch_and_store(lat, lon, use_negative_cache=True):
+    # Another caller may have filled the cell while we were waiting for the flight slot
+    cached_data = geocache.get(lat, lon, negative=use_negative_cache)
+    if cached_data is not None:
         return cached_data
 
-    # 2. Cache Miss: Check API Key
+    result, ttl = fetch_location_details(lat, lon)
+    if ttl != NOT_CACHEABLE:
+        geocache.put(lat, lon, result, ttl=ttl)
+    return result
+
+
+# fetch_location_details() TTL for results that must not be stored
+NOT_CACHEABLE = 0
+
+
+def fetch_location_details(lat, lon):
+    """
+    Asks OpenCage directly, with no cache reads or writes (safe to run off the request thread).
+    Returns (result, ttl): ttl is None for a permanent cache entry, the negative-cache
+    TTL for empty results and errors, or NOT_CACHEABLE.
+    """
+    # Check API Key
     api_key = settings.OPENCAGE_API_KEY
     if not api_key:
-        print("ERROR: OPENCAGE_API_KEY is not configured.")
-        return {'state': 'API Key Missing', 'local_government_area': 'API Key Missing'}
+        logger.error("OPENCAGE_API_KEY is not configured.")
+        return {'state': 'API Key Missing', 'local_government_area': 'API Key Missing'}, NOT_CACHEABLE
 
 
-    # 3. Call OpenCage API
-    params = {
-        'q': f"{lat},{lon}",
-        'key': api_key,
-        'limit': 1,
-    }
-    
+    # Call OpenCage API (pooled session, retries and circuit breaker live in shops.opencage)
     try:
-        response = requests.get(OPENCAGE_BASE_URL, params=params, timeout=5)
-        response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
+        data = opencage.reverse_geocode(lat, lon, api_key)
 
         if not data['results']:
-            # No result found
-            return {'state': None, 'local_government_area': None}
+            # No result found; remember it briefly so the cell is not re-queried on every request
+            return {'state': None, 'local_government_area': None}, geocache.negative_ttl()
 
         # Extract structured components
         components = data['results'][0]['components']
@@ -77,14 +119,13 @@ def get_location_details(latitude, longitude):
             'state': state_or_region,
             'local_government_area': lga_or_district
         }
+        return result, None
 
-        # 4. Cache the result before returning
-        cache.set(cache_key, result, timeout=CACHE_TTL)
-        print(f"CACHE SET for {cache_key}")
-        
-        return result
+    except opencage.CircuitOpenError:
+        # Failing fast; nothing was learnt about this cell, so don't cache it
+        return {'state': 'API Error', 'local_government_area': 'API Error'}, NOT_CACHEABLE
 
-    except requests.exceptions.RequestException as e:
-        print(f"OpenCage API Error: {e}")
-        # Return Nones on API failure
-        return {'state': 'API Error', 'local_government_area': 'API Error'}
+    except opencage.OpenCageError as e:
+        logger.warning("OpenCage API error: %s", e)
+        # Negative-cache the failure so a struggling upstream is not hammered
+        return {'state': 'API Error', 'local_government_area': 'API Error'}, geocache.negative_ttl()
@@ -0,0 +1,113 @@
+# shops/signals.py
+import logging
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from accounts.models import User
+
+from . import counters, rollups
+from .assets import record_deleted_photo
+from .clusters import invalidate_geohashes
+from .models import Shop, ShopPhoto
+from .photos import discard_staged_file
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Shop)
+def invalidate_clusters_on_save(sender, instance, **kwargs):
+    # Both the old tile (if the shop moved) and the new one
+    geohashes = {instance.geohash, instance.get_loaded_value("geohash")}
+    transaction.on_commit(lambda: invalidate_geohashes(geohashes))
+
+
+@receiver(post_delete, sender=Shop)
+def invalidate_clusters_on_delete(sender, instance, **kwargs):
+    geohashes = {instance.geohash}
+    transaction.on_commit(lambda: invalidate_geohashes(geohashes))
+
+
+@receiver(post_delete, sender=ShopPhoto)
+def discard_staged_photo(sender, instance, **kwargs):
+    # A photo deleted before its upload ran would otherwise leave its file in staging
+    staged_path = instance.staged_path
+    if staged_path:
+        transaction.on_commit(lambda: discard_staged_file(staged_path))
+
+
+@receiver(post_delete, sender=ShopPhoto)
+def queue_photo_assets_for_deletion(sender, instance, **kwargs):
+    # Recorded in the delete's transaction; collect_photo_assets removes the remote files
+    record_deleted_photo(instance)
+
+
+@receiver(post_save, sender=Shop)
+def update_counters_on_save(sender, instance, created, update_fields, **kwargs):
+    if not created and update_fields is not None and not counters.COUNTED_MODEL_FIELDS & set(update_fields):
+        return
+    old = None if created else counters.loaded_shop_key(instance)
+    new = counters.shop_key(instance)
+    if new is None or (old is None and not created):
+        # Partially loaded instance: the change cannot be worked out here; reconcile_shop_counters repairs it
+        logger.warning("Dashboard counters not updated for shop #%s", instance.pk)
+        return
+    counters.record_changes([(old, new)])
+
+
+@receiver(post_delete, sender=Shop)
+def update_counters_on_delete(sender, instance, **kwargs):
+    counters.record_changes([(counters.shop_key(instance), None)])
+
+
+@receiver(post_save, sender=Shop)
+def update_rollup_on_save(sender, instance, created, update_fields, **kwargs):
+    if not created and update_fields is not None and not rollups.ROLLUP_MODEL_FIELDS & set(update_fields):
+        return
+    old = None if created else rollups.loaded_snapshot(instance)
+    new = rollups.snapshot(instance)
+    if new is None or (old is None and not created):
+        logger.warning("Daily stats not updated for shop #%s", instance.pk)
+        return
+    rollups.record_changes([(old, new)])
+
+
+@receiver(post_delete, sender=Shop)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    rollups.record_changes([(rollups.snapshot(instance), None)])
+
+
+def remember_user_role(sender, instance, update_fields, raw, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if update_fields is None or "role" in update_fields:
+        instance._stored_role = User.objects.filter(pk=instance.pk).values_list("role", flat=True).first()
+
+
+def update_agent_count_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    old_role = None if created else instance.__dict__.pop("_stored_role", instance.role)
+    counters.add({counters.AGENTS: counters.agent_delta(old_role, instance.role)})
+
+
+def release_deleted_users_shops(sender, instance, **kwargs):
+    # Runs inside the delete's transaction, before SET_NULL clears created_by
+    counters.record_creator_removed(instance.pk)
+    rollups.record_creator_removed(instance.pk)
+
+
+def update_agent_count_on_delete(sender, instance, **kwargs):
+    counters.add({counters.AGENTS: counters.agent_delta(instance.role, None)})
+
+
+# Agent, Admin, ... are proxies of the user model and send signals under their own
+# class, so connect to each of them rather than to every model's saves
+for user_model in (model for model in apps.get_models() if issubclass(model, get_user_model())):
+    pre_save.connect(remember_user_role, sender=user_model)
+    post_save.connect(update_agent_count_on_save, sender=user_model)
+    pre_delete.connect(release_deleted_users_shops, sender=user_model)
+    post_delete.connect(update_agent_count_on_delete, sender=user_model)
@@ -0,0 +1,98 @@
+# shops/sync.py
+"""
+Delta sync for offline-first clients.
+
+A sync token is an opaque, URL-safe string holding:
+- the (date_updated, id) position of the last shop change the client has seen,
+- the id of the last DELETE ActivityLog row (tombstone) the client has seen,
+- when the sync (its first page) was served, and whether the token continues it.
+
+date_updated is stamped before the write commits, so a change can become visible
+after a sync whose cursor is already past its timestamp. A new sync therefore starts
+SHOPS_SYNC_SAFETY_WINDOW seconds before the previous one was served, and may send
+shops the client already has again: clients upsert by id. Pages within one sync
+(has_more) continue exactly where the previous page stopped.
+"""
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ActivityLog, Shop
+
+DEFAULT_SAFETY_WINDOW = 120  # seconds
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def safety_window():
+    return timedelta(seconds=getattr(settings, "SHOPS_SYNC_SAFETY_WINDOW", DEFAULT_SAFETY_WINDOW))
+
+
+def encode_token(updated, shop_id, log_id, served=None, more=False):
+    payload = {
+        "t": updated.isoformat() if updated else None, "s": shop_id, "l": log_id,
+        "n": served.isoformat() if served else None, "m": int(more),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    """(updated, shop_id, log_id, served, more); tokens from before `served` read as served at `updated`."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        updated = parse_datetime(payload["t"]) if payload["t"] else None
+        served = parse_datetime(payload["n"]) if payload.get("n") else updated
+        return updated, int(payload["s"] or 0), int(payload["l"] or 0), served, bool(payload.get("m"))
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidSyncToken("Invalid sync token.") from e
+
+
+def changes_since(user, token=None, limit=500, queryset=None):
+    """
+    Shops created/updated after the token (oldest first) and ids of shops deleted
+    after it, at most `limit` of each. Returns (shops, deleted_ids, next_token, has_more).
+    """
+    is_agent = user.role == user.Role.AGENT
+    shops = queryset if queryset is not None else Shop.objects.all()
+    tombstones = ActivityLog.objects.filter(action_type='DELETE', shop_id_snapshot__isnull=False)
+    if is_agent:
+        shops = shops.filter(created_by=user)
+        tombstones = tombstones.filter(changes__created_by=user.id)
+
+    served = timezone.now()
+    if token:
+        updated, shop_id, log_id, previous_served, more = decode_token(token)
+        if more:
+            served = previous_served  # same sync: keep its start for the next one's window
+        elif updated is not None and previous_served is not None:
+            rewind = previous_served - safety_window()
+            if rewind < updated:
+                updated, shop_id = rewind, 0
+        if updated is not None:
+            shops = shops.filter(Q(date_updated__gt=updated) | Q(date_updated=updated, id__gt=shop_id))
+        deleted = list(tombstones.filter(id__gt=log_id).order_by('id').values_list('id', 'shop_id_snapshot')[:limit + 1])
+    else:
+        # Full sync: nothing to delete locally, start tombstones from the newest one
+        updated, shop_id = None, 0
+        log_id = ActivityLog.objects.filter(action_type='DELETE').aggregate(last=Max('id'))['last'] or 0
+        deleted = []
+
+    page = list(shops.order_by('date_updated', 'id')[:limit + 1])
+    has_more = len(page) > limit or len(deleted) > limit
+    page, deleted = page[:limit], deleted[:limit]
+
+    if page:
+        updated, shop_id = page[-1].date_updated, page[-1].id
+    if deleted:
+        log_id = deleted[-1][0]
+
+    deleted_ids = [deleted_shop_id for _, deleted_shop_id in deleted]
+    return page, deleted_ids, encode_token(updated, shop_id, log_id, served, has_more), has_more
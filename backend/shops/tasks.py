@@ -0,0 +1,134 @@
+# shops/tasks.py
+"""Background job handlers (registered with shops.jobs at app start-up)."""
+from django.db import transaction
+from django.utils import timezone
+
+from . import jobs, rollups
+from .models import Shop, ShopPhoto
+from .photos import discard_staged_file, stage_photos, upload_staged
+from .services import GEOCODE_ERROR_VALUES, get_local_location_details, get_location_details
+
+GEOCODE_SHOP = "geocode_shop"
+UPLOAD_PHOTO = "upload_photo"
+
+
+def prepare_geocoding(shop):
+    """
+    Set the geocode fields on an unsaved shop: points inside the offline boundary
+    index are resolved immediately, anything else is left PENDING for the worker.
+    """
+    if shop.latitude is None or shop.longitude is None:
+        return
+    location = get_local_location_details(shop.latitude, shop.longitude)
+    if location is None:
+        shop.geocode_status = Shop.GeocodeStatus.PENDING
+    else:
+        shop.state = location["state"]
+        shop.local_government_area = location["local_government_area"]
+        shop.geocode_status = Shop.GeocodeStatus.RESOLVED
+
+
+def enqueue_geocoding(shops):
+    """Queue the shops that are still geocode-pending; call inside the write transaction."""
+    shop_ids = [shop.id for shop in shops if shop.geocode_status == Shop.GeocodeStatus.PENDING]
+    if shop_ids:
+        jobs.enqueue_many(GEOCODE_SHOP, [{"shop_id": shop_id} for shop_id in shop_ids])
+
+
+@jobs.register(GEOCODE_SHOP, batch_size=50)
+def geocode_shops(batch):
+    """Resolve state/LGA for a batch of shops, one lookup per distinct coordinate."""
+    jobs_by_shop = {job.payload.get("shop_id"): job for job in batch}
+    shops = Shop.objects.filter(id__in=jobs_by_shop, geocode_status=Shop.GeocodeStatus.PENDING).only(
+        "id", "latitude", "longitude"
+    )
+
+    # shop id -> (coordinates looked up, fields to write)
+    errors, locations, outcomes = {}, {}, {}
+    for shop in shops:
+        job = jobs_by_shop[shop.id]
+        # A retry follows an upstream error that is negative-cached for longer than the
+        # backoff, so it skips the cached failure instead of spending an attempt on it
+        retry = job.attempts > 1
+        key = (shop.latitude, shop.longitude, retry)
+        if key not in locations:
+            locations[key] = get_location_details(shop.latitude, shop.longitude, use_negative_cache=not retry)
+        location = locations[key]
+
+        if location.get("state") in GEOCODE_ERROR_VALUES:
+            errors[job.id] = f"Geocoding failed: {location.get('state')}"
+            if job.attempts >= jobs.MAX_ATTEMPTS:
+                outcomes[shop.id] = (shop.latitude, shop.longitude), {"geocode_status": Shop.GeocodeStatus.FAILED}
+            continue
+
+        outcomes[shop.id] = (shop.latitude, shop.longitude), {
+            "state": location.get("state"),
+            "local_government_area": location.get("local_government_area"),
+            "geocode_status": Shop.GeocodeStatus.RESOLVED,
+        }
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Re-read under lock, so an edit made since the lookup is not overwritten and the
+        # rollup deltas start from the current values. A shop that moved is looked up again.
+        locked = (
+            Shop.objects.select_for_update()
+            .filter(id__in=outcomes, geocode_status=Shop.GeocodeStatus.PENDING)
+            .only("id", "latitude", "longitude", "local_government_area", "geocode_status", *rollups.ROLLUP_MODEL_FIELDS)
+        )
+        resolved = []
+        for shop in locked:
+            coordinates, values = outcomes[shop.id]
+            if (shop.latitude, shop.longitude) != coordinates:
+                errors[jobs_by_shop[shop.id].id] = "Shop moved during geocoding"
+                continue
+            for field, value in values.items():
+                setattr(shop, field, value)
+            shop.date_updated = now  # bulk_update skips auto_now; sync/ETags must see the change
+            resolved.append(shop)
+
+        Shop.objects.bulk_update(
+            resolved, ["state", "local_government_area", "geocode_status", "date_updated"], batch_size=500
+        )
+        # Captures move from the unknown-location bucket to the resolved state/LGA
+        rollups.record_changes([(rollups.loaded_snapshot(shop), rollups.snapshot(shop)) for shop in resolved])
+    return errors
+
+
+def capture_photos(shop, files):
+    """Stage uploaded photos and queue their upload; call inside the write transaction."""
+    if not files:
+        return []
+    photos = stage_photos(shop, files)
+    jobs.enqueue_many(UPLOAD_PHOTO, [{"photo_id": photo.id} for photo in photos])
+    return photos
+
+
+@jobs.register(UPLOAD_PHOTO, batch_size=10)
+def upload_photos(batch):
+    """Push a batch of staged photos to SHOP_PHOTO_STORAGE in parallel."""
+    jobs_by_photo = {job.payload.get("photo_id"): job for job in batch}
+    photos = list(ShopPhoto.objects.filter(id__in=jobs_by_photo, status=ShopPhoto.Status.PROCESSING))
+    failures = upload_staged(photos)
+
+    errors, finished = {}, []
+    for photo in photos:
+        job = jobs_by_photo[photo.id]
+        error = failures.get(photo.id)
+        if error is not None:
+            errors[job.id] = f"Upload failed: {error!r}"
+            if job.attempts < jobs.MAX_ATTEMPTS:
+                continue
+            photo.status = ShopPhoto.Status.FAILED
+        else:
+            photo.status = ShopPhoto.Status.READY
+        discard_staged_file(photo.staged_path)
+        photo.staged_path = ""
+        finished.append(photo)
+
+    with transaction.atomic():
+        ShopPhoto.objects.bulk_update(finished, ["photo", "thumbnail", "status", "staged_path", *ShopPhoto.PHASH_FIELDS])
+        # Photo URLs and status are part of the shop's representation: move date_updated
+        # so ETags change and delta sync resends the shop
+        Shop.objects.filter(id__in={photo.shop_id for photo in finished}).update(date_updated=timezone.now())
+    return errors
@@ -1,3 +1,1562 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from cloudinary_storage.storage import MediaCloudinaryStorage
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from accounts.models import Agent, User
+from . import assets, boundaries, clusters, counters, duplicates, geocache, jobs, opencage, rollups, storage
+from .models import (
+    Shop, ShopPhoto, ActivityLog, BackgroundJob, GeocodeCacheEntry, PendingAssetDeletion, ShopCounter, DailyShopStats,
+)
+from .imaging import dhash
+from .management.commands import geocode_backfill
+from .pagination import ShopCursorPagination
+from .services import get_location_details
+from .uploads import ShopPhotoUploadHandler
+
+
+class QueryBudgetMixin:
+    """
+    Test helper that fails when a block of code runs more SQL queries than allowed.
+    Use it to pin the per-endpoint query budget so N+1 regressions fail CI:
+
+        with self.assertMaxQueries(3):
+            self.client.get("/api/shops/")
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = "\n".join(
+                f"{i}. {query['sql']}" for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(f"{executed} queries executed, budget is {budget}:\n{queries}")
+
+
+class ShopFixturesMixin:
+    """Creates an admin, an agent and helpers for making shops with photos."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(email="admin@taja.test", password="pass", role=User.Role.ADMIN)
+        self.agent = Agent.objects.create_user(email="agent@taja.test", password="pass")
+
+    def make_shops(self, count, photos_per_shop=2, **fields):
+        shops = []
+        for i in range(count):
+            shop = Shop.objects.create(**{
+                "name": f"Shop {Shop.objects.count() + 1}",
+                "created_by": self.agent,
+                "latitude": "6.500000",
+                "longitude": "3.300000",
+                **fields,
+            })
+            for n in range(photos_per_shop):
+                ShopPhoto.objects.create(shop=shop, photo=f"shop_photos/shop_{shop.id}_{n}.jpg")
+            shops.append(shop)
+        return shops
+
+
+class ShopQueryBudgetTests(QueryBudgetMixin, ShopFixturesMixin, APITestCase):
+    """Listing endpoints must cost a constant number of queries, however many shops they return."""
+
+    LIST_BUDGET = 3  # version aggregate, shops (+ owner/created_by joins) and one photo prefetch
+
+    def test_shop_list_query_budget(self):
+        self.client.force_authenticate(self.admin)
+        self.make_shops(3)
+        with self.assertMaxQueries(self.LIST_BUDGET):
+            response = self.client.get("/api/shops/")
+        self.assertEqual(len(response.data["results"]), 3)
+
+        self.make_shops(20)
+        with self.assertMaxQueries(self.LIST_BUDGET):
+            response = self.client.get("/api/shops/")
+        self.assertEqual(len(response.data["results"]), 23)
+        self.assertEqual(len(response.data["results"][0]["photos"]), 2)
+
+    def test_agent_scoped_list_query_budget(self):
+        self.client.force_authenticate(self.agent)
+        self.make_shops(10)
+        with self.assertMaxQueries(self.LIST_BUDGET):
+            response = self.client.get("/api/shops/?verification_status=PENDING")
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertEqual(response.data["results"][0]["created_by_id"], self.agent.id)
+
+    def test_my_shops_query_budget(self):
+        self.client.force_authenticate(self.agent)
+        self.make_shops(10)
+        with self.assertMaxQueries(self.LIST_BUDGET):
+            response = self.client.get("/api/shops/my-shops/")
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_shop_detail_query_budget(self):
+        self.client.force_authenticate(self.admin)
+        shop = self.make_shops(1, photos_per_shop=5)[0]
+        with self.assertMaxQueries(self.LIST_BUDGET):
+            response = self.client.get(f"/api/shops/{shop.id}/")
+        self.assertEqual(len(response.data["photos"]), 5)
+
+    def test_sparse_fieldset_skips_unrequested_relations(self):
+        self.client.force_authenticate(self.admin)
+        self.make_shops(5)
+        with self.assertMaxQueries(2):
+            response = self.client.get("/api/shops/?fields=name,state")
+        self.assertEqual(set(response.data["results"][0]), {"id", "name", "state"})
+
+        with self.assertMaxQueries(self.LIST_BUDGET):
+            response = self.client.get("/api/shops/?fields=name&expand=photos")
+        self.assertEqual(set(response.data["results"][0]), {"id", "name", "photos"})
+
+    def test_sparse_fieldset_always_keeps_the_id(self):
+        self.client.force_authenticate(self.admin)
+        shop = self.make_shops(1, photos_per_shop=0)[0]
+        response = self.client.get(f"/api/shops/{shop.id}/?fields=name")
+        self.assertEqual(response.data, {"id": shop.id, "name": shop.name})
+
+    def test_unknown_sparse_fields_or_expansions_are_rejected(self):
+        self.client.force_authenticate(self.admin)
+        self.make_shops(1, photos_per_shop=0)
+        response = self.client.get("/api/shops/?fields=name,password")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("password", str(response.data["fields"]))
+
+        response = self.client.get("/api/shops/?fields=name&expand=created_by")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("created_by", str(response.data["expand"]))
+
+        self.client.force_authenticate(self.agent)
+        response = self.client.get("/api/shops/my-shops/?fields=uploaded_photos")
+        self.assertEqual(response.status_code, 400)
+
+    def test_my_shops_honours_the_sparse_fieldset(self):
+        self.client.force_authenticate(self.agent)
+        self.make_shops(3)
+        with self.assertMaxQueries(2):
+            response = self.client.get("/api/shops/my-shops/?fields=name,state")
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertEqual(set(response.data["results"][0]), {"id", "name", "state"})
+
+        response = self.client.get("/api/shops/my-shops/?fields=name&expand=photos")
+        self.assertEqual(set(response.data["results"][0]), {"id", "name", "photos"})
+        self.assertEqual(len(response.data["results"][0]["photos"]), 2)
+
+    def test_activity_log_query_budget(self):
+        self.client.force_authenticate(self.admin)
+        for shop in self.make_shops(5, photos_per_shop=0):
+            ActivityLog.objects.create(actor=self.agent, action_type="CREATE", shop=shop, shop_name_snapshot=shop.name)
+        with self.assertMaxQueries(1):
+            response = self.client.get("/api/shops/logs/")
+        self.assertEqual(len(response.data), 5)
+
+
+class ShopPaginationTests(ShopFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def test_cursor_pages_stay_stable_across_inserts(self):
+        shops = self.make_shops(5, photos_per_shop=0)
+        first = self.client.get("/api/shops/", {"page_size": 2})
+        self.assertNotIn("count", first.data)  # no COUNT(*) per page
+        seen = [shop["id"] for shop in first.data["results"]]
+
+        # Shops captured while paging sort before the cursor: no repeats, no gaps
+        self.make_shops(2, photos_per_shop=0)
+        url = first.data["next"]
+        while url:
+            page = self.client.get(url)
+            seen += [shop["id"] for shop in page.data["results"]]
+            url = page.data["next"]
+        self.assertEqual(seen, [shop.id for shop in reversed(shops)])
+
+    def test_page_size_is_capped(self):
+        self.make_shops(3, photos_per_shop=0)
+        response = self.client.get("/api/shops/", {"page_size": 10_000})
+        self.assertEqual(len(response.data["results"]), 3)
+        with mock.patch.object(ShopCursorPagination, "max_page_size", 2):
+            self.assertEqual(len(self.client.get("/api/shops/", {"page_size": 10_000}).data["results"]), 2)
+
+
+class ShopSearchTests(ShopFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.bakery = Shop.objects.create(
+            name="Mama Put Bakery", address="12 Allen Avenue", state="Lagos", local_government_area="Ikeja"
+        )
+        self.kitchen = Shop.objects.create(
+            name="Allen Kitchen", address="3 Market Rd", description="Bakery and pastries", state="Lagos"
+        )
+        Shop.objects.create(name="Kano Provisions", address="Fagge Rd", state="Kano")
+
+    def search(self, query):
+        response = self.client.get("/api/shops/", {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [shop["id"] for shop in response.data["results"]]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.search("bakery"), [self.bakery.id, self.kitchen.id])
+
+    def test_prefix_terms_across_fields(self):
+        self.assertEqual(self.search("ikej bak"), [self.bakery.id])
+
+    def test_index_follows_shop_writes(self):
+        self.bakery.name = "Mama Put Canteen"
+        self.bakery.save()
+        self.assertEqual(self.search("canteen"), [self.bakery.id])
+        self.bakery.delete()
+        self.assertEqual(self.search("canteen"), [])
+
+    def test_query_without_terms_returns_nothing(self):
+        self.assertEqual(self.search('"('), [])
+
+
+class ShopMapTests(QueryBudgetMixin, ShopFixturesMixin, APITestCase):
+    LAGOS_BBOX = "3.2,6.4,3.4,6.6"
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_authenticate(self.admin)
+
+    def clusters(self, bbox=LAGOS_BBOX, zoom=10):
+        response = self.client.get("/api/shops/map/clusters/", {"bbox": bbox, "zoom": zoom})
+        self.assertEqual(response.status_code, 200)
+        return response.data["clusters"]
+
+    def listed(self, **params):
+        response = self.client.get("/api/shops/", params)
+        self.assertEqual(response.status_code, 200)
+        return {shop["id"] for shop in response.data["results"]}
+
+    def test_bbox_and_near_filters(self):
+        (lagos,) = self.make_shops(1, photos_per_shop=0)
+        (nearby,) = self.make_shops(1, photos_per_shop=0, latitude="6.505000", longitude="3.300000")  # ~556m north
+        self.make_shops(1, photos_per_shop=0, latitude="9.050000", longitude="7.490000")
+
+        self.assertEqual(self.listed(bbox=self.LAGOS_BBOX), {lagos.id, nearby.id})
+        self.assertEqual(self.listed(near="6.5,3.3", radius_m=500), {lagos.id})
+        self.assertEqual(self.listed(near="6.5,3.3", radius_m=1000), {lagos.id, nearby.id})
+
+    def test_bbox_across_the_antimeridian(self):
+        (east,) = self.make_shops(1, photos_per_shop=0, latitude="-17.000000", longitude="179.800000")
+        (west,) = self.make_shops(1, photos_per_shop=0, latitude="-17.000000", longitude="-179.800000")
+        self.make_shops(1, photos_per_shop=0, latitude="-17.000000", longitude="0.000000")
+
+        self.assertEqual(self.listed(bbox="179,-18,-179,-16"), {east.id, west.id})
+        self.assertEqual(self.listed(near="-17,180", radius_m=30_000), {east.id, west.id})
+
+    def test_bad_spatial_parameters_are_rejected(self):
+        for params in ({"bbox": "3.2,6.4,3.4"}, {"bbox": "a,b,c,d"}, {"bbox": "3.2,6.6,3.4,6.4"},
+                       {"bbox": "3.2,6.4,181,6.6"}, {"near": "6.5"}, {"near": "91,3.3"},
+                       {"near": "6.5,3.3", "radius_m": 0}, {"near": "6.5,3.3", "radius_m": 10**6}):
+            response = self.client.get("/api/shops/", params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_points_feed_layouts_and_agent_scoping(self):
+        mine = self.make_shops(2, photos_per_shop=0)
+        mine[1].verification_status = Shop.VerificationStatus.VERIFIED
+        mine[1].save()
+        other = Agent.objects.create_user(email="other@taja.test", password="pass")
+        (theirs,) = self.make_shops(1, photos_per_shop=0, created_by=other)
+        self.make_shops(1, photos_per_shop=0, latitude=None, longitude=None)  # not on the map
+
+        data = self.client.get("/api/shops/map/points/").data
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(data["status_codes"], Shop.VerificationStatus.values)
+
+        self.client.force_authenticate(self.agent)
+        with self.assertMaxQueries(3):
+            data = self.client.get("/api/shops/map/points/").data
+        order = sorted(range(data["count"]), key=data["id"].__getitem__)
+        self.assertEqual([data["id"][i] for i in order], [shop.id for shop in mine])
+        self.assertEqual({(data["lat"][i], data["lon"][i]) for i in order}, {(6.5, 3.3)})
+        self.assertEqual([data["status_codes"][data["status"][i]] for i in order], ["PENDING", "VERIFIED"])
+
+        body = self.client.get("/api/shops/map/points/", {"format": "bin"}).content
+        magic, version, count = struct.unpack_from("<4sBI", body)
+        self.assertEqual((magic, version, count), (b"TPTS", 1, 2))
+        offset = struct.calcsize("<4sBI")
+        ids = struct.unpack_from(f"<{count}q", body, offset)
+        lats = struct.unpack_from(f"<{count}d", body, offset + 8 * count)
+        lons = struct.unpack_from(f"<{count}d", body, offset + 16 * count)
+        statuses = struct.unpack_from(f"<{count}B", body, offset + 24 * count)
+        self.assertEqual(len(body), offset + 25 * count)
+        self.assertEqual(
+            (list(ids), list(lats), list(lons), list(statuses)),
+            (data["id"], data["lat"], data["lon"], data["status"]),
+        )
+        self.assertNotIn(theirs.id, ids)
+
+    def test_cluster_counts_and_status_breakdown(self):
+        self.make_shops(3, photos_per_shop=0)
+        self.make_shops(1, photos_per_shop=0, verification_status=Shop.VerificationStatus.VERIFIED)
+        self.make_shops(2, photos_per_shop=0, latitude="9.050000", longitude="7.490000")  # Abuja, outside the box
+
+        (cluster,) = self.clusters()
+        self.assertEqual(cluster["count"], 4)
+        self.assertEqual((cluster["latitude"], cluster["longitude"]), (6.5, 3.3))
+        self.assertEqual(cluster["status"], {"PENDING": 3, "VERIFIED": 1, "REJECTED": 0})
+
+        # Finer zooms split the same shops into smaller cells
+        self.make_shops(1, photos_per_shop=0, latitude="6.550000", longitude="3.380000")
+        self.assertEqual(sorted(cluster["count"] for cluster in self.clusters(zoom=14)), [1, 4])
+
+    def test_writes_invalidate_cached_tiles(self):
+        (shop,) = self.make_shops(1, photos_per_shop=0)
+        self.assertEqual(self.clusters()[0]["count"], 1)
+
+        with self.assertNumQueries(0):  # served from the cache
+            self.clusters()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_shops(1, photos_per_shop=0)
+        self.assertEqual(self.clusters()[0]["count"], 2)
+
+        shop.latitude, shop.longitude = "9.050000", "7.490000"  # moved out of the box
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.save()
+        self.assertEqual(self.clusters()[0]["count"], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Shop.objects.all().delete()
+        self.assertEqual(self.clusters(), [])
+
+    def test_process_local_cache_expires_quickly(self):
+        self.assertEqual(clusters.cache_ttl(), clusters.LOCAL_CACHE_TTL)
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}):
+            self.assertEqual(clusters.cache_ttl(), clusters.CACHE_TTL)
+
+    def test_cluster_parameters_are_validated(self):
+        for params in ({"bbox": "3.2,6.4,3.4", "zoom": 10}, {"bbox": self.LAGOS_BBOX, "zoom": 21},
+                       {"bbox": self.LAGOS_BBOX, "zoom": "x"}, {"bbox": "-180,-90,180,90", "zoom": 20}):
+            self.assertEqual(self.client.get("/api/shops/map/clusters/", params).status_code, 400)
+
+
+class ConditionalGetTests(QueryBudgetMixin, ShopFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.shop = self.make_shops(3)[0]
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        with self.assertMaxQueries(2):  # only the version aggregates
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], etag)
+        return etag
+
+    def test_list_and_detail_return_304_until_a_shop_changes(self):
+        list_etag = self.assertRevalidates("/api/shops/")
+        detail_etag = self.assertRevalidates(f"/api/shops/{self.shop.id}/")
+
+        self.shop.name = "Renamed"
+        self.shop.save()
+        self.assertEqual(self.client.get("/api/shops/", HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.assertEqual(
+            self.client.get(f"/api/shops/{self.shop.id}/", HTTP_IF_NONE_MATCH=detail_etag).status_code, 200
+        )
+
+    def test_delete_changes_list_etag(self):
+        etag = self.assertRevalidates("/api/shops/")
+        Shop.objects.exclude(pk=self.shop.pk).first().delete()
+        self.assertEqual(self.client.get("/api/shops/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_has_no_last_modified_to_go_stale_on_delete(self):
+        response = self.client.get("/api/shops/")
+        self.assertNotIn("Last-Modified", response)
+        Shop.objects.exclude(pk=self.shop.pk).first().delete()
+        since = http_date(time.time() + 60)
+        self.assertEqual(self.client.get("/api/shops/", HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_dashboard_and_my_shops(self):
+        self.assertRevalidates("/api/shops/stats/")
+        self.client.force_authenticate(self.agent)
+        self.assertRevalidates("/api/shops/my-shops/")
+
+
+@override_settings(SHOPS_SYNC_SAFETY_WINDOW=0)
+class ShopSyncTests(ShopFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.agent)
+        self.shops = self.make_shops(3, photos_per_shop=0)
+
+    def sync(self, token=None, **params):
+        if token:
+            params["since"] = token
+        response = self.client.get("/api/shops/sync/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_then_delta_sync(self):
+        full = self.sync()
+        self.assertEqual([shop["id"] for shop in full["shops"]], [shop.id for shop in self.shops])
+        self.assertEqual(full["deleted"], [])
+
+        empty = self.sync(full["next_token"])
+        self.assertEqual((empty["shops"], empty["deleted"]), ([], []))
+
+        updated, deleted = self.shops[0], self.shops[1]
+        self.client.patch(f"/api/shops/{updated.id}/", {"name": "Updated"}, format="json")
+        self.client.delete(f"/api/shops/{deleted.id}/")
+
+        delta = self.sync(empty["next_token"])
+        self.assertEqual([shop["id"] for shop in delta["shops"]], [updated.id])
+        self.assertEqual(delta["deleted"], [deleted.id])
+        self.assertEqual(self.sync(delta["next_token"])["shops"], [])
+
+    def test_paging_with_limit(self):
+        first = self.sync(limit=2)
+        self.assertTrue(first["has_more"])
+        rest = self.sync(first["next_token"], limit=2)
+        self.assertFalse(rest["has_more"])
+        self.assertEqual(len(first["shops"]) + len(rest["shops"]), 3)
+
+    def test_late_commits_inside_the_safety_window_are_sent(self):
+        token = self.sync()["next_token"]
+        # A write stamped before that sync but committed after it
+        late = self.shops[0]
+        Shop.objects.filter(pk=late.pk).update(name="Late", date_updated=self.shops[-1].date_updated - timedelta(seconds=1))
+
+        self.assertEqual(self.sync(token)["shops"], [])  # without a window it is lost
+        with override_settings(SHOPS_SYNC_SAFETY_WINDOW=60):
+            delta = self.sync(token)
+            self.assertIn(late.id, [shop["id"] for shop in delta["shops"]])
+            # Pages of one sync still continue exactly
+            first = self.sync(token, limit=1)
+            self.assertTrue(first["has_more"])
+            rest = self.sync(first["next_token"], limit=10)
+            self.assertEqual(len(first["shops"]) + len(rest["shops"]), 3)
+
+    def test_tombstones_are_paged(self):
+        token = self.sync()["next_token"]
+        for shop in self.shops:
+            self.client.delete(f"/api/shops/{shop.id}/")
+
+        first = self.sync(token, limit=2)
+        self.assertEqual((first["deleted"], first["has_more"]), ([shop.id for shop in self.shops[:2]], True))
+        rest = self.sync(first["next_token"], limit=2)
+        self.assertEqual((rest["deleted"], rest["has_more"]), ([self.shops[2].id], False))
+
+    def test_other_agents_changes_are_not_synced(self):
+        token = self.sync()["next_token"]
+        other = Agent.objects.create_user(email="other@taja.test", password="pass")
+        Shop.objects.create(name="Not mine", created_by=other)
+        self.client.force_authenticate(self.admin)
+        self.client.delete(f"/api/shops/{self.shops[2].id}/")
+
+        self.client.force_authenticate(self.agent)
+        delta = self.sync(token)
+        self.assertEqual((delta["shops"], delta["deleted"]), ([], [self.shops[2].id]))
+
+    def test_invalid_token(self):
+        response = self.client.get("/api/shops/sync/", {"since": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkCaptureTests(QueryBudgetMixin, ShopFixturesMixin, APITestCase):
+    def test_partial_failure_is_reported_per_item(self):
+        self.client.force_authenticate(self.agent)
+        items = [{"name": f"Bulk {i}", "latitude": "6.5", "longitude": "3.3"} for i in range(20)]
+        items.insert(3, {"latitude": "6.5"})
+
+        with self.assertMaxQueries(7):  # savepoint, shop/log/geocode job inserts, 2 rollup upserts, release
+            response = self.client.post("/api/shops/bulk/", items, format="json")
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data["created"], response.data["failed"]), (20, 1))
+        self.assertEqual(response.data["results"][3]["status"], "error")
+        self.assertIn("name", response.data["results"][3]["errors"])
+
+        created_ids = [result["id"] for result in response.data["results"] if result["status"] == "created"]
+        shops = Shop.objects.filter(id__in=created_ids)
+        self.assertEqual(shops.filter(created_by=self.agent, geohash__isnull=False).count(), 20)
+        self.assertEqual(ActivityLog.objects.filter(shop_id_snapshot__in=created_ids, action_type="CREATE").count(), 20)
+
+
+class BulkReviewTests(QueryBudgetMixin, ShopFixturesMixin, APITestCase):
+    def test_reject_then_verify_applies_is_active_rules(self):
+        shops = self.make_shops(10, photos_per_shop=0)
+        ids = [shop.id for shop in shops]
+        self.client.force_authenticate(self.admin)
+
+        with self.assertMaxQueries(7):  # savepoint, select for update, update, log insert, 2 rollup upserts, release
+            response = self.client.post(
+                "/api/shops/bulk-review/",
+                {"ids": ids + [999999], "verification_status": "REJECTED", "rejection_reason": "Blurry photos"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((len(response.data["updated"]), response.data["not_found"]), (10, [999999]))
+        self.assertEqual(Shop.objects.filter(id__in=ids, is_active=False, rejection_reason="Blurry photos").count(), 10)
+        self.assertEqual(ActivityLog.objects.filter(action_type="UPDATE", shop_id__in=ids).count(), 10)
+
+        response = self.client.post(
+            "/api/shops/bulk-review/", {"ids": ids, "verification_status": "VERIFIED"}, format="json"
+        )
+        self.assertEqual(Shop.objects.filter(id__in=ids, is_active=True, rejection_reason="").count(), 10)
+
+        response = self.client.post(
+            "/api/shops/bulk-review/", {"ids": ids, "verification_status": "VERIFIED"}, format="json"
+        )
+        self.assertEqual((response.data["updated"], len(response.data["unchanged"])), ([], 10))
+
+    def test_agents_cannot_review(self):
+        shop = self.make_shops(1, photos_per_shop=0)[0]
+        self.client.force_authenticate(self.agent)
+        response = self.client.post(
+            "/api/shops/bulk-review/", {"ids": [shop.id], "verification_status": "VERIFIED"}, format="json"
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(SHOPS_BOUNDARIES_PATH=None)
+class DashboardCounterTests(QueryBudgetMixin, ShopFixturesMixin, APITestCase):
+    def overview(self, **params):
+        self.client.force_authenticate(self.admin)
+        with self.assertMaxQueries(1):
+            response = self.client.get("/api/shops/stats/", params)
+        return response.data
+
+    def test_write_paths_keep_counters_exact(self):
+        self.client.force_authenticate(self.agent)
+        first = self.client.post("/api/shops/", {"name": "Single"}, format="json").data["id"]
+        self.client.post("/api/shops/bulk/", [{"name": f"Bulk {i}"} for i in range(4)], format="json")
+        self.client.patch(f"/api/shops/{first}/", {"name": "Renamed"}, format="json")
+        bulk_ids = list(Shop.objects.exclude(id=first).values_list("id", flat=True))
+
+        self.client.force_authenticate(self.admin)
+        self.client.patch(f"/api/shops/{first}/", {"verification_status": "VERIFIED"}, format="json")
+        self.client.post(
+            "/api/shops/bulk-review/", {"ids": bulk_ids[:2], "verification_status": "REJECTED"}, format="json"
+        )
+        self.client.delete(f"/api/shops/{bulk_ids[3]}/")
+        Agent.objects.create_user(email="agent2@taja.test", password="pass")
+        self.admin.first_name = "Renamed"
+        self.admin.save()
+
+        data = self.overview(agent_id=self.agent.id)
+        self.assertEqual(data["global_overview"], {
+            "total_shops": 4,
+            "active_shops": 1,  # shops start inactive; only the verified one is active
+            "total_agents": 2,
+            "pending_reviews": 1,
+            "rejected_reviews": 2,
+            "verified_shops": 1,
+            "total_captured_by_agents": 4,
+            "shops_captured_today": 4,
+        })
+        self.assertEqual(
+            data["agent_performance"], {"total_captured": 4, "captured_today": 4, "pending": 1, "rejected": 2}
+        )
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_updates_and_deletes_lock_the_shop_row(self):
+        shop = self.make_shops(1, photos_per_shop=0)[0]
+        self.client.force_authenticate(self.admin)
+        with mock.patch(
+            "django.db.models.query.QuerySet.select_for_update", autospec=True, side_effect=lambda qs, **kwargs: qs
+        ) as lock:
+            self.client.get(f"/api/shops/{shop.id}/")
+            lock.assert_not_called()
+            self.client.patch(f"/api/shops/{shop.id}/", {"verification_status": "VERIFIED"}, format="json")
+            lock.assert_called_with(mock.ANY, of=("self",))
+            lock.reset_mock()
+            self.client.delete(f"/api/shops/{shop.id}/")
+            lock.assert_called_with(mock.ANY, of=("self",))
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_deleting_an_agent_moves_their_shops_out_of_agent_counters(self):
+        self.make_shops(2, photos_per_shop=0)
+        agent_id = self.agent.id
+        self.agent.delete()
+
+        self.assertEqual(counters.reconcile(dry_run=True), {})
+        overview = self.overview()["global_overview"]
+        self.assertEqual((overview["total_shops"], overview["total_captured_by_agents"]), (2, 0))
+        self.assertEqual(self.overview(agent_id=agent_id)["agent_performance"]["total_captured"], 0)
+
+    def test_writes_from_different_threads_use_separate_shards(self):
+        with mock.patch("shops.counters._shard", return_value=3):
+            self.make_shops(2, photos_per_shop=0)
+        with mock.patch("shops.counters._shard", return_value=7):
+            self.make_shops(1, photos_per_shop=0)
+
+        self.assertEqual(
+            dict(ShopCounter.objects.filter(name="shops").values_list("shard", "value")), {3: 2, 7: 1}
+        )
+        self.assertEqual(counters.read(["shops"])[0], {"shops": 3})
+        self.assertEqual(self.overview()["global_overview"]["total_shops"], 3)
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_reconcile_repairs_drift(self):
+        self.make_shops(3, photos_per_shop=0)
+        Shop.objects.filter(id=Shop.objects.first().id).update(verification_status="VERIFIED")  # bypasses signals
+        ShopCounter.objects.filter(name="shops").update(value=99)
+
+        out = io.StringIO()
+        call_command("reconcile_shop_counters", stdout=out)
+
+        self.assertIn("shops: 99 -> 3", out.getvalue())
+        self.assertIn("shops:PENDING: 3 -> 2", out.getvalue())
+        overview = self.overview()["global_overview"]
+        self.assertEqual((overview["total_shops"], overview["verified_shops"]), (3, 1))
+        self.assertEqual(counters.reconcile(), {})
+
+
+class BackgroundGeocodingTests(ShopFixturesMixin, APITestCase):
+    LAGOS = {"state": "Lagos", "local_government_area": "Ikeja"}
+
+    def setUp(self):
+        super().setUp()
+        boundaries.reset_index()
+        self.addCleanup(boundaries.reset_index)
+
+    def capture(self):
+        self.client.force_authenticate(self.agent)
+        response = self.client.post("/api/shops/", {"name": "Corner Shop", "latitude": "6.6", "longitude": "3.35"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["geocode_status"], "PENDING")
+        return Shop.objects.get(pk=response.data["id"])
+
+    @mock.patch("shops.tasks.get_location_details", return_value=LAGOS)
+    def test_capture_is_geocoded_by_the_worker(self, lookup):
+        shop = self.capture()
+        lookup.assert_not_called()
+
+        self.assertEqual(jobs.run_pending(), 1)
+        shop.refresh_from_db()
+        self.assertEqual(
+            (shop.state, shop.local_government_area, shop.geocode_status), ("Lagos", "Ikeja", "RESOLVED")
+        )
+        self.assertEqual(BackgroundJob.objects.get().status, BackgroundJob.Status.DONE)
+
+    @mock.patch("shops.tasks.get_location_details")
+    def test_edits_made_during_the_lookup_are_not_overwritten(self, lookup):
+        moved, located = self.capture(), self.capture()
+
+        def edit_meanwhile(latitude, longitude, **kwargs):
+            if lookup.call_count == 1:
+                Shop.objects.filter(pk=moved.pk).update(latitude="9.05", longitude="7.49")
+                Shop.objects.filter(pk=located.pk).update(
+                    state="Ogun", local_government_area="Ifo", geocode_status=Shop.GeocodeStatus.RESOLVED
+                )
+            return self.LAGOS if lookup.call_count == 1 else {"state": "FCT", "local_government_area": "AMAC"}
+        lookup.side_effect = edit_meanwhile
+
+        jobs.run_pending()
+        located.refresh_from_db()
+        self.assertEqual((located.state, located.local_government_area), ("Ogun", "Ifo"))
+        moved.refresh_from_db()
+        self.assertEqual(moved.geocode_status, "PENDING")  # retried for the new position
+
+        BackgroundJob.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+        moved.refresh_from_db()
+        self.assertEqual((moved.state, moved.geocode_status), ("FCT", "RESOLVED"))
+        self.assertEqual(
+            sorted(DailyShopStats.objects.filter(captured__gt=0).values_list("state", "captured")),
+            [("", 1), ("FCT", 1)],  # the raw update to Ogun bypassed the rollup; only the job's writes count
+        )
+
+    @mock.patch("shops.tasks.get_location_details", return_value={"state": "API Error", "local_government_area": "API Error"})
+    def test_upstream_errors_are_retried_then_marked_failed(self, lookup):
+        shop = self.capture()
+        for attempt in range(jobs.MAX_ATTEMPTS):
+            BackgroundJob.objects.update(run_after=shop.date_created)  # skip the backoff
+            jobs.run_pending()
+
+        job = BackgroundJob.objects.get()
+        shop.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (BackgroundJob.Status.FAILED, jobs.MAX_ATTEMPTS))
+        self.assertEqual((shop.state, shop.geocode_status), (None, "FAILED"))
+        # Retries skip the negative-cached failure of the previous attempt
+        self.assertEqual(
+            [call.kwargs["use_negative_cache"] for call in lookup.call_args_list],
+            [True] + [False] * (jobs.MAX_ATTEMPTS - 1),
+        )
+
+
+    @mock.patch("shops.tasks.get_location_details")
+    def test_inline_worker_runs_due_retries_without_a_new_enqueue(self, lookup):
+        lookup.side_effect = [{"state": "API Error", "local_government_area": "API Error"}, self.LAGOS]
+        shop = self.capture()  # the on-commit wake-up never fires inside a test transaction
+        worker, waits = jobs._InlineWorker(), []
+
+        class Stop(Exception):
+            pass
+
+        def wait(timeout):
+            waits.append(timeout)
+            if len(waits) == 2:
+                raise Stop
+            BackgroundJob.objects.update(run_after=timezone.now())  # the backoff has passed
+
+        with mock.patch.object(worker._event, "wait", side_effect=wait), \
+                mock.patch("shops.jobs.close_old_connections"), self.assertRaises(Stop):
+            worker._run()
+
+        # It slept until the retry was due, then ran it by itself
+        self.assertAlmostEqual(waits[0], jobs.RETRY_BASE_DELAY.total_seconds(), delta=1)
+        self.assertEqual(waits[1], jobs.INLINE_POLL_INTERVAL)
+        self.assertEqual(lookup.call_count, 2)
+        shop.refresh_from_db()
+        self.assertEqual(shop.geocode_status, "RESOLVED")
+        self.assertEqual(BackgroundJob.objects.get().status, BackgroundJob.Status.DONE)
+
+@override_settings(SHOPS_BOUNDARIES_PATH=None)
+class TimeSeriesTests(QueryBudgetMixin, ShopFixturesMixin, APITestCase):
+    URL = "/api/shops/stats/timeseries/"
+
+    def setUp(self):
+        super().setUp()
+        boundaries.reset_index()
+        self.addCleanup(boundaries.reset_index)
+        self.today = timezone.localdate()
+
+    def series(self, **params):
+        self.client.force_authenticate(self.admin)
+        with self.assertMaxQueries(2):  # the rollup query, plus agent emails when split by agent
+            response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    @mock.patch("shops.tasks.get_location_details", return_value={"state": "Lagos", "local_government_area": "Ikeja"})
+    def test_write_paths_maintain_the_rollup(self, lookup):
+        self.client.force_authenticate(self.agent)
+        ids = [
+            self.client.post("/api/shops/", {"name": f"Shop {n}", "latitude": "6.6", "longitude": "3.35"}).data["id"]
+            for n in range(3)
+        ]
+        self.client.post("/api/shops/bulk/", [{"name": "No location"}], format="json")
+        self.assertEqual(self.series(dimension="state")[0], {
+            "bucket": self.today.isoformat(), "state": None, "captured": 4, "verified": 0, "rejected": 0,
+        })
+
+        jobs.run_pending()  # geocoding moves the captures into Lagos
+        self.client.force_authenticate(self.admin)
+        self.client.patch(f"/api/shops/{ids[0]}/", {"verification_status": "VERIFIED"}, format="json")
+        self.client.post("/api/shops/bulk-review/", {"ids": ids[1:], "verification_status": "REJECTED"}, format="json")
+        self.client.delete(f"/api/shops/{ids[2]}/")
+
+        today = self.today.isoformat()
+        self.assertEqual(self.series(dimension="state"), [
+            {"bucket": today, "state": None, "captured": 1, "verified": 0, "rejected": 0},
+            {"bucket": today, "state": "Lagos", "captured": 2, "verified": 1, "rejected": 2},
+        ])
+        self.assertEqual(self.series(dimension="agent"), [{
+            "bucket": today, "agent": self.agent.id, "captured": 3, "verified": 1, "rejected": 2,
+            "agent_email": self.agent.email,
+        }])
+
+        # A rebuild gives the same totals; the deleted shop's rejection just loses its location
+        call_command("rebuild_shop_stats", stdout=io.StringIO())
+        self.assertEqual(self.series(), [
+            {"bucket": today, "captured": 3, "verified": 1, "rejected": 2},
+        ])
+        self.assertEqual(
+            sorted(DailyShopStats.objects.values_list("state", "captured", "verified", "rejected")),
+            [("", 0, 0, 1), ("", 1, 0, 0), ("Lagos", 2, 1, 1)],
+        )
+
+    def test_deleting_an_agent_moves_their_captures_to_no_agent(self):
+        self.make_shops(2, photos_per_shop=0, state="Oyo")
+        self.agent.delete()
+
+        self.assertEqual(
+            list(DailyShopStats.objects.filter(captured__gt=0).values_list("state", "created_by_id", "captured")),
+            [("Oyo", 0, 2)],
+        )
+        self.assertEqual(self.series(dimension="agent")[0]["agent"], None)
+
+    def test_weekly_buckets_and_range(self):
+        shops = self.make_shops(4, photos_per_shop=0, state="Oyo", local_government_area="Ibadan North")
+        expected = {}
+        for shop, days_ago in zip(shops, (0, 7, 8, 40)):
+            Shop.objects.filter(pk=shop.pk).update(date_created=timezone.now() - timedelta(days=days_ago))
+            day = self.today - timedelta(days=days_ago)
+            if days_ago <= 30:  # the 40-day-old shop is outside the range
+                week = (day - timedelta(days=day.weekday())).isoformat()
+                expected[week] = expected.get(week, 0) + 1
+        rollups.rebuild()
+
+        weeks = self.series(group_by="week", dimension="lga", **{"from": (self.today - timedelta(days=30)).isoformat()})
+        self.assertEqual(
+            [(week["bucket"], week["lga"], week["captured"]) for week in weeks],
+            [(week, "Ibadan North", count) for week, count in sorted(expected.items())],
+        )
+
+    def test_rebuild_files_reviews_under_the_current_location(self):
+        (shop,) = self.make_shops(1, photos_per_shop=0, state="Lagos")
+        shop.verification_status = Shop.VerificationStatus.VERIFIED
+        shop.save()
+        ActivityLog.objects.create(
+            action_type="UPDATE", shop=shop, shop_name_snapshot=shop.name,
+            changes={"verification_status": {"old": "PENDING", "new": "VERIFIED"}},
+        )
+        shop.state = "Oyo"
+        shop.save()
+
+        def verified_by_state():
+            return [(row["state"], row["verified"]) for row in self.series(dimension="state")]
+
+        self.assertEqual(verified_by_state(), [("Lagos", 1), ("Oyo", 0)])  # where it was reviewed
+        rollups.rebuild()
+        self.assertEqual(verified_by_state(), [("Oyo", 1)])  # where it is now
+
+    def test_weeks_from_a_mid_week_start(self):
+        wednesday = self.today - timedelta(days=self.today.weekday() + 5)
+        shops = self.make_shops(2, photos_per_shop=0)
+        for shop, day in zip(shops, (wednesday - timedelta(days=1), wednesday + timedelta(days=1))):
+            Shop.objects.filter(pk=shop.pk).update(date_created=timezone.now() - (self.today - day))
+        rollups.rebuild()
+
+        # The first week is labelled by its Monday but only counts days from `from` on
+        weeks = self.series(group_by="week", **{"from": wednesday.isoformat()})
+        self.assertEqual(weeks, [
+            {"bucket": (wednesday - timedelta(days=2)).isoformat(), "captured": 1, "verified": 0, "rejected": 0},
+        ])
+
+    def test_rejects_bad_parameters(self):
+        self.client.force_authenticate(self.admin)
+        for params in ({"group_by": "month"}, {"dimension": "owner"}, {"from": "yesterday"},
+                       {"from": "2025-02-01", "to": "2025-01-01"}, {"from": "2020-01-01", "to": "2025-01-01"}):
+            self.assertEqual(self.client.get(self.URL, params).status_code, 400, params)
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.get(self.URL).status_code, 403)
+
+
+def square(west, south, east, north):
+    return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+class OfflineGeocoderTests(ShopFixturesMixin, APITestCase):
+    # Two adjacent LGAs; Ikeja has a hole that belongs to neither
+    BOUNDARIES = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"admin1Name_en": "Lagos", "admin2Name_en": "Ikeja"},
+                "geometry": {"type": "Polygon", "coordinates": [square(3.3, 6.55, 3.4, 6.65), square(3.34, 6.59, 3.36, 6.61)]},
+            },
+            {
+                "type": "Feature",
+                "properties": {"state": "Ogun", "lga": "Ifo"},
+                "geometry": {"type": "MultiPolygon", "coordinates": [[square(3.1, 6.55, 3.3, 6.75)]]},
+            },
+        ],
+    }
+
+    def setUp(self):
+        super().setUp()
+        with tempfile.NamedTemporaryFile("w", suffix=".geojson", delete=False) as fh:
+            json.dump(self.BOUNDARIES, fh)
+        self.addCleanup(os.unlink, fh.name)
+        settings_override = override_settings(SHOPS_BOUNDARIES_PATH=fh.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        boundaries.reset_index()
+        self.addCleanup(boundaries.reset_index)
+
+    def test_lookup_resolves_points_inside_polygons(self):
+        index = boundaries.get_index()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.lookup(6.56, 3.39), ("Lagos", "Ikeja"))
+        self.assertEqual(index.lookup(6.7, 3.2), ("Ogun", "Ifo"))
+        self.assertIsNone(index.lookup(6.6, 3.35))  # inside the hole
+        self.assertIsNone(index.lookup(9.05, 7.49))  # outside coverage
+
+    @mock.patch("shops.opencage.reverse_geocode")
+    def test_covered_capture_is_resolved_without_a_job(self, http_get):
+        self.client.force_authenticate(self.agent)
+        response = self.client.post("/api/shops/", {"name": "Corner Shop", "latitude": "6.56", "longitude": "3.39"})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            (response.data["state"], response.data["local_government_area"], response.data["geocode_status"]),
+            ("Lagos", "Ikeja", "RESOLVED"),
+        )
+        self.assertFalse(BackgroundJob.objects.exists())
+        http_get.assert_not_called()
+
+    @mock.patch("shops.tasks.get_location_details", return_value={"state": "FCT", "local_government_area": "AMAC"})
+    def test_uncovered_points_fall_back_to_the_worker(self, lookup):
+        self.client.force_authenticate(self.agent)
+        response = self.client.post("/api/shops/", {"name": "Abuja Shop", "latitude": "9.05", "longitude": "7.49"})
+
+        self.assertEqual(response.data["geocode_status"], "PENDING")
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(Shop.objects.get().state, "FCT")
+
+
+class StubOpenCage:
+    """
+    A local HTTP/1.1 server standing in for OpenCage. `responses` is a script of
+    (status, json_body, delay_seconds) played in order; the last entry repeats.
+    """
+
+    def __init__(self):
+        self.responses = [(200, {"results": []}, 0)]
+        self.requests = 0
+        self.connections = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub.requests += 1
+                stub.connections.add(self.client_address)
+                status, body, delay = stub.responses.pop(0) if len(stub.responses) > 1 else stub.responses[0]
+                time.sleep(delay)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/geocode/v1/json"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubOpenCageMixin:
+    """Points the geocoder at a StubOpenCage (self.opencage) with fresh caches and breaker."""
+
+    def setUp(self):
+        super().setUp()
+        self.opencage = StubOpenCage()
+        self.addCleanup(self.opencage.stop)
+        settings_override = override_settings(
+            OPENCAGE_BASE_URL=self.opencage.url, OPENCAGE_API_KEY="test-key", SHOPS_BOUNDARIES_PATH=None
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for reset in (boundaries.reset_index, geocache.clear_local, opencage.reset):
+            reset()
+            self.addCleanup(reset)
+        patcher = mock.patch.multiple(
+            "shops.opencage", BACKOFF_BASE=0.01, READ_TIMEOUT=0.3, _session=None
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class GeocodeStoreTests(StubOpenCageMixin, ShopFixturesMixin, APITestCase):
+    OPENCAGE_RESPONSE = {"results": [{"components": {"state": "Lagos", "city_district": "Ikeja"}}]}
+
+    def test_paid_lookup_is_made_once_per_location_across_restarts(self):
+        self.opencage.responses = [(200, self.OPENCAGE_RESPONSE, 0)]
+        expected = {"state": "Lagos", "local_government_area": "Ikeja"}
+
+        self.assertEqual(get_location_details(6.6, 3.35), expected)
+        self.assertEqual(get_location_details("6.60003", "3.35002"), expected)  # same ~11m cell, LRU hit
+        geocache.clear_local()  # simulate another worker / a restart
+        self.assertEqual(get_location_details(6.6, 3.35), expected)
+
+        self.assertEqual(self.opencage.requests, 1)
+        self.assertEqual(GeocodeCacheEntry.objects.get().cell, "6.6000,3.3500")
+        self.assertEqual(geocache.stats()["db_hits"], 1)
+
+    def test_prewarm_copies_resolved_locations(self):
+        self.make_shops(3, photos_per_shop=0, latitude="6.5", longitude="3.3", state="Lagos", local_government_area="Eti-Osa")
+        self.make_shops(1, photos_per_shop=0, latitude="7.0", longitude="3.9", state="API Error")
+
+        call_command("prewarm_geocodes", stdout=mock.MagicMock())
+
+        self.assertEqual(
+            list(GeocodeCacheEntry.objects.values_list("cell", "state", "local_government_area")),
+            [("6.5000,3.3000", "Lagos", "Eti-Osa")],
+        )
+        self.assertEqual(geocache.get(6.5, 3.3), {"state": "Lagos", "local_government_area": "Eti-Osa"})
+
+    def test_empty_results_and_errors_are_negative_cached_briefly(self):
+        self.assertEqual(get_location_details(6.6, 3.35), {"state": None, "local_government_area": None})
+        get_location_details(6.6, 3.35)
+        self.assertEqual(self.opencage.requests, 1)
+
+        self.opencage.responses = [(503, {}, 0)]
+        self.assertEqual(get_location_details(7.1, 3.9)["state"], "API Error")
+        requests_made = self.opencage.requests
+        get_location_details(7.1, 3.9)
+        self.assertEqual(self.opencage.requests, requests_made)
+
+        # Retries can skip the cached failure
+        get_location_details(7.1, 3.9, use_negative_cache=False)
+        self.assertGreater(self.opencage.requests, requests_made)
+        requests_made = self.opencage.requests
+
+        # Once the TTL lapses the cell is asked again
+        GeocodeCacheEntry.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        geocache.clear_local()
+        get_location_details(7.1, 3.9)
+        self.assertGreater(self.opencage.requests, requests_made)
+
+    def test_concurrent_misses_share_one_call(self):
+        flight, calls, release = geocache.SingleFlight(), [], threading.Event()
+
+        def slow_lookup():
+            calls.append(1)
+            release.wait(5)
+            return {"state": "Lagos"}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("6.6000,3.3500", slow_lookup)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        while geocache.stats()["coalesced"] < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"state": "Lagos"}] * 5)
+
+
+class OpenCageClientTests(StubOpenCageMixin, APITestCase):
+    OK = (200, {"results": [{"components": {"state": "Lagos"}}]}, 0)
+
+    def test_connections_are_reused(self):
+        self.opencage.responses = [self.OK]
+        for lat in (6.1, 6.2, 6.3):
+            opencage.reverse_geocode(lat, 3.3, "test-key")
+        self.assertEqual((self.opencage.requests, len(self.opencage.connections)), (3, 1))
+
+    def test_transient_errors_are_retried(self):
+        self.opencage.responses = [(503, {}, 0), (429, {}, 0), self.OK]
+        data = opencage.reverse_geocode(6.5, 3.3, "test-key")
+
+        self.assertEqual(data["results"][0]["components"]["state"], "Lagos")
+        self.assertEqual(opencage.metrics()["retries"], 2)
+
+    def test_slow_upstream_times_out_and_client_errors_are_not_retried(self):
+        self.opencage.responses = [(200, {"results": []}, 1.0)]
+        with self.assertRaises(opencage.OpenCageError):
+            opencage.reverse_geocode(6.5, 3.3, "test-key")
+        self.assertEqual(self.opencage.requests, 1 + opencage.MAX_RETRIES)
+
+        self.opencage.requests = 0
+        self.opencage.responses = [(401, {}, 0)]
+        with self.assertRaises(opencage.OpenCageError):
+            opencage.reverse_geocode(6.5, 3.3, "bad-key")
+        self.assertEqual(self.opencage.requests, 1)
+
+    def test_retry_budget_caps_retries(self):
+        self.opencage.responses = [(500, {}, 0)]
+        with mock.patch("shops.opencage._breaker", opencage.CircuitBreaker(failure_threshold=1000)):
+            for _ in range(20):
+                with self.assertRaises(opencage.OpenCageError):
+                    opencage.reverse_geocode(6.5, 3.3, "test-key")
+        # 10 starting tokens plus 0.2 per call, instead of 2 retries for each of the 20 calls
+        self.assertLessEqual(opencage.metrics()["retries"], 14)
+
+    def test_circuit_opens_then_recovers_after_a_trial_call(self):
+        clock = [0.0]
+        breaker = opencage.CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=lambda: clock[0])
+        self.opencage.responses = [(500, {}, 0)]
+        with mock.patch("shops.opencage._breaker", breaker), mock.patch("shops.opencage.MAX_RETRIES", 0):
+            for _ in range(3):
+                with self.assertRaises(opencage.OpenCageError):
+                    opencage.reverse_geocode(6.5, 3.3, "test-key")
+            self.assertEqual(breaker.state, breaker.OPEN)
+
+            with self.assertRaises(opencage.CircuitOpenError):
+                opencage.reverse_geocode(6.5, 3.3, "test-key")
+            self.assertEqual(self.opencage.requests, 3)  # failed fast
+
+            clock[0] = 31
+            self.opencage.responses = [self.OK]
+            opencage.reverse_geocode(6.5, 3.3, "test-key")
+            self.assertEqual(breaker.state, breaker.CLOSED)
+
+        metrics = opencage.metrics()
+        self.assertEqual((metrics["short_circuited"], metrics["requests"]), (1, 4))
+        self.assertEqual(sum(metrics["latency_buckets"].values()), 4)
+
+    def test_unexpected_errors_in_the_trial_call_reopen_the_circuit(self):
+        clock = [0.0]
+        breaker = opencage.CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: clock[0])
+        breaker.record_failure()
+        clock[0] = 31
+        with mock.patch("shops.opencage._breaker", breaker), \
+                mock.patch("shops.opencage._request", side_effect=ValueError("bad body")):
+            with self.assertRaises(ValueError):
+                opencage.reverse_geocode(6.5, 3.3, "test-key")
+        self.assertEqual(breaker.state, breaker.OPEN)
+
+
+class GeocodeBackfillTests(StubOpenCageMixin, ShopFixturesMixin, APITestCase):
+    LAGOS = (200, {"results": [{"components": {"state": "Lagos", "city_district": "Ikeja"}}]}, 0)
+
+    def setUp(self):
+        super().setUp()
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.checkpoint = os.path.join(workdir.name, "checkpoint")
+
+    def backfill(self, *args):
+        call_command("geocode_backfill", "--rate", "1000", "--checkpoint", self.checkpoint, *args, stdout=mock.MagicMock())
+
+    def test_broken_shops_are_resolved_once_per_cell(self):
+        self.opencage.responses = [self.LAGOS]
+        broken = self.make_shops(3, photos_per_shop=0, state="API Error", local_government_area="API Error")
+        broken += self.make_shops(2, photos_per_shop=0, latitude="6.6", longitude="3.35")
+        healthy = self.make_shops(1, photos_per_shop=0, state="Oyo", local_government_area="Ibadan North")[0]
+
+        self.backfill("--chunk-size", "2")
+
+        self.assertEqual(self.opencage.requests, 2)  # two distinct cells
+        for shop in broken:
+            shop.refresh_from_db()
+            self.assertEqual((shop.state, shop.local_government_area, shop.geocode_status), ("Lagos", "Ikeja", "RESOLVED"))
+        healthy.refresh_from_db()
+        self.assertEqual(healthy.state, "Oyo")
+        self.assertFalse(os.path.exists(self.checkpoint))  # a completed run leaves nothing to resume
+
+    def test_edits_made_during_the_lookups_are_kept(self):
+        self.opencage.responses = [self.LAGOS]
+        edited, moved, broken = self.make_shops(3, photos_per_shop=0, state="API Error")
+        put = geocache.put
+
+        def edit_meanwhile(*args, **kwargs):  # runs once the lookup is back, before the write
+            Shop.objects.filter(pk=edited.pk).update(state="Oyo", local_government_area="Ibadan North")
+            Shop.objects.filter(pk=moved.pk).update(latitude="9.05", longitude="7.49")
+            return put(*args, **kwargs)
+
+        with mock.patch.object(geocache, "put", edit_meanwhile):
+            self.backfill()
+
+        for shop in (edited, moved, broken):
+            shop.refresh_from_db()
+        self.assertEqual((edited.state, moved.state, broken.state), ("Oyo", "API Error", "Lagos"))
+        self.assertEqual(
+            sorted(DailyShopStats.objects.filter(captured__gt=0).values_list("state", "captured")),
+            [("API Error", 2), ("Lagos", 1)],  # the raw edits bypassed the rollup; the backfill moved one shop
+        )
+
+    def test_failures_clear_placeholders_and_resume_skips_done_shops(self):
+        self.opencage.responses = [(401, {}, 0)]
+        first, second = self.make_shops(2, photos_per_shop=0, state="API Error")
+
+        process_chunk = geocode_backfill.Command._process_chunk
+
+        def interrupt_after_first_chunk(command, shops, *args):
+            if shops[0].id != first.id:
+                raise KeyboardInterrupt
+            process_chunk(command, shops, *args)
+
+        with mock.patch.object(geocode_backfill.Command, "_process_chunk", interrupt_after_first_chunk), \
+                self.assertRaises(KeyboardInterrupt):
+            self.backfill("--chunk-size", "1")
+        first.refresh_from_db()
+        self.assertEqual((first.state, first.geocode_status), (None, "FAILED"))
+
+        # The next run resumes after the checkpoint instead of retrying the failure
+        self.opencage.responses = [self.LAGOS]
+        GeocodeCacheEntry.objects.all().delete()
+        geocache.clear_local()
+        self.backfill()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.state, second.state), (None, "Lagos"))
+
+        # Once a run completes, failed shops are eligible again
+        self.backfill()
+        first.refresh_from_db()
+        self.assertEqual(first.state, "Lagos")
+
+
+def make_image(name="shop.png", size=(64, 48), fmt="PNG", exif=None):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(buffer, fmt, **({"exif": exif} if exif else {}))
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{fmt.lower()}")
+
+
+class LocalPhotoStorageMixin:
+    """Swaps Cloudinary for a temporary FileSystemStorage and staging directory."""
+
+    def setUp(self):
+        super().setUp()
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.media_root = os.path.join(workdir.name, "media")
+        self.staging_dir = os.path.join(workdir.name, "staging")
+        settings_override = override_settings(
+            SHOP_PHOTO_STORAGE={
+                "BACKEND": "django.core.files.storage.FileSystemStorage",
+                "OPTIONS": {"location": self.media_root, "base_url": "/media/"},
+            },
+            SHOP_PHOTO_STAGING_DIR=self.staging_dir,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class PhotoPipelineTests(LocalPhotoStorageMixin, ShopFixturesMixin, APITestCase):
+    def capture(self, count=3):
+        self.client.force_authenticate(self.agent)
+        response = self.client.post(
+            "/api/shops/",
+            {"name": "Photo Shop", "uploaded_photos": [make_image(f"front {n}.png") for n in range(count)]},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_capture_returns_before_photos_are_uploaded(self):
+        response = self.capture()
+
+        self.assertEqual([photo["status"] for photo in response.data["photos"]], ["PROCESSING"] * 3)
+        self.assertEqual([photo["photo"] for photo in response.data["photos"]], [None] * 3)
+        self.assertEqual(len(os.listdir(self.staging_dir)), 3)
+        self.assertFalse(os.path.exists(self.media_root))
+        etag = self.client.get(f"/api/shops/{response.data['id']}/")["ETag"]
+
+        self.assertEqual(jobs.run_pending(), 3)
+
+        photos = ShopPhoto.objects.order_by("id")
+        self.assertEqual({photo.status for photo in photos}, {"READY"})
+        self.assertTrue(all(storage.get_photo_storage().exists(photo.photo.name) for photo in photos))
+        self.assertTrue(photos[0].photo.name.startswith("shop_photos/front_0"))
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+        # Finished uploads change the shop's representation, so its validator moves
+        detail = self.client.get(f"/api/shops/{response.data['id']}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(detail.status_code, 200)
+        self.assertTrue(detail.data["photos"][0]["photo"].endswith(".png"))
+
+    @override_settings(SHOP_PHOTO_MAX_DIMENSION=200, SHOP_PHOTO_THUMB_DIMENSION=40)
+    def test_photos_are_downscaled_stripped_and_thumbnailed(self):
+        exif = Image.Exif()
+        exif[0x010F] = "PhoneMaker"  # Make
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+        self.client.force_authenticate(self.agent)
+        response = self.client.post(
+            "/api/shops/",
+            {"name": "Photo Shop", "uploaded_photos": [make_image("big.jpg", size=(800, 600), fmt="JPEG", exif=exif)]},
+            format="multipart",
+        )
+        jobs.run_pending()
+
+        photo = ShopPhoto.objects.get()
+        with Image.open(photo.photo.path) as full, Image.open(photo.thumbnail.path) as thumb:
+            self.assertEqual(full.size, (150, 200))  # upright and within 200px
+            self.assertEqual(max(thumb.size), 40)
+            self.assertEqual(len(full.getexif()), 0)
+
+        data = self.client.get(f"/api/shops/{response.data['id']}/").data["photos"][0]
+        self.assertIn("/media/shop_photos/thumbs/big_thumb", data["thumb"])
+        self.assertEqual(data["full"], data["photo"])
+        self.assertNotEqual(data["thumb"], data["full"])
+
+    def test_failed_uploads_are_retried_then_marked_failed(self):
+        self.capture(count=1)
+        with mock.patch("django.core.files.storage.FileSystemStorage.save", side_effect=OSError("disk full")):
+            for attempt in range(jobs.MAX_ATTEMPTS):
+                BackgroundJob.objects.update(run_after=timezone.now())  # skip the backoff
+                jobs.run_pending()
+
+        photo = ShopPhoto.objects.get()
+        self.assertEqual((photo.status, photo.staged_path), ("FAILED", ""))
+        self.assertEqual(BackgroundJob.objects.get().status, BackgroundJob.Status.FAILED)
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+    def test_deleting_a_processing_photo_discards_its_staged_file(self):
+        response = self.capture(count=2)
+        photo_id = response.data["photos"][0]["id"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/shops/{response.data['id']}/", {"photos_to_delete_ids": [photo_id]}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(os.listdir(self.staging_dir)), 1)
+        self.assertEqual(jobs.run_pending(), 2)  # the orphaned job finds nothing to do
+        self.assertEqual(list(ShopPhoto.objects.values_list("status", flat=True)), ["READY"])
+
+
+class PhotoUploadHandlerTests(LocalPhotoStorageMixin, ShopFixturesMixin, APITestCase):
+    def post_photos(self, *files):
+        self.client.force_authenticate(self.agent)
+        return self.client.post("/api/shops/", {"name": "Upload Shop", "uploaded_photos": list(files)}, format="multipart")
+
+    def test_content_type_header_is_not_trusted(self):
+        fake = SimpleUploadedFile("evil.png", b"<?php echo 'hi'; ?>", content_type="image/png")
+        response = self.post_photos(make_image(), fake)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["uploaded_photos"], ["Only JPEG and PNG images are allowed."])
+        self.assertFalse(Shop.objects.exists())
+
+    def test_oversize_parts_are_rejected_while_streaming(self):
+        huge = SimpleUploadedFile("huge.png", b"\x89PNG\r\n\x1a\n" + b"\0" * (2 * 1024 * 1024), content_type="image/png")
+        response = self.post_photos(huge)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["uploaded_photos"], ["Image size must be under 2MB."])
+
+    @override_settings(SHOP_UPLOAD_MAX_REQUEST_BYTES=1024)
+    def test_request_total_is_capped(self):
+        response = self.post_photos(SimpleUploadedFile("a.png", b"\x89PNG\r\n\x1a\n" + os.urandom(4096)))
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(SHOP_UPLOAD_SPILL_BYTES=1024)
+    def test_parts_past_the_threshold_spill_to_disk(self):
+        payload = b"\x89PNG\r\n\x1a\n" + os.urandom(4096)
+        handler = ShopPhotoUploadHandler()
+        handler.new_file("uploaded_photos", "big.png", "application/octet-stream", len(payload))
+        for start in range(0, len(payload), 512):
+            handler.receive_data_chunk(payload[start:start + 512], start)
+        uploaded = handler.file_complete(len(payload))
+
+        self.assertIsInstance(uploaded, TemporaryUploadedFile)
+        self.assertEqual(uploaded.content_type, "image/png")  # sniffed, not the header
+        self.assertEqual(uploaded.read(), payload)
+        uploaded.close()
+
+        # Small photos stay in memory and still go through the pipeline
+        response = self.post_photos(make_image())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(jobs.run_pending(), 1)
+
+
+class PhotoURLTests(ShopFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        storage._cached_url.cache_clear()
+        self.addCleanup(storage._cached_url.cache_clear)
+
+    def test_urls_match_the_cloudinary_storage(self):
+        cloudinary_storage = MediaCloudinaryStorage()
+        for name in ("shop_photos/front_abc123", "media/shop_photos/a b~(1).jpg", "v123/x", "plain"):
+            self.assertEqual(storage.photo_url(name), cloudinary_storage.url(name))
+
+    def test_lists_resolve_urls_without_the_storage(self):
+        self.make_shops(5, photos_per_shop=2)
+        self.client.force_authenticate(self.admin)
+
+        with mock.patch("cloudinary_storage.storage.MediaCloudinaryStorage.url", side_effect=AssertionError), \
+                mock.patch.object(storage.CloudinaryURLBuilder, "url", wraps=storage._get_url_builder().url) as build:
+            first = self.client.get("/api/shops/")
+            self.client.get("/api/shops/")
+
+        self.assertEqual(build.call_count, 20)  # photo + thumb per photo, once: the second list is memoized
+        photo = first.data["results"][0]["photos"][0]
+        self.assertTrue(photo["full"].startswith("https://res.cloudinary.com/"))
+        self.assertIn("/image/upload/c_limit,f_auto,q_auto,w_320,h_320/v1/media/shop_photos/", photo["thumb"])
+
+
+def make_pattern(name="front.png", seed=0, size=(160, 120), fmt="PNG"):
+    """A blocky random image: unlike a flat colour, it has a distinctive perceptual hash."""
+    rng = random.Random(seed)
+    blocks = Image.new("L", (16, 12))
+    blocks.putdata([rng.randrange(256) for _ in range(16 * 12)])
+    buffer = io.BytesIO()
+    blocks.resize(size, Image.Resampling.NEAREST).convert("RGB").save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{fmt.lower()}")
+
+
+def flip_bits(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+class DuplicatePhotoTests(LocalPhotoStorageMixin, ShopFixturesMixin, APITestCase):
+    BASE_HASH = 0xF0F0_1234_8001_7FFE
+
+    def hashed_photo(self, shop, value):
+        photo = ShopPhoto(shop=shop, photo=f"shop_photos/{shop.id}_{value:x}.jpg")
+        photo.set_phash(value)
+        photo.save()
+        return photo
+
+    def test_hash_survives_resizing_and_reencoding(self):
+        with Image.open(make_pattern(seed=1)) as original, \
+                Image.open(make_pattern(seed=1, size=(640, 480), fmt="JPEG")) as reencoded, \
+                Image.open(make_pattern(seed=2)) as other:
+            self.assertLessEqual(duplicates.hamming(dhash(original), dhash(reencoded)), 2)
+            self.assertGreater(duplicates.hamming(dhash(original), dhash(other)), 12)
+
+    def test_multi_index_search_finds_photos_within_distance(self):
+        mine, near, far, own = self.make_shops(4, photos_per_shop=0)
+        photo = self.hashed_photo(mine, self.BASE_HASH)
+        # 6 bits apart, spread so that no chunk matches exactly
+        close = self.hashed_photo(near, flip_bits(self.BASE_HASH, 63, 62, 60, 40, 20, 1))
+        self.hashed_photo(far, flip_bits(self.BASE_HASH, 63, 62, 60, 40, 39, 20, 1))  # 7 bits apart
+        self.hashed_photo(own, self.BASE_HASH ^ 0xFFFF_FFFF_FFFF_FFFF)
+        self.hashed_photo(mine, self.BASE_HASH)  # the same shop's own copies are not duplicates
+
+        with self.assertNumQueries(4):  # one per hash chunk
+            found = duplicates.find_duplicates([photo])
+
+        self.assertEqual(
+            found, {photo.id: [{"photo_id": close.id, "shop_id": near.id, "shop_name": near.name, "distance": 6}]}
+        )
+        self.assertEqual(duplicates.find_duplicates([photo], distance=3), {})
+
+    def test_common_chunk_values_are_capped_per_probe(self):
+        mine, *others = self.make_shops(4, photos_per_shop=0)
+        photo = self.hashed_photo(mine, 0)  # a low-detail image
+        for shop in others * 2:
+            self.hashed_photo(shop, 1)
+
+        with mock.patch.object(duplicates, "MAX_CANDIDATES_PER_PROBE", 2):
+            found = duplicates.find_duplicates([photo])
+
+        # Only the two newest rows per chunk value are fetched
+        self.assertEqual([match["distance"] for match in found[photo.id]], [1, 1])
+        self.assertEqual(
+            {match["photo_id"] for match in found[photo.id]},
+            set(ShopPhoto.objects.exclude(pk=photo.pk).order_by("-id").values_list("id", flat=True)[:2]),
+        )
+
+    def test_admin_detail_and_review_queue_show_duplicates(self):
+        self.client.force_authenticate(self.agent)
+        ids = []
+        for seed in (7, 7, 8):
+            response = self.client.post(
+                "/api/shops/", {"name": f"Shop {seed}", "uploaded_photos": [make_pattern(seed=seed)]}, format="multipart"
+            )
+            ids.append(response.data["id"])
+        jobs.run_pending()
+        self.assertFalse(ShopPhoto.objects.filter(phash__isnull=True).exists())
+
+        self.client.force_authenticate(self.admin)
+        detail = self.client.get(f"/api/shops/{ids[0]}/").data
+        self.assertEqual(
+            [(match["shop_id"], match["distance"]) for match in detail["duplicate_photos"]], [(ids[1], 0)]
+        )
+        self.assertEqual(detail["duplicate_photos"][0]["photo_id"], detail["photos"][0]["id"])
+
+        queue = self.client.get("/api/shops/?verification_status=PENDING").data["results"]
+        flagged = {shop["id"]: [match["shop_id"] for match in shop["duplicate_photos"]] for shop in queue}
+        self.assertEqual(flagged, {ids[0]: [ids[1]], ids[1]: [ids[0]], ids[2]: []})
+
+        sparse = self.client.get(f"/api/shops/{ids[0]}/?fields=name,duplicate_photos").data
+        self.assertEqual(set(sparse), {"id", "name", "duplicate_photos"})
+        self.assertNotIn("duplicate_photos", self.client.get("/api/shops/").data["results"][0])
+
+        self.client.force_authenticate(self.agent)
+        self.assertNotIn("duplicate_photos", self.client.get(f"/api/shops/{ids[0]}/").data)
+
+    def test_hash_photos_command_backfills_existing_photos(self):
+        shop = self.make_shops(1, photos_per_shop=0)[0]
+        name = storage.get_photo_storage().save("shop_photos/old.png", make_pattern(seed=3))
+        photo = ShopPhoto.objects.create(shop=shop, photo=name)
+
+        call_command("hash_photos", stdout=io.StringIO())
+
+        photo.refresh_from_db()
+        with Image.open(make_pattern(seed=3)) as image:
+            self.assertEqual(photo.phash_unsigned, dhash(image))
+        self.assertEqual(photo.phash_0, photo.phash_unsigned >> 48)
+
+
+class PhotoAssetCollectorTests(LocalPhotoStorageMixin, ShopFixturesMixin, APITestCase):
+    def test_deleted_photos_are_collected_from_storage(self):
+        self.client.force_authenticate(self.agent)
+        shop_id = self.client.post(
+            "/api/shops/", {"name": "Photo Shop", "uploaded_photos": [make_image("a.png"), make_image("b.png")]},
+            format="multipart",
+        ).data["id"]
+        jobs.run_pending()
+        first, second = ShopPhoto.objects.order_by("id")
+        backend = storage.get_photo_storage()
+        names = [first.photo.name, first.thumbnail.name, second.photo.name, second.thumbnail.name]
+        sizes = [backend.size(name) for name in names]
+
+        response = self.client.patch(f"/api/shops/{shop_id}/", {"photos_to_delete_ids": [first.id]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(PendingAssetDeletion.objects.values_list("name", flat=True)), set(names[:2]))
+        self.assertTrue(backend.exists(names[0]))  # nothing remote happens during the request
+
+        self.client.delete(f"/api/shops/{shop_id}/")
+        self.assertEqual(PendingAssetDeletion.objects.count(), 4)
+
+        out = io.StringIO()
+        call_command("collect_photo_assets", "--dry-run", stdout=out)
+        self.assertIn("Would delete 4 asset(s) in 1 batch(es), reclaiming", out.getvalue())
+        self.assertTrue(all(backend.exists(name) for name in names))
+
+        out = io.StringIO()
+        call_command("collect_photo_assets", "--batch-size=3", "--rate=1000", stdout=out)
+        self.assertIn("Deleted 4 asset(s) in 2 batch(es)", out.getvalue())
+        self.assertIn(f"({sum(sizes)} bytes); 0 failed", out.getvalue())
+        self.assertFalse(any(backend.exists(name) for name in names))
+        self.assertFalse(PendingAssetDeletion.objects.exists())
+
+    def test_cloudinary_deletes_in_bulk_and_retries_failures(self):
+        PendingAssetDeletion.objects.bulk_create(
+            [PendingAssetDeletion(name=f"media/shop_photos/p{n}") for n in range(3)]
+        )
+        resources = {"resources": [{"public_id": f"media/shop_photos/p{n}", "bytes": 1000} for n in range(3)]}
+        deleted = {"deleted": {"media/shop_photos/p0": "deleted", "media/shop_photos/p1": "not_found",
+                               "media/shop_photos/p2": "error"}}
+
+        with mock.patch("cloudinary.api.resources_by_ids", return_value=resources) as sizes, \
+                mock.patch("cloudinary.api.delete_resources", return_value=deleted) as delete:
+            totals = assets.collect(rate=1000, deleter=assets.CloudinaryAssetDeleter())
+
+        self.assertEqual(sizes.call_count, 1)
+        delete.assert_called_once_with(
+            [f"media/shop_photos/p{n}" for n in range(3)], resource_type="image", invalidate=True
+        )
+        self.assertEqual(totals, {"deleted": 2, "bytes": 2000, "failed": 1, "batches": 1})
+        leftover = PendingAssetDeletion.objects.get()
+        self.assertEqual((leftover.name, leftover.attempts, leftover.last_error), ("media/shop_photos/p2", 1, "error"))
+
+    def test_cloudinary_size_lookup_errors_do_not_block_deletes(self):
+        PendingAssetDeletion.objects.create(name="media/shop_photos/p0")
+        deleted = {"deleted": {"media/shop_photos/p0": "deleted"}}
+
+        with mock.patch("cloudinary.api.resources_by_ids", side_effect=RuntimeError("rate limited")), \
+                mock.patch("cloudinary.api.delete_resources", return_value=deleted) as delete:
+            totals = assets.collect(rate=1000, deleter=assets.CloudinaryAssetDeleter())
+
+        delete.assert_called_once()
+        self.assertEqual(totals, {"deleted": 1, "bytes": 0, "failed": 0, "batches": 1})
+        self.assertFalse(PendingAssetDeletion.objects.exists())
@@ -0,0 +1,87 @@
+# shops/uploads.py
+"""
+Streaming multipart handling for the shop endpoints.
+
+Django's default handlers buffer each file (up to 2.5MB in memory) before any
+validation runs. ShopPhotoUploadHandler checks parts as they stream in, so a bad
+upload is refused after its first chunk rather than after the whole body has
+been read:
+
+- the request is refused up front when Content-Length exceeds SHOP_UPLOAD_MAX_REQUEST_BYTES;
+- each part's first chunk must start with JPEG/PNG magic bytes (the header's content type is ignored);
+- a part is refused as soon as it grows past MAX_IMAGE_SIZE;
+- parts stay in memory up to SHOP_UPLOAD_SPILL_BYTES, then continue in a temp file.
+"""
+import io
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .validators import MAX_IMAGE_SIZE, SIGNATURE_LENGTH, sniff_image_type
+
+DEFAULT_MAX_REQUEST_BYTES = 12 * 1024 * 1024  # five photos plus form fields
+DEFAULT_SPILL_BYTES = 256 * 1024
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Upload is too large."
+    default_code = "request_too_large"
+
+
+class ShopPhotoUploadHandler(FileUploadHandler):
+    chunk_size = 64 * 1024
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        limit = getattr(settings, "SHOP_UPLOAD_MAX_REQUEST_BYTES", DEFAULT_MAX_REQUEST_BYTES)
+        if content_length > limit:
+            raise RequestTooLarge(f"Upload is too large (limit {limit // (1024 * 1024)}MB per request).")
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.size = 0
+        self.buffer = io.BytesIO()
+        self.spilled = None
+
+    def _reject(self, message):
+        if self.spilled is not None:
+            self.spilled.close()  # deletes the temp file
+        raise ValidationError({self.field_name: [message]})
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0:
+            self.content_type = sniff_image_type(raw_data[:SIGNATURE_LENGTH])
+            if self.content_type is None:
+                self._reject("Only JPEG and PNG images are allowed.")
+
+        self.size += len(raw_data)
+        if self.size > MAX_IMAGE_SIZE:
+            self._reject("Image size must be under 2MB.")
+
+        if self.spilled is None and self.size > getattr(settings, "SHOP_UPLOAD_SPILL_BYTES", DEFAULT_SPILL_BYTES):
+            self.spilled = TemporaryUploadedFile(
+                self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+            )
+            self.spilled.write(self.buffer.getvalue())
+            self.buffer = None
+        (self.spilled or self.buffer).write(raw_data)
+        return None  # consumed; no other handler sees the data
+
+    def file_complete(self, file_size):
+        if self.spilled is not None:
+            self.spilled.seek(0)
+            self.spilled.size = file_size
+            return self.spilled
+        self.buffer.seek(0)
+        return InMemoryUploadedFile(
+            file=self.buffer,
+            field_name=self.field_name,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
@@ -1,7 +1,7 @@
 # shops/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ShopViewSet, MyShopsView, ActivityLogViewSet, DashboardStatsView
+from .views import ShopViewSet, MyShopsView, ActivityLogViewSet, DashboardStatsView, ShopClusterView, ShopMapPointsView, ShopSyncView, ShopTimeSeriesView
 
 router = DefaultRouter()
 router.register("logs", ActivityLogViewSet, basename="activity-logs")
@@ -9,6 +9,10 @@ router.register("", ShopViewSet, basename="shops")
 
 urlpatterns = [
     path("stats/", DashboardStatsView.as_view(), name="dashboard-stats"),
+    path("stats/timeseries/", ShopTimeSeriesView.as_view(), name="shop-stats-timeseries"),
     path("my-shops/", MyShopsView.as_view(), name="my-shops"),
+    path("sync/", ShopSyncView.as_view(), name="shop-sync"),
+    path("map/clusters/", ShopClusterView.as_view(), name="shop-map-clusters"),
+    path("map/points/", ShopMapPointsView.as_view(), name="shop-map-points"),
     path("", include(router.urls)),
 ]
@@ -1,11 +1,31 @@
 from django.core.exceptions import ValidationError
 
+MAX_IMAGE_SIZE = 2 * 1024 * 1024  # 2 MB
+
+# Leading bytes of the formats we accept; the client's Content-Type header is not trusted
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+}
+SIGNATURE_LENGTH = max(len(signature) for signature in IMAGE_SIGNATURES)
+
+
+def sniff_image_type(header):
+    """MIME type for the leading bytes of a file, or None when it is not a JPEG/PNG."""
+    for signature, mime_type in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return mime_type
+    return None
+
+
 def validate_image(image):
-    valid_mime_types = ['image/jpeg', 'image/png']
-    file_mime_type = image.file.content_type
-    if file_mime_type not in valid_mime_types:
+    fh = image.file
+    position = fh.tell()
+    fh.seek(0)
+    header = fh.read(SIGNATURE_LENGTH)
+    fh.seek(position)
+    if sniff_image_type(header) is None:
         raise ValidationError("Only JPEG and PNG images are allowed.")
 
-    max_size = 2 * 1024 * 1024  # 2 MB
-    if image.size > max_size:
+    if image.size > MAX_IMAGE_SIZE:
         raise ValidationError("Image size must be under 2MB.")
@@ -1,13 +1,31 @@
 # shops/views.py
+from datetime import date, timedelta
+from functools import partial
 from rest_framework import viewsets, status, views
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, BasePermission
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, BasePermission
 from .models import Shop, ActivityLog
-from .serializers import ShopSerializer, ActivityLogSerializer
+from .serializers import ShopSerializer, ActivityLogSerializer, BulkReviewSerializer
+from .pagination import ShopCursorPagination
+from .search import search_shops
+from .geo import MAX_RADIUS_M, parse_bbox, parse_point
+from .clusters import MAX_ZOOM, MIN_ZOOM, BBoxTooLarge, clusters_for_bbox, cluster_precision
 from accounts.permissions import IsAgent, IsAdminOrDeveloper 
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from django.db.models import Count, Q
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from rest_framework.renderers import JSONRenderer
+from .renderers import PackedPointsRenderer
+from .conditional import ConditionalGetMixin
+from .sync import InvalidSyncToken, changes_since
+from .bulk import MAX_BATCH_SIZE, bulk_capture, bulk_review
+from .uploads import ShopPhotoUploadHandler
+from .duplicates import duplicates_for_shops
+from . import counters, rollups
 from accounts.models import User
+from django.db import transaction
 from django.utils import timezone
 
 
@@ -25,7 +43,34 @@ class IsAgentForOwnShops(BasePermission):
         return False
 
 
-class ShopViewSet(viewsets.ModelViewSet):
+def apply_spatial_filters(queryset, params):
+    """
+    Apply the optional map filters:
+    - ?bbox=west,south,east,north  -> shops inside the viewport
+    - ?near=lat,lon&radius_m=500   -> shops within the radius (default 1km, max 50km)
+    """
+    bbox = params.get('bbox')
+    if bbox:
+        try:
+            queryset = queryset.in_bbox(*parse_bbox(bbox))
+        except ValueError as e:
+            raise ValidationError({'bbox': str(e)})
+
+    near = params.get('near')
+    if near:
+        try:
+            latitude, longitude = parse_point(near)
+            radius_m = float(params.get('radius_m', 1000))
+        except ValueError as e:
+            raise ValidationError({'near': str(e)})
+        if not 0 < radius_m <= MAX_RADIUS_M:
+            raise ValidationError({'radius_m': f"Must be between 0 and {MAX_RADIUS_M}."})
+        queryset = queryset.near(latitude, longitude, radius_m)
+
+    return queryset
+
+
+class ShopViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing shops.
     - Agents can create shops and manage (edit/delete) only their own shops.
@@ -35,6 +80,12 @@ class ShopViewSet(viewsets.ModelViewSet):
     serializer_class = ShopSerializer
     permission_classes = [IsAuthenticated, IsAgent | IsAdminOrDeveloper]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
+    pagination_class = ShopCursorPagination
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Photos are checked while they stream in instead of being buffered first
+        request.upload_handlers = [ShopPhotoUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
 
     def _log_activity(self, action, shop_instance, changes=None):
         """Helper to create an activity log entry"""
@@ -43,10 +94,12 @@ class ShopViewSet(viewsets.ModelViewSet):
             action_type=action,
             shop=shop_instance,
             shop_name_snapshot=shop_instance.name,
+            shop_id_snapshot=shop_instance.id,
             changes=changes or {}
         )
 
 
+    @transaction.atomic
     def perform_create(self, serializer):
         """
         Set the created_by field to the authenticated agent when creating a shop.
@@ -107,11 +160,75 @@ class ShopViewSet(viewsets.ModelViewSet):
             self._log_activity('UPDATE', updated_shop, changes=changes)
 
 
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser])
+    def bulk_capture(self, request):
+        """
+        Capture many shops in one request: POST /shops/bulk/ with a JSON list (or {"shops": [...]}).
+        Valid items are inserted in a single transaction; invalid ones are reported per index.
+        Responds 201 when everything was created, 207 on partial success, 400 when nothing was.
+        """
+        items = request.data.get('shops') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'shops': "Expected a non-empty list of shops."})
+        if len(items) > MAX_BATCH_SIZE:
+            raise ValidationError({'shops': f"At most {MAX_BATCH_SIZE} shops per request."})
+
+        results = bulk_capture(items, request.user, self.get_serializer_context())
+        created = sum(1 for result in results if result['status'] == 'created')
+
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        data = {
+            "created": created,
+            "failed": len(results) - created,
+            "results": results,
+        }
+        return Response(data, status=response_status)
+
+    @action(detail=False, methods=['post'], url_path='bulk-review', parser_classes=[JSONParser])
+    def bulk_review(self, request):
+        """
+        Approve or reject many shops at once (Admins/Developers only):
+        POST /shops/bulk-review/ {"ids": [1, 2], "verification_status": "REJECTED", "rejection_reason": "..."}
+        Applies the same is_active rules as a single PATCH.
+        """
+        serializer = BulkReviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        updated, unchanged, missing = bulk_review(
+            serializer.validated_data['ids'],
+            request.user,
+            serializer.validated_data['verification_status'],
+            serializer.validated_data.get('rejection_reason'),
+        )
+        data = {
+            "updated": updated,
+            "unchanged": unchanged,
+            "not_found": missing,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
     def perform_destroy(self, instance):
         # Log before deletion so we have the ID
-        self._log_activity('DELETE', instance, changes={"msg": "Shop deleted"})
+        # created_by lets delta sync route the tombstone to the owning agent
+        self._log_activity('DELETE', instance, changes={"msg": "Shop deleted", "created_by": instance.created_by_id})
         instance.delete()
 
+    # Updates and deletes hold the shop's row lock from get_object() to commit, so
+    # concurrent writes compute their counter and rollup deltas from fresh values
+    @transaction.atomic
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @transaction.atomic
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+
     def get_permissions(self):
         """
         Override to apply custom object-level permissions for update/delete actions.
@@ -119,11 +236,54 @@ class ShopViewSet(viewsets.ModelViewSet):
         if self.action in ['update', 'partial_update', 'destroy']:
             # Apply object-level permission for agents to restrict to their own shops
             self.permission_classes = [IsAuthenticated, IsAgentForOwnShops]
+        elif self.action == 'bulk_review':
+            self.permission_classes = [IsAuthenticated, IsAdminOrDeveloper]
         return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        return self.respond_for_queryset(
+            request, self.get_queryset(), partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        shop = self.get_queryset().filter(pk=kwargs[self.lookup_field])
+        return self.respond_for_queryset(request, shop, partial(super().retrieve, request, *args, **kwargs))
+
+    def _sparse_fieldset(self):
+        """(fields, expand) for reads; writes always get the full representation."""
+        if self.request.method != 'GET':
+            return None, set()
+        return ShopSerializer.parse_sparse_fieldset(self.request.query_params)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self._sparse_fieldset()
+        return context
+
+    def _shows_duplicate_photos(self):
+        """Admins see possible duplicate photos on shop detail and in the review queue (?verification_status=PENDING)."""
+        user = self.request.user
+        if user.role not in [user.Role.ADMIN, user.Role.DEVELOPER]:
+            return False
+        if self.action != 'retrieve' and not (
+            self.action == 'list'
+            and self.request.query_params.get('verification_status') == Shop.VerificationStatus.PENDING
+        ):
+            return False
+        fields, _ = self._sparse_fieldset()
+        return fields is None or 'duplicate_photos' in fields
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self._shows_duplicate_photos():
+            # One duplicate search for the whole page rather than one per shop
+            shops = args[0] if kwargs.get('many') else [args[0]]
+            context = kwargs.setdefault('context', self.get_serializer_context())
+            context['photo_duplicates'] = duplicates_for_shops(shops)
+        return super().get_serializer(*args, **kwargs)
+
     def get_queryset(self):
         user = self.request.user
-        queryset = Shop.objects.all()
+        queryset = Shop.objects.with_related(*self._sparse_fieldset())
 
         if user.is_authenticated and user.role == user.Role.AGENT:
             queryset = queryset.filter(created_by=user)
@@ -133,24 +293,204 @@ class ShopViewSet(viewsets.ModelViewSet):
         if status_param:
              queryset = queryset.filter(verification_status=status_param)
 
-        return queryset.order_by('-date_created')
+        queryset = apply_spatial_filters(queryset, self.request.query_params)
+
+        if self.request.method not in SAFE_METHODS:
+            # Only the shop row: the owner/created_by joins are nullable outer joins
+            queryset = queryset.select_for_update(of=("self",))
+
+        # Full-text search over name/address/description/state/LGA (e.g. /shops/?q=ikeja bakery)
+        search_query = self.request.query_params.get('q')
+        if search_query:
+            return search_shops(queryset, search_query).order_by('-search_rank', '-id')
+
+        return queryset.order_by('-date_created', '-id')
     
-class MyShopsView(views.APIView):
+class MyShopsView(ConditionalGetMixin, views.APIView):
     """
-    Retrieve all shops created by the authenticated agent.
+    Retrieve the shops created by the authenticated agent, one cursor page at a time.
     """
     permission_classes = [IsAuthenticated, IsAgent]
+    pagination_class = ShopCursorPagination
 
     def get(self, request, *args, **kwargs):
-        shops = Shop.objects.filter(created_by=request.user).order_by('-date_created')
-        serializer = ShopSerializer(shops, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        scope = Shop.objects.filter(created_by=request.user)
+        return self.respond_for_queryset(request, scope, partial(self._list, request))
+
+    def _list(self, request):
+        fields, expand = ShopSerializer.parse_sparse_fieldset(request.query_params)
+        shops = (
+            Shop.objects.with_related(fields, expand)
+            .filter(created_by=request.user)
+            .order_by('-date_created', '-id')
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(shops, request, view=self)
+        context = {'request': request, 'fields': fields, 'expand': expand}
+        serializer = ShopSerializer(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
     
+class ShopSyncView(views.APIView):
+    """
+    Delta sync for offline-first clients: /shops/sync/?since=<token>&limit=500
+    - Without `since`, returns everything in scope (a full sync) and a token.
+    - With `since`, returns shops created/updated after the token, ids deleted after it,
+      and a new token. Keep calling while `has_more` is true.
+    - A delta may repeat recently changed shops (see shops.sync); clients upsert by id.
+    Agents only sync their own shops.
+    """
+    permission_classes = [IsAuthenticated, IsAgent | IsAdminOrDeveloper]
+    default_limit = 500
+    max_limit = 1000
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': "A whole number is required."})
+        if limit < 1:
+            raise ValidationError({'limit': "Must be at least 1."})
+
+        try:
+            shops, deleted, next_token, has_more = changes_since(
+                request.user,
+                request.query_params.get('since'),
+                limit=limit,
+                queryset=Shop.objects.with_related(),
+            )
+        except InvalidSyncToken as e:
+            raise ValidationError({'since': str(e)})
+
+        data = {
+            "shops": ShopSerializer(shops, many=True, context={'request': request}).data,
+            "deleted": deleted,
+            "next_token": next_token,
+            "has_more": has_more,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ShopClusterView(views.APIView):
+    """
+    Aggregated map markers: /shops/map/clusters/?bbox=west,south,east,north&zoom=12
+    Returns one entry per grid cell with a count, centroid and status breakdown.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrDeveloper]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            south, west, north, east = parse_bbox(request.query_params.get('bbox', ''))
+        except ValueError as e:
+            raise ValidationError({'bbox': str(e)})
+        try:
+            zoom = int(request.query_params.get('zoom', ''))
+        except ValueError:
+            raise ValidationError({'zoom': "A whole number is required."})
+        if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+            raise ValidationError({'zoom': f"Must be between {MIN_ZOOM} and {MAX_ZOOM}."})
+
+        try:
+            clusters = clusters_for_bbox(south, west, north, east, zoom)
+        except BBoxTooLarge as e:
+            raise ValidationError({'bbox': str(e)})
+
+        data = {
+            "zoom": zoom,
+            "precision": cluster_precision(zoom),
+            "clusters": clusters,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ShopTimeSeriesView(views.APIView):
+    """
+    Capture and review counts over time, from the daily rollup (shops.rollups):
+    /shops/stats/timeseries/?group_by=day|week&dimension=state|lga|agent&from=2025-01-01&to=2025-12-31
+    `from` defaults to 30 days before `to`, which defaults to today.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrDeveloper]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        group_by = params.get('group_by', 'day')
+        if group_by not in rollups.GROUP_BY:
+            raise ValidationError({'group_by': f"Must be one of: {', '.join(rollups.GROUP_BY)}."})
+        dimension = params.get('dimension') or None
+        if dimension is not None and dimension not in rollups.DIMENSIONS:
+            raise ValidationError({'dimension': f"Must be one of: {', '.join(rollups.DIMENSIONS)}."})
+
+        try:
+            end = date.fromisoformat(params['to']) if params.get('to') else timezone.localdate()
+            start = date.fromisoformat(params['from']) if params.get('from') else end - timedelta(days=29)
+        except ValueError:
+            raise ValidationError({'from': "Dates must be YYYY-MM-DD."})
+        if start > end:
+            raise ValidationError({'from': "Must not be after 'to'."})
+        if (end - start).days >= rollups.MAX_RANGE_DAYS:
+            raise ValidationError({'from': f"At most {rollups.MAX_RANGE_DAYS} days per request."})
+
+        data = {
+            "group_by": group_by,
+            "dimension": dimension,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "results": rollups.timeseries(start, end, group_by, dimension),
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ShopMapPointsView(views.APIView):
+    """
+    Minimal map feed: /shops/map/points/?bbox=...&verification_status=...
+    Returns parallel arrays instead of a list of objects; add ?format=bin for the packed
+    binary layout (see PackedPointsRenderer). Agents only get their own shops.
+    """
+    permission_classes = [IsAuthenticated, IsAgent | IsAdminOrDeveloper]
+    renderer_classes = [JSONRenderer, PackedPointsRenderer]
+
+    def get(self, request, *args, **kwargs):
+        queryset = Shop.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        if request.user.role == User.Role.AGENT:
+            queryset = queryset.filter(created_by=request.user)
+
+        status_param = request.query_params.get('verification_status')
+        if status_param:
+            queryset = queryset.filter(verification_status=status_param)
+        queryset = apply_spatial_filters(queryset, request.query_params)
+
+        status_codes = Shop.VerificationStatus.values
+        status_index = {code: i for i, code in enumerate(status_codes)}
+
+        # Straight from the cursor: no model instances, floats cast in SQL
+        rows = queryset.order_by().values_list(
+            'id',
+            Cast('latitude', FloatField()),
+            Cast('longitude', FloatField()),
+            'verification_status',
+        )
+        ids, lats, lons, statuses = [], [], [], []
+        for shop_id, latitude, longitude, verification_status in rows.iterator(chunk_size=5000):
+            ids.append(shop_id)
+            lats.append(latitude)
+            lons.append(longitude)
+            statuses.append(status_index[verification_status])
+
+        data = {
+            "count": len(ids),
+            "status_codes": status_codes,
+            "id": ids,
+            "lat": lats,
+            "lon": lons,
+            "status": statuses,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
 class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Read-only endpoint for Admins to view history.
     """
-    queryset = ActivityLog.objects.all()
+    queryset = ActivityLog.objects.select_related('actor')
     serializer_class = ActivityLogSerializer
     permission_classes = [IsAuthenticated, IsAdminOrDeveloper] # Only Admins see logs
 
@@ -170,56 +510,69 @@ class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
         return queryset
     
 
-class DashboardStatsView(views.APIView):
+class DashboardStatsView(ConditionalGetMixin, views.APIView):
+    """
+    Dashboard totals, read from the rollup counters in shops.counters: one indexed
+    lookup of a fixed set of rows, however many shops there are.
+    """
     permission_classes = [IsAuthenticated, IsAdminOrDeveloper] 
 
+    GLOBAL_COUNTERS = {
+        "total_shops": "shops",
+        "active_shops": "shops:active",
+        "total_agents": counters.AGENTS,
+        "pending_reviews": f"shops:{Shop.VerificationStatus.PENDING}",
+        "rejected_reviews": f"shops:{Shop.VerificationStatus.REJECTED}",
+        "verified_shops": f"shops:{Shop.VerificationStatus.VERIFIED}",
+        "total_captured_by_agents": "shops:by_agents",
+    }
+    AGENT_COUNTERS = {
+        "total_captured": "shops",
+        "pending": Shop.VerificationStatus.PENDING,
+        "rejected": Shop.VerificationStatus.REJECTED,
+    }
+
     def get(self, request, *args, **kwargs):
-        today = timezone.now().date()
-        
-        # --- 1. Global Shop Statistics ---
-        shop_stats = Shop.objects.aggregate(
-            total_shops=Count('id'),
-            active_shops=Count('id', filter=Q(is_active=True)), # <--- NEW LINE
-            pending_reviews=Count('id', filter=Q(verification_status=Shop.VerificationStatus.PENDING)),
-            rejected_reviews=Count('id', filter=Q(verification_status=Shop.VerificationStatus.REJECTED)),
-            verified_shops=Count('id', filter=Q(verification_status=Shop.VerificationStatus.VERIFIED)),
-            captured_by_agents=Count('id', filter=Q(created_by__isnull=False)),
-        )
+        today = timezone.localdate().isoformat()
+
+        # --- Agent Performance (Optional) ---
+        agent_id = request.query_params.get('agent_id')
+        if agent_id:
+            try:
+                agent_id = int(agent_id)
+            except ValueError:
+                raise ValidationError({'agent_id': "Must be an integer."})
+        elif request.user.role == User.Role.AGENT:
+            agent_id = request.user.id
+
+        names = {**self.GLOBAL_COUNTERS, "shops_captured_today": f"shops:day:{today}"}
+        if agent_id:
+            names.update({f"agent_{key}": f"agent:{agent_id}:{name}" for key, name in self.AGENT_COUNTERS.items()})
+            names["agent_captured_today"] = f"agent:{agent_id}:day:{today}"
+        values, last_modified = counters.read(list(names.values()))
+        stats = {key: values[name] for key, name in names.items()}
 
-        # --- 2. Agent Statistics ---
-        total_agents = User.objects.filter(role=User.Role.AGENT).count()
-        shops_captured_today_global = Shop.objects.filter(date_created__date=today).count()
+        version = (today, *sorted(stats.items()))
+        return self.respond_conditionally(
+            request, partial(self._stats, stats, bool(agent_id)), version, last_modified
+        )
 
-        # --- 3. Agent Performance (Optional) ---
+    def _stats(self, stats, with_agent):
         agent_stats = None
-        target_agent_id = request.query_params.get('agent_id')
-        
-        if target_agent_id:
-            agent_stats = self._get_agent_stats(target_agent_id, today)
-        elif request.user.role == User.Role.AGENT:
-            agent_stats = self._get_agent_stats(request.user.id, today)
+        if with_agent:
+            agent_stats = {
+                "total_captured": stats["agent_total_captured"],
+                "captured_today": stats["agent_captured_today"],
+                "pending": stats["agent_pending"],
+                "rejected": stats["agent_rejected"],
+            }
 
         data = {
             "global_overview": {
-                "total_shops": shop_stats['total_shops'],
-                "active_shops": shop_stats['active_shops'], 
-                "total_agents": total_agents,
-                "pending_reviews": shop_stats['pending_reviews'],
-                "rejected_reviews": shop_stats['rejected_reviews'],
-                "verified_shops": shop_stats['verified_shops'],
-                "total_captured_by_agents": shop_stats['captured_by_agents'],
-                "shops_captured_today": shops_captured_today_global,
+                **{key: stats[key] for key in self.GLOBAL_COUNTERS},
+                "shops_captured_today": stats["shops_captured_today"],
             },
             "agent_performance": agent_stats
         }
 
         return Response(data, status=status.HTTP_200_OK)
-
-    def _get_agent_stats(self, user_id, today):
-        """Helper to aggregate stats for a single agent"""
-        return Shop.objects.filter(created_by_id=user_id).aggregate(
-            total_captured=Count('id'),
-            captured_today=Count('id', filter=Q(date_created__date=today)),
-            pending=Count('id', filter=Q(verification_status=Shop.VerificationStatus.PENDING)),
-            rejected=Count('id', filter=Q(verification_status=Shop.VerificationStatus.REJECTED))
-        )
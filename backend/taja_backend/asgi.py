@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'taja_backend.settings')
 
 application = get_asgi_application()
+
+# Runs jobs queued before a restart, and retries, without waiting for a new enqueue
+from shops.jobs import start_inline_worker  # noqa: E402
+
+start_inline_worker()
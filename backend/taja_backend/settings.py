@@ -16,6 +16,22 @@ load_dotenv(os.path.join(BASE_DIR, ".env"))
 SECRET_KEY = config("SECRET_KEY", default="unsafe-secret-key")
 # OpenCage Geocoding API Key
 OPENCAGE_API_KEY = config("OPENCAGE_API_KEY", default=None)
+# State/LGA boundary polygons (GeoJSON FeatureCollection of LGA features) for offline
+# reverse geocoding; OpenCage is only called for points outside these boundaries.
+# Unset (the default): no offline index, every lookup goes to OpenCage.
+SHOPS_BOUNDARIES_PATH = config("SHOPS_BOUNDARIES_PATH", default=None)
+# Entries kept in each process's in-memory LRU in front of the shared geocode table
+SHOPS_GEOCODE_LRU_SIZE = config("SHOPS_GEOCODE_LRU_SIZE", default=10000, cast=int)
+# Geocode cache cells are coordinates rounded to this many decimal places (4 = ~11m)
+SHOPS_GEOCODE_CELL_PRECISION = config("SHOPS_GEOCODE_CELL_PRECISION", default=4, cast=int)
+# Seconds to remember "no result" / upstream errors before asking OpenCage again
+SHOPS_GEOCODE_NEGATIVE_TTL = config("SHOPS_GEOCODE_NEGATIVE_TTL", default=300, cast=int)
+# Run background jobs (geocoding, photo uploads, ...) in a thread of each web process. Turn off when
+# a separate `python manage.py run_jobs` worker is deployed.
+SHOPS_INLINE_JOB_WORKER = config("SHOPS_INLINE_JOB_WORKER", default=True, cast=bool)
+# Delta sync re-sends changes stamped this many seconds before a sync, so writes whose
+# transaction was still open at the time are not missed; keep it above the longest write
+SHOPS_SYNC_SAFETY_WINDOW = config("SHOPS_SYNC_SAFETY_WINDOW", default=120, cast=int)
 
 DEBUG = config("DEBUG", default=False, cast=bool)
 
@@ -36,6 +52,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "accounts",
     "shops",
     "fancy",
@@ -168,6 +185,26 @@ CLOUDINARY_STORAGE = {
 # else:
 DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 
+# Backend for shop photos (same shape as a STORAGES entry); see shops.storage
+SHOP_PHOTO_STORAGE = {
+    "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
+    "OPTIONS": {},
+}
+# Captured photos wait here until the background worker has uploaded them
+SHOP_PHOTO_STAGING_DIR = config("SHOP_PHOTO_STAGING_DIR", default=os.path.join(BASE_DIR, "photo_staging"))
+# Parallel uploads per job batch
+SHOP_PHOTO_UPLOAD_WORKERS = config("SHOP_PHOTO_UPLOAD_WORKERS", default=4, cast=int)
+# Photos are downscaled to this long side before upload; thumbnails to the second size
+SHOP_PHOTO_MAX_DIMENSION = config("SHOP_PHOTO_MAX_DIMENSION", default=1600, cast=int)
+SHOP_PHOTO_THUMB_DIMENSION = config("SHOP_PHOTO_THUMB_DIMENSION", default=320, cast=int)
+# Streaming upload limits for the shop endpoints (shops.uploads): whole-request cap, and
+# the size after which a photo part is written to a temp file instead of kept in memory
+SHOP_UPLOAD_MAX_REQUEST_BYTES = config("SHOP_UPLOAD_MAX_REQUEST_BYTES", default=12 * 1024 * 1024, cast=int)
+SHOP_UPLOAD_SPILL_BYTES = config("SHOP_UPLOAD_SPILL_BYTES", default=256 * 1024, cast=int)
+# Photos whose perceptual hashes differ in at most this many of 64 bits are flagged
+# as possible duplicates (shops.duplicates)
+SHOP_PHOTO_DUPLICATE_DISTANCE = config("SHOP_PHOTO_DUPLICATE_DISTANCE", default=6, cast=int)
+
 
 # ---------------------------------------------------------------------
 # AUTH / REST
@@ -215,14 +252,24 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = "/media/"
 
 # ---------------------------------------------------------------------
-# CACHE (Optional: You can remove if not using Redis)
+# CACHE (Redis when REDIS_URL is set, so all workers share it)
 # ---------------------------------------------------------------------
 
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+REDIS_URL = config("REDIS_URL", default=None)
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
-}
 
 # ---------------------------------------------------------------------
 # DEFAULTS
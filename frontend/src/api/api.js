@@ -50,4 +50,17 @@ api.interceptors.response.use(
   }
 );
 
+// Cursor-paginated lists return { results, next }: follow `next` until the last page
+export const fetchAllPages = async (url, params = { page_size: 200 }) => {
+  const items = [];
+  let res = await api.get(url, { params });
+  for (;;) {
+    const data = res.data;
+    if (Array.isArray(data)) return data;
+    items.push(...(data?.results || []));
+    if (!data?.next) return items;
+    res = await api.get(data.next);
+  }
+};
+
 export default api;
@@ -4,7 +4,7 @@ import { MapContainer, TileLayer, Marker, Tooltip, useMap } from 'react-leaflet'
 import MarkerClusterGroup from 'react-leaflet-cluster';
 import 'leaflet/dist/leaflet.css';
 import { Store, Zap } from 'lucide-react';
-import api from '../api/api';
+import { fetchAllPages } from '../api/api';
 import { toast } from 'sonner';
 import { subDays } from 'date-fns';
 import L from 'leaflet';
@@ -97,8 +97,7 @@ export default function ShopMap({ filters, mapHeight = '60vh' }) {
     const fetchShops = async () => {
         setLoading(true);
         try {
-            const res = await api.get("/shops/");
-            const shopData = res.data?.results || res.data || [];
+            const shopData = await fetchAllPages("/shops/");
             setRawShops(Array.isArray(shopData) ? shopData : []);
         } catch (err) {
             console.error("Failed to fetch shops:", err);
@@ -1,6 +1,6 @@
 // src/components/ShopTable.jsx
 import React, { useEffect, useState } from "react";
-import api from "../api/api";
+import api, { fetchAllPages } from "../api/api";
 import { toast } from "sonner";
 import {
   MapPin,
@@ -233,8 +233,7 @@ export default function ShopTable({ filters }) {
   const fetchShops = async () => {
     setLoading(true);
     try {
-      const res = await api.get("/shops/");
-      let shopData = res.data?.results || res.data || [];
+      const shopData = await fetchAllPages("/shops/");
       if (Array.isArray(shopData)) {
         setRawShops(shopData);
         setFilteredShops(shopData);
@@ -14,7 +14,7 @@ import {
   XCircle,
 } from "lucide-react";
 
-import api from "../../api/api";
+import api, { fetchAllPages } from "../../api/api";
 import { ShopInfoModal } from "../../components/ShopInfoModal";
 import { ShopCard } from "../../components/ShopCard";
 import { ShopFormModal } from "../../components/ShopFormModal";
@@ -414,9 +414,9 @@ const AgentDashboard = () => {
   const fetchShops = useCallback(async () => {
     setIsShopsLoading(true);
     try {
-      const response = await api.get("/shops/my-shops/");
-      setShops(response.data);
-      toast.success(`Successfully loaded ${response.data.length} shops.`);
+      const shopData = await fetchAllPages("/shops/my-shops/");
+      setShops(shopData);
+      toast.success(`Successfully loaded ${shopData.length} shops.`);
     } catch (error) {
       toast.error("Failed to load shops. Please try again.");
       console.error("Error fetching shops:", error);